@@ -0,0 +1,254 @@
+"""
+Нагрузочный стенд: бот целиком (диспетчер из main.py и start_scheduler)
+против локальных заглушек Telegram Bot API (benchmarks.fake_telegram)
+и маркетплейсов (benchmarks.fake_marketplace) с настраиваемой задержкой.
+
+Стенд создает синтетических пользователей с товарами во временной базе,
+прогоняет несколько циклов планировщика, в которых все пользователи
+проверяются одновременно, и параллельно отправляет боту сообщения
+(/start, /list, ссылки на товары). Сообщает:
+  * время цикла планировщика и число проверенных товаров в секунду;
+  * задержку уведомлений от начала цикла до получения сообщения;
+  * задержку ответа обработчиков (p50/p95/p99) по типам сообщений.
+
+Настройки бота (SCRAPE_CONCURRENCY, HTTP_POOL_SIZE и т.д.) задаются
+переменными окружения, как при обычном запуске.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_load [--users 200] [--items 5] [--products 400] [--cycles 3]
+                                    [--messages 300] [--rate 20] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from benchmarks.fake_marketplace import FakeMarketplace
+from benchmarks.fake_telegram import FakeTelegram, SentMessage
+
+NOTIFICATION_HEADER = "✨ Обновление цен"
+# Доли типов сообщений от пользователей
+MESSAGE_MIX = {"/start": 0.2, "/list": 0.4, "url": 0.3, "text": 0.1}
+
+
+@dataclass
+class Cycle:
+    started: float
+    finished: float
+    users: int
+    urls: int
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def _format_latencies(values: list[float]) -> str:
+    if not values:
+        return "нет данных"
+    return (
+        f"p50 {_percentile(values, 0.5) * 1000:7.0f} мс | p95 {_percentile(values, 0.95) * 1000:7.0f} мс | "
+        f"p99 {_percentile(values, 0.99) * 1000:7.0f} мс | макс {max(values) * 1000:7.0f} мс"
+    )
+
+
+def product_url(index: int) -> tuple[str, str]:
+    """Синтетический товар: четные — Ozon, нечетные — Wildberries."""
+    if index % 2 == 0:
+        return "ozon", f"https://www.ozon.ru/product/{100000 + index}/"
+    return "wb", f"https://www.wildberries.ru/catalog/{200000 + index}/detail.aspx"
+
+
+def _is_reply(method: str):
+    def match(sent: SentMessage) -> bool:
+        return sent.method == method and not (sent.text or "").startswith(NOTIFICATION_HEADER)
+    return match
+
+
+async def interactive_load(telegram: FakeTelegram, user_ids: list[int], args, rnd: random.Random) -> dict[str, list]:
+    """Отправляет сообщения с заданной частотой; у каждого чата не больше одного запроса в работе."""
+    latencies: dict[str, list[float]] = {kind: [] for kind in MESSAGE_MIX}
+    timeouts: dict[str, int] = {kind: 0 for kind in MESSAGE_MIX}
+    busy: set[int] = set()
+    pending = set()
+
+    async def send(user_id: int, kind: str):
+        if kind == "url":
+            _, text = product_url(rnd.randrange(args.products * 2))
+            method = "editMessageText"  # итоговый ответ — правка сообщения "Проверяю ссылку..."
+        else:
+            text = "привет" if kind == "text" else kind
+            method = "sendMessage"
+        started = time.perf_counter()
+        telegram.push_message(user_id, text)
+        reply = await telegram.wait_for_message(user_id, started, args.timeout, _is_reply(method))
+        if reply is None:
+            timeouts[kind] += 1
+        else:
+            latencies[kind].append(reply.at - started)
+        busy.discard(user_id)
+
+    kinds, weights = list(MESSAGE_MIX), list(MESSAGE_MIX.values())
+    for _ in range(args.messages):
+        free = [user_id for user_id in rnd.sample(user_ids, min(len(user_ids), 50)) if user_id not in busy]
+        if free:
+            user_id = free[0]
+            busy.add(user_id)
+            task = asyncio.create_task(send(user_id, rnd.choices(kinds, weights)[0]))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        await asyncio.sleep(1 / args.rate)
+    if pending:
+        await asyncio.gather(*pending)
+    return {"latencies": latencies, "timeouts": timeouts}
+
+
+async def run(args):
+    rnd = random.Random(args.seed)
+    telegram = FakeTelegram(latency=args.telegram_latency, global_limit=args.telegram_global_limit, chat_limit=args.telegram_chat_limit)
+    marketplace = FakeMarketplace(latency=args.latency, seed=args.seed)
+    os.environ.update(
+        TELEGRAM_BOT_TOKEN="123456:LOAD",
+        TELEGRAM_API_URL=await telegram.start(),
+        SELENIUM_FALLBACK="0",
+        OZON_RATE=str(args.marketplace_rate),
+        WB_RATE=str(args.marketplace_rate),
+        **await marketplace.start(),
+    )
+
+    # Модули бота импортируются после настройки окружения: settings читает его при импорте
+    import main as bot_main
+    from bot.sender import get_sender, start_sender, stop_sender
+    from parser.http_fetch import close_http_session
+    from scheduler import tasks
+    from scheduler.due_queue import user_schedule
+    from scheduler.executor import get_executor, start_executor, stop_executor
+    from storage import sqlite_client
+
+    tmp = tempfile.TemporaryDirectory()
+    sqlite_client.DB_FILE = os.path.join(tmp.name, "load.db")
+    await sqlite_client.initialize_db()
+
+    # --- Синтетические пользователи и товары ---
+    user_ids = list(range(1, args.users + 1))
+    products = [product_url(i) for i in range(args.products)]
+    for user_id in user_ids:
+        for market, url in rnd.sample(products, min(args.items, len(products))):
+            target_price = None if rnd.random() < 0.5 else rnd.randint(500, 50000)
+            await sqlite_client.add_item_for_user(user_id, url, None, market, target_price)
+    print(f"Пользователей: {args.users}, подписок: {args.users * args.items}, товаров в пуле: {args.products}")
+
+    # --- Замер циклов планировщика ---
+    cycles: list[Cycle] = []
+    cycle_done: asyncio.Queue = asyncio.Queue()
+    process_due_users = tasks.process_due_users
+
+    async def timed_process_due_users(bot, due_users):
+        started = time.perf_counter()
+        await process_due_users(bot, due_users)
+        urls = {item["url"] for items in due_users.values() for item in items}
+        cycle = Cycle(started, time.perf_counter(), len(due_users), len(urls))
+        cycles.append(cycle)
+        cycle_done.put_nowait(cycle)
+
+    tasks.process_due_users = timed_process_due_users
+
+    # --- Запуск бота так же, как в main.py ---
+    log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with log:
+        start_executor()
+        start_sender()
+        ready = asyncio.Event()
+        bot = bot_main.create_bot()
+        dp = bot_main.create_dispatcher(ready)
+        await bot_main.set_main_menu(bot)
+        await bot.delete_webhook(drop_pending_updates=True)
+        scheduler_task = asyncio.create_task(tasks.start_scheduler(bot, ready))
+        polling_task = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+
+        try:
+            load_task = asyncio.create_task(interactive_load(telegram, user_ids, args, rnd))
+            for n in range(args.cycles):
+                if n:
+                    # Все пользователи снова просрочены: следующий цикл проверяет их одновременно
+                    overdue = datetime.now() - timedelta(days=1)
+                    for user_id in user_ids:
+                        user_schedule.mark_checked(user_id, overdue)
+                await asyncio.wait_for(cycle_done.get(), timeout=args.timeout * 10)
+            load = await load_task
+            executor_stats = get_executor().stats()
+            sender_stats = get_sender().stats()
+        finally:
+            await dp.stop_polling()
+            await polling_task
+            scheduler_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await scheduler_task
+            await stop_executor()
+            await stop_sender()
+            await close_http_session()
+            await sqlite_client.close_db()
+            await bot.session.close()
+            await telegram.stop()
+            await marketplace.stop()
+            tmp.cleanup()
+
+    # --- Отчет ---
+    print(f"Циклы планировщика (задержка маркетплейса ~{args.latency * 1000:.0f} мс):")
+    notification_latencies = []
+    for n, cycle in enumerate(cycles, 1):
+        notifications = [
+            sent.at - cycle.started
+            for sent in telegram.sent
+            if cycle.started <= sent.at <= cycle.finished and (sent.text or "").startswith(NOTIFICATION_HEADER)
+        ]
+        notification_latencies.extend(notifications)
+        duration = cycle.finished - cycle.started
+        print(
+            f"  #{n}: {cycle.users} польз., {cycle.urls} товаров за {duration:6.2f} с "
+            f"({cycle.urls / duration:6.1f} товаров/с), уведомлений {len(notifications)}"
+        )
+    print(f"Задержка уведомлений от начала цикла: {_format_latencies(notification_latencies)}")
+
+    print(f"Обработчики ({args.messages} сообщений, {args.rate:g} в секунду):")
+    all_latencies = []
+    for kind, values in load["latencies"].items():
+        all_latencies.extend(values)
+        timeouts = load["timeouts"][kind]
+        suffix = f" | без ответа {timeouts}" if timeouts else ""
+        print(f"  {kind:<7} n={len(values):<5d} {_format_latencies(values)}{suffix}")
+    print(f"  {'все':<7} n={len(all_latencies):<5d} {_format_latencies(all_latencies)}")
+
+    print(f"Запросы к маркетплейсам: {marketplace.requests}")
+    print(f"Ответов 429 от Bot API: {telegram.flood_errors}")
+    print(f"Очередь проверок: ожидание в среднем {executor_stats['wait_avg'] * 1000:.0f} мс, макс {executor_stats['wait_max'] * 1000:.0f} мс")
+    print(
+        f"Очередь отправки: отправлено {sender_stats['sent']}, повторов {sender_stats['retried']}, ошибок {sender_stats['failed']}, "
+        f"ожидание в среднем {sender_stats['wait_avg'] * 1000:.0f} мс, макс {sender_stats['wait_max'] * 1000:.0f} мс"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--items", type=int, default=5, help="товаров у каждого пользователя")
+    parser.add_argument("--products", type=int, default=400, help="размер общего пула товаров")
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--messages", type=int, default=300, help="сообщений от пользователей за прогон")
+    parser.add_argument("--rate", type=float, default=20, help="сообщений в секунду")
+    parser.add_argument("--latency", type=float, default=0.2, help="средняя задержка маркетплейса, с")
+    parser.add_argument("--marketplace-rate", type=float, default=0, help="лимит запросов к маркетплейсу в секунду (0 — нет)")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="задержка Bot API, с")
+    parser.add_argument("--telegram-global-limit", type=int, default=0, help="лимит Bot API, сообщений в секунду (0 — нет)")
+    parser.add_argument("--telegram-chat-limit", type=int, default=0, help="лимит Bot API на чат, сообщений в секунду (0 — нет)")
+    parser.add_argument("--timeout", type=float, default=60, help="ожидание ответа на одно сообщение, с")
+    parser.add_argument("--seed", type=int, default=16)
+    parser.add_argument("--verbose", action="store_true", help="не скрывать вывод бота")
+    args = parser.parse_args()
+    asyncio.run(run(args))
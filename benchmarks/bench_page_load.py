@@ -0,0 +1,266 @@
+"""
+Бенчмарк политик загрузки страниц в Chrome (PAGE_LOAD_POLICIES).
+
+Для каждой политики запускает отдельный Chrome из DriverPool, открывает
+страницы товаров и ждет тот же элемент, что и get_ozon_price / get_wb_price
+(PAGE_READY). Сообщает по каждому маркетплейсу и политике:
+  * время от driver.get до готовности страницы (p50/p90);
+  * объем переданных данных и число загруженных ресурсов к этому моменту
+    (transferSize из Resource Timing; заблокированные ресурсы в него не попадают);
+  * процессорное время рендерера (TaskDuration из CDP Performance.getMetrics);
+  * на скольких страницах найдена цена.
+
+Ресурсы, которые продолжают загружаться после готовности страницы, не учитываются:
+при проверке цены драйвер сразу переходит к следующей странице и прерывает их.
+
+Страницы — URL товаров из аргументов (нужны Chrome и доступ к сети) или,
+с --local, страницы из benchmarks/fixtures/pages, которые локальный сервер
+отдает вместе с картинками, шрифтом, видео и "счетчиком" с задержкой.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_page_load --local [--iterations 5] [--latency 0.2]
+    python -m benchmarks.bench_page_load URL [URL ...] [--policies normal,eager,settings]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from aiohttp import web
+
+from config import settings
+from parser.driver_pool import DriverPool, PageLoadPolicy
+from parser.price_parser import get_marketplace, parse_ozon_page, parse_wb_page, wait_for_page
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "pages")
+# Страницы для --local: на них есть цена, поэтому PAGE_READY появляется сразу после разбора HTML
+LOCAL_PAGES = {"ozon": "in_stock.html", "wb": "in_stock.html"}
+PARSERS = {"ozon": parse_ozon_page, "wb": parse_wb_page}
+
+POLICIES: dict[str, Callable[[str], PageLoadPolicy]] = {
+    "normal": lambda marketplace: PageLoadPolicy("normal"),
+    "eager": lambda marketplace: PageLoadPolicy("eager"),
+    "eager+img": lambda marketplace: PageLoadPolicy("eager", block_images=True),
+    "eager+img+urls": lambda marketplace: PageLoadPolicy("eager", True, list(settings.PAGE_BLOCKED_URLS)),
+    "none+img+urls": lambda marketplace: PageLoadPolicy("none", True, list(settings.PAGE_BLOCKED_URLS)),
+    # Политика из настроек (переменные окружения OZON_PAGE_LOAD_STRATEGY и т.д.)
+    "settings": PageLoadPolicy.for_marketplace,
+}
+
+# Сумма transferSize документа и всех загруженных ресурсов
+TRANSFER_JS = """
+const entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));
+return [entries.reduce((sum, e) => sum + (e.transferSize || 0), 0), entries.length];
+"""
+
+
+@dataclass
+class PolicyResult:
+    times: list[float] = field(default_factory=list)
+    transfer: list[int] = field(default_factory=list)
+    resources: list[int] = field(default_factory=list)
+    cpu: list[float] = field(default_factory=list)
+    found: int = 0
+    timeouts: int = 0
+
+
+# --- Локальный сервер со "тяжелыми" страницами ---
+
+class HeavyPageServer:
+    """
+    Отдает сохраненные страницы, добавляя в них ресурсы, которые политики
+    должны отсекать: картинки, шрифт, видео и асинхронный скрипт счетчика
+    по пути с mc.yandex.ru (попадает под PAGE_BLOCKED_URLS).
+    Каждый ресурс отдается с задержкой latency.
+    """
+
+    def __init__(self, latency: float, images: int = 20):
+        self.latency = latency
+        self.images = images
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self.base_url = ""
+
+    def _heavy_block(self) -> str:
+        images = "".join(f'<img src="/static/img/{n}.jpg" width="200" height="200">' for n in range(self.images))
+        return (
+            '<link rel="stylesheet" href="/static/fonts.css">'
+            f'<div style="font-family: BenchFont">{images}</div>'
+            '<video src="/static/promo.mp4" autoplay muted></video>'
+            '<script async src="/mc.yandex.ru/metrika/tag.js"></script>'
+        )
+
+    async def _page(self, request: web.Request) -> web.Response:
+        path = os.path.join(FIXTURES_DIR, request.match_info["marketplace"], request.match_info["name"])
+        if not os.path.exists(path):
+            raise web.HTTPNotFound()
+        with open(path, encoding="utf-8") as f:
+            page = f.read()
+        page = page.replace("</body>", self._heavy_block() + "</body>", 1)
+        return web.Response(text=page, content_type="text/html")
+
+    async def _resource(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency)
+        name = request.match_info["name"]
+        if name == "fonts.css":
+            css = "@font-face { font-family: BenchFont; src: url(/static/font.woff2) format('woff2'); }"
+            return web.Response(text=css, content_type="text/css")
+        sizes = {".jpg": ("image/jpeg", 50 * 1024), ".woff2": ("font/woff2", 100 * 1024), ".mp4": ("video/mp4", 500 * 1024)}
+        content_type, size = sizes.get(os.path.splitext(name)[1], ("application/octet-stream", 1024))
+        return web.Response(body=os.urandom(size), content_type=content_type)
+
+    async def _counter(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency * 3)
+        return web.Response(text="window.benchCounter = 1;", content_type="application/javascript")
+
+    async def _start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/pages/{marketplace}/{name}", self._page)
+        app.router.add_get("/static/{name:.+}", self._resource)
+        app.router.add_get("/mc.yandex.ru/{name:.+}", self._counter)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        return f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    def start(self) -> str:
+        """Запускает сервер в отдельном потоке (Selenium работает синхронно)."""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self.base_url = asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self.base_url
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+
+# --- Замер ---
+
+def _task_duration(driver) -> float:
+    metrics = driver.execute_cdp_cmd("Performance.getMetrics", {})["metrics"]
+    return next((m["value"] for m in metrics if m["name"] == "TaskDuration"), 0.0)
+
+
+def measure_page(driver, marketplace: str, url: str, timeout: float, result: PolicyResult):
+    from selenium.common.exceptions import TimeoutException
+
+    # Пустая страница между замерами: счетчики Resource Timing начинаются заново
+    driver.get("about:blank")
+    cpu_before = _task_duration(driver)
+    started = time.perf_counter()
+    driver.get(url)
+    try:
+        wait_for_page(driver, marketplace, timeout)
+    except TimeoutException:
+        result.timeouts += 1
+        return
+    result.times.append(time.perf_counter() - started)
+
+    transfer, resources = driver.execute_script(TRANSFER_JS)
+    result.transfer.append(transfer)
+    result.resources.append(resources)
+    cpu_after = _task_duration(driver)
+    # При переходе на другой сайт Chrome может сменить процесс рендерера, тогда счетчик начинается с нуля
+    result.cpu.append(cpu_after - cpu_before if cpu_after >= cpu_before else cpu_after)
+    price = PARSERS[marketplace](driver.page_source)[0]
+    result.found += price is not None
+
+
+def run_policy(driver_path: str, policy: PageLoadPolicy, pages: list[tuple[str, str]], marketplace: str, iterations: int) -> PolicyResult:
+    result = PolicyResult()
+    pool = DriverPool(1, 10 ** 6, driver_path, policy)
+    try:
+        with pool.driver() as driver:
+            driver.execute_cdp_cmd("Performance.enable", {})
+            # По умолчанию Resource Timing хранит только 250 записей
+            driver.execute_cdp_cmd(
+                "Page.addScriptToEvaluateOnNewDocument",
+                {"source": "performance.setResourceTimingBufferSize(100000)"},
+            )
+            for _ in range(iterations):
+                for page_marketplace, url in pages:
+                    if page_marketplace == marketplace:
+                        measure_page(driver, marketplace, url, policy.wait_timeout, result)
+    finally:
+        pool.shutdown()
+    return result
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def report(marketplace: str, results: dict[str, PolicyResult]):
+    print(f"{marketplace}: время до готовности | передано | ресурсов | CPU рендерера | цена найдена")
+    baseline = results.get("normal")
+    for name, result in results.items():
+        if not result.times:
+            print(f"  {name:<15} нет успешных загрузок (таймаутов: {result.timeouts})")
+            continue
+        p50 = _percentile(result.times, 0.5)
+        speedup = f" (x{_percentile(baseline.times, 0.5) / p50:.1f})" if baseline and baseline.times and name != "normal" else ""
+        total = len(result.times) + result.timeouts
+        suffix = f" | таймаутов {result.timeouts}" if result.timeouts else ""
+        print(
+            f"  {name:<15} p50 {p50 * 1000:6.0f} мс{speedup:<7} p90 {_percentile(result.times, 0.9) * 1000:6.0f} мс | "
+            f"{statistics.mean(result.transfer) / 1024:7.0f} КБ | {statistics.mean(result.resources):5.0f} | "
+            f"{statistics.mean(result.cpu) * 1000:6.0f} мс | {result.found}/{total}{suffix}"
+        )
+
+
+def main(args):
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    server = None
+    if args.local:
+        server = HeavyPageServer(args.latency)
+        base_url = server.start()
+        pages = [(marketplace, f"{base_url}/pages/{marketplace}/{name}") for marketplace, name in LOCAL_PAGES.items()]
+    else:
+        pages = [(get_marketplace(url), url) for url in args.urls]
+        unknown = [url for marketplace, url in pages if marketplace is None]
+        if unknown:
+            raise SystemExit(f"Сайт не поддерживается: {', '.join(unknown)}")
+    if not pages:
+        raise SystemExit("Укажите URL товаров или --local")
+
+    policies = [name.strip() for name in args.policies.split(",") if name.strip()]
+    unknown = [name for name in policies if name not in POLICIES]
+    if unknown:
+        raise SystemExit(f"Неизвестные политики: {', '.join(unknown)}; доступны: {', '.join(POLICIES)}")
+
+    driver_path = ChromeDriverManager().install()
+    try:
+        for marketplace in dict.fromkeys(marketplace for marketplace, _ in pages):
+            results = {}
+            for name in policies:
+                policy = POLICIES[name](marketplace)
+                results[name] = run_policy(driver_path, policy, pages, marketplace, args.iterations)
+            report(marketplace, results)
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("urls", nargs="*", help="URL товаров Ozon и Wildberries")
+    parser.add_argument("--local", action="store_true", help="страницы из fixtures через локальный сервер")
+    parser.add_argument("--iterations", type=int, default=5, help="загрузок каждой страницы на политику")
+    parser.add_argument("--latency", type=float, default=0.2, help="задержка ресурсов локального сервера, с")
+    parser.add_argument("--policies", default=",".join(POLICIES), help=f"через запятую: {', '.join(POLICIES)}")
+    main(parser.parse_args())
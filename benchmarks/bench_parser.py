@@ -0,0 +1,196 @@
+"""
+Офлайн-бенчмарк разбора страниц Ozon и Wildberries.
+
+Прогоняет parse_ozon_page / parse_wb_page (та же логика, что в get_ozon_price /
+get_wb_price после загрузки страницы) по сохраненным HTML-страницам без браузера
+и сети. Сообщает:
+  * расхождения с ожидаемыми результатами из manifest.json;
+  * пропускную способность (страниц в секунду) по каждому маркетплейсу;
+  * долю страниц, на которых срабатывает каждый селектор, и какой селектор цены выигрывает;
+  * память на один разбор: пик Python-объектов (tracemalloc) и размер дерева lxml (по RSS).
+
+Набор страниц: benchmarks/fixtures/pages/<маркетплейс>/*.html, ожидаемые
+результаты в manifest.json. Можно указать свой каталог с той же структурой;
+страницы без записи в manifest.json проверяются только по скорости и селекторам.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_parser [--iterations 50] [--fixtures DIR]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+from parser.extraction import Extractor
+from parser.price_parser import OZON_EXTRACTOR, WB_EXTRACTOR, parse_ozon_page, parse_wb_page
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "pages")
+
+PARSERS = {"ozon": parse_ozon_page, "wb": parse_wb_page}
+EXTRACTORS = {"ozon": OZON_EXTRACTOR, "wb": WB_EXTRACTOR}
+SELECTOR_GROUPS = ("name", "price", "promo_price", "promo_timer", "sold_out")
+
+
+@dataclass
+class Page:
+    file: str
+    marketplace: str
+    html: str
+    expected: Optional[dict] = None
+
+
+def load_pages(fixtures_dir: str) -> list[Page]:
+    manifest = {}
+    manifest_path = os.path.join(fixtures_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = {entry["file"]: entry["expected"] for entry in json.load(f)}
+
+    pages = []
+    for marketplace in PARSERS:
+        directory = os.path.join(fixtures_dir, marketplace)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".html"):
+                continue
+            file = f"{marketplace}/{name}"
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                pages.append(Page(file, marketplace, f.read(), manifest.get(file)))
+    return pages
+
+
+def parse(page: Page) -> dict:
+    """Приводит результат parse_*_page к общему виду для сравнения с manifest.json."""
+    result = PARSERS[page.marketplace](page.html)
+    price, name = result[0], result[1]
+    promo = result[2] if page.marketplace == "wb" else None
+    return {"price": price, "name": name, "promo": promo}
+
+
+def check_expected(pages: list[Page]) -> int:
+    failures = 0
+    for page in pages:
+        if page.expected is None:
+            continue
+        actual = parse(page)
+        if actual != page.expected:
+            failures += 1
+            print(f"  ❌ {page.file}: ожидалось {page.expected}, получено {actual}")
+    checked = sum(1 for page in pages if page.expected is not None)
+    print(f"Проверено по manifest.json: {checked - failures}/{checked} страниц совпало")
+    return failures
+
+
+def measure_throughput(pages: list[Page], iterations: int):
+    print(f"Пропускная способность ({iterations} проходов):")
+    for marketplace in PARSERS:
+        subset = [page for page in pages if page.marketplace == marketplace]
+        if not subset:
+            continue
+        timings = []
+        for _ in range(iterations):
+            for page in subset:
+                start = time.perf_counter()
+                PARSERS[marketplace](page.html)
+                timings.append(time.perf_counter() - start)
+        timings.sort()
+        kb = statistics.mean(len(page.html.encode()) for page in subset) / 1024
+        print(
+            f"  {marketplace:<5} {len(timings) / sum(timings):8.0f} стр/с | "
+            f"p50 {timings[len(timings) // 2] * 1000:6.2f} мс | p99 {timings[int(len(timings) * 0.99) - 1] * 1000:6.2f} мс | "
+            f"страница ~{kb:.0f} КБ"
+        )
+
+
+def selector_hits(extractor: Extractor, page: Page) -> dict[tuple[str, str], bool]:
+    """Для каждого селектора отдельно проверяет, находит ли он непустой элемент на странице."""
+    from lxml import html as lxml_html
+
+    tree = lxml_html.fromstring(page.html)
+    hits = {}
+    for group in SELECTOR_GROUPS:
+        marker = extractor.price_marker if group == "price" else None
+        for selector, xpath in getattr(extractor, group):
+            hits[(group, selector)] = extractor._first(tree, [(selector, xpath)], marker)[0] is not None
+    return hits
+
+
+def report_selectors(pages: list[Page]):
+    for marketplace, extractor in EXTRACTORS.items():
+        subset = [page for page in pages if page.marketplace == marketplace]
+        if not subset:
+            continue
+        hits = Counter()
+        winners = Counter()
+        for page in subset:
+            for key, hit in selector_hits(extractor, page).items():
+                hits[key] += hit
+            winners[extractor.extract(page.html).price_selector] += 1
+
+        print(f"Селекторы {marketplace} ({len(subset)} страниц): срабатывания | выигрыш цены")
+        for group in SELECTOR_GROUPS:
+            for selector, _ in getattr(extractor, group):
+                won = f"{winners[selector]:3d}" if group == "price" else "   "
+                short = selector if len(selector) <= 70 else selector[:67] + "..."
+                print(f"  {group:<12} {hits[(group, selector)]:3d}/{len(subset):<3d} | {won} | {short}")
+        if winners[None]:
+            print(f"  ни один селектор цены не сработал на {winners[None]} страницах")
+
+
+def _rss() -> Optional[int]:
+    """Текущий RSS процесса в байтах (только Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def measure_memory(pages: list[Page], copies: int = 50):
+    from lxml import html as lxml_html
+
+    peaks = []
+    for page in pages:
+        tracemalloc.start()
+        PARSERS[page.marketplace](page.html)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    print("Память на разбор:")
+    print(f"  Python-объекты (пик tracemalloc): среднее {statistics.mean(peaks) / 1024:.0f} КБ, макс {max(peaks) / 1024:.0f} КБ")
+
+    # Дерево lxml живет в памяти libxml2, tracemalloc его не видит: считаем по приросту RSS
+    before = _rss()
+    if before is None:
+        return
+    trees = [lxml_html.fromstring(page.html) for page in pages for _ in range(copies)]
+    per_tree = (_rss() - before) / len(trees)
+    print(f"  дерево lxml (прирост RSS): ~{per_tree / 1024:.0f} КБ на страницу")
+    del trees
+
+
+def run(fixtures_dir: str, iterations: int) -> int:
+    pages = load_pages(fixtures_dir)
+    if not pages:
+        print(f"Нет страниц в {fixtures_dir}")
+        return 1
+    print(f"Страниц: {len(pages)} ({', '.join(f'{m}: {sum(p.marketplace == m for p in pages)}' for m in PARSERS)})")
+
+    failures = check_expected(pages)
+    measure_throughput(pages, iterations)
+    report_selectors(pages)
+    measure_memory(pages)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    args = parser.parse_args()
+    raise SystemExit(run(args.fixtures, args.iterations))
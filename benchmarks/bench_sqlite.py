@@ -0,0 +1,93 @@
+"""
+Бенчмарк задержки операций storage.sqlite_client.
+
+Сравнивает прежний режим (новое соединение aiosqlite на каждую операцию,
+настройки SQLite по умолчанию) с общим настроенным соединением
+и отложенной записью истории цен.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_sqlite [--ops 2000]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+import aiosqlite
+
+from storage import sqlite_client
+
+
+async def _legacy_add_price_history(url: str, price: float):
+    async with aiosqlite.connect(sqlite_client.DB_FILE) as db:
+        await db.execute("INSERT OR IGNORE INTO products (url) VALUES (?)", (url,))
+        await db.execute(
+            "INSERT INTO price_history (product_id, price, checked_at) SELECT id, ?, ? FROM products WHERE url = ?",
+            (price, datetime.datetime.now(), url)
+        )
+        await db.commit()
+
+
+async def _legacy_update_user_last_check(user_id: int):
+    now = datetime.datetime.now()
+    async with aiosqlite.connect(sqlite_client.DB_FILE) as db:
+        cursor = await db.execute("SELECT 1 FROM user_settings WHERE user_id = ?", (user_id,))
+        if await cursor.fetchone():
+            await db.execute("UPDATE user_settings SET last_check = ? WHERE user_id = ?", (now, user_id))
+        else:
+            await db.execute("INSERT INTO user_settings (user_id, last_check) VALUES (?, ?)", (user_id, now))
+        await db.commit()
+
+
+async def _legacy_get_user_check_interval(user_id: int):
+    async with aiosqlite.connect(sqlite_client.DB_FILE) as db:
+        cursor = await db.execute("SELECT check_interval FROM user_settings WHERE user_id = ?", (user_id,))
+        return await cursor.fetchone()
+
+
+async def _measure(name: str, func, ops: int) -> list[float]:
+    timings = []
+    for i in range(ops):
+        start = time.perf_counter()
+        await func(i)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    print(
+        f"  {name:<28} avg {statistics.mean(timings):8.0f} мкс | "
+        f"p50 {timings[len(timings) // 2]:8.0f} мкс | p99 {timings[int(len(timings) * 0.99) - 1]:8.0f} мкс"
+    )
+    return timings
+
+
+async def run(ops: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        # Прежний режим: отдельный файл с журналом по умолчанию (DELETE)
+        sqlite_client.DB_FILE = os.path.join(tmp, "legacy.db")
+        await sqlite_client.initialize_db()
+        await sqlite_client.close_db()
+        async with aiosqlite.connect(sqlite_client.DB_FILE) as db:
+            await db.execute("PRAGMA journal_mode=DELETE")
+
+        print(f"Соединение на каждую операцию ({ops} операций):")
+        await _measure("add_price_history", lambda i: _legacy_add_price_history(f"https://www.ozon.ru/product/{i % 100}/", 1000.0 + i), ops)
+        await _measure("update_user_last_check", lambda i: _legacy_update_user_last_check(i % 500), ops)
+        await _measure("get_user_check_interval", lambda i: _legacy_get_user_check_interval(i % 500), ops)
+
+        sqlite_client.DB_FILE = os.path.join(tmp, "tuned.db")
+        await sqlite_client.initialize_db()
+
+        print(f"Общее соединение и отложенная запись ({ops} операций):")
+        await _measure("add_price_history", lambda i: sqlite_client.add_price_history(f"https://www.ozon.ru/product/{i % 100}/", 1000.0 + i), ops)
+        await _measure("update_user_last_check", lambda i: sqlite_client.update_user_last_check(i % 500), ops)
+        await _measure("get_user_check_interval", lambda i: sqlite_client.get_user_check_interval(i % 500), ops)
+        await sqlite_client.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.ops))
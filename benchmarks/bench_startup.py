@@ -0,0 +1,131 @@
+"""
+Бенчмарк запуска бота.
+
+Измеряет:
+  * время импорта main (медиана нескольких запусков) и самые тяжелые модули по -X importtime;
+  * время от запуска процесса main.py до первого запроса getUpdates и до ответа
+    на первое сообщение /start. Бот работает с локальным сервером Bot API
+    (benchmarks.fake_telegram) и временной базой, Chrome не запускается.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_startup [--runs 5] [--top 10]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_telegram import FakeTelegram
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHAT_ID = 1000
+
+
+def measure_import(runs: int) -> list[float]:
+    timings = []
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+        timings.append(float(out.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def heaviest_imports(top: int) -> list[tuple[str, int]]:
+    """Самые тяжелые пакеты верхнего уровня (суммарное время в мкс) по выводу -X importtime."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, capture_output=True, text=True, check=True)
+    packages: dict[str, int] = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        root = name.strip().split(".")[0]
+        # Берем запись верхнего уровня пакета: она включает время вложенных модулей
+        if name.strip() == root and root != "main":
+            packages[root] = max(packages.get(root, 0), int(cumulative))
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+async def measure_first_update(timeout: float) -> dict:
+    telegram = FakeTelegram()
+    api_url = await telegram.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            TELEGRAM_BOT_TOKEN="123456:TEST",
+            TELEGRAM_API_URL=api_url,
+            SELENIUM_FALLBACK="0",
+            PYTHONPATH=ROOT,
+            PYTHONUNBUFFERED="1",
+        )
+        started = time.perf_counter()
+        # Рабочий каталог — временный: там создается база ozon.db
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, "main.py"),
+            cwd=tmp, env=env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+        )
+        scheduler_at = None
+
+        async def read_output():
+            nonlocal scheduler_at
+            async for line in process.stdout:
+                if scheduler_at is None and "Планировщик запущен" in line.decode(errors="replace"):
+                    scheduler_at = time.perf_counter()
+
+        reader = asyncio.create_task(read_output())
+        try:
+            while telegram.first_poll_at is None:
+                if process.returncode is not None or time.perf_counter() - started > timeout:
+                    raise RuntimeError("Бот не начал опрашивать обновления")
+                await asyncio.sleep(0.01)
+            pushed_at = time.perf_counter()
+            telegram.push_message(CHAT_ID, "/start")
+            reply = await telegram.wait_for_message(CHAT_ID, pushed_at, timeout)
+            if reply is None:
+                raise RuntimeError("Бот не ответил на /start")
+            # Даем планировщику время на сигнал готовности
+            await asyncio.sleep(0.2)
+        finally:
+            process.terminate()
+            await process.wait()
+            reader.cancel()
+            await telegram.stop()
+
+    return {
+        "first_poll": telegram.first_poll_at - started,
+        "first_reply": reply.at - started,
+        "reply_latency": reply.at - pushed_at,
+        "scheduler": scheduler_at - started if scheduler_at else None,
+    }
+
+
+async def run(runs: int, top: int, timeout: float):
+    timings = measure_import(runs)
+    print(f"Импорт main ({runs} запусков): медиана {statistics.median(timings) * 1000:.0f} мс, "
+          f"мин {min(timings) * 1000:.0f} мс, макс {max(timings) * 1000:.0f} мс")
+    print("Самые тяжелые пакеты при импорте:")
+    for name, cumulative in heaviest_imports(top):
+        print(f"  {name:<24} {cumulative / 1000:8.1f} мс")
+
+    results = [await measure_first_update(timeout) for _ in range(runs)]
+    print(f"Запуск main.py до первого обновления ({runs} запусков, медиана):")
+    print(f"  первый getUpdates        {statistics.median(r['first_poll'] for r in results) * 1000:8.0f} мс")
+    print(f"  ответ на первый /start   {statistics.median(r['first_reply'] for r in results) * 1000:8.0f} мс")
+    print(f"  из них обработка /start  {statistics.median(r['reply_latency'] for r in results) * 1000:8.0f} мс")
+    scheduler = [r["scheduler"] for r in results if r["scheduler"] is not None]
+    if scheduler:
+        print(f"  запуск планировщика      {statistics.median(scheduler) * 1000:8.0f} мс")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+    asyncio.run(run(args.runs, args.top, args.timeout))
@@ -0,0 +1,101 @@
+"""
+Локальный сервер, имитирующий API карточек Wildberries и page JSON API Ozon.
+
+Бот подключается к нему через WB_CARD_API_URL и OZON_API_URL. Для каждого
+артикула цена меняется случайным образом от запроса к запросу, часть товаров
+отдается как закончившиеся. Ozon отвечает то JSON, то HTML-страницей со
+встроенным состоянием виджетов (как при блокировке API), чтобы проверять
+оба пути разбора.
+"""
+import asyncio
+import html
+import json
+import random
+import re
+from typing import Optional
+
+from aiohttp import web
+
+OZON_SKU_RE = re.compile(r"/product/(?:[^/]*-)?(\d+)")
+
+
+class FakeMarketplace:
+    def __init__(self, latency: float = 0.0, sold_out_ratio: float = 0.05, seed: int = 0):
+        # Средняя задержка ответа (секунды), фактическая — от 0.5 до 1.5 от нее
+        self.latency = latency
+        self.sold_out_ratio = sold_out_ratio
+        self.requests = {"wb": 0, "ozon": 0}
+        self._random = random.Random(seed)
+        self._prices: dict[str, float] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    def _next_price(self, sku: str) -> Optional[float]:
+        """Случайное блуждание цены артикула; None — товар закончился."""
+        rnd = random.Random(sku)
+        if rnd.random() < self.sold_out_ratio:
+            return None
+        price = self._prices.get(sku) or rnd.randint(500, 50000)
+        price = max(100.0, round(price * self._random.uniform(0.9, 1.1)))
+        self._prices[sku] = price
+        return price
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency * self._random.uniform(0.5, 1.5))
+
+    async def _wb_card(self, request: web.Request) -> web.Response:
+        self.requests["wb"] += 1
+        await self._delay()
+        sku = request.query.get("nm", "")
+        price = self._next_price(sku)
+        product = {"id": int(sku or 0), "name": f"Товар WB {sku}", "totalQuantity": 0 if price is None else 10, "sizes": []}
+        if price is not None:
+            product["sizes"].append({"name": "", "price": {"basic": int(price * 150), "product": int(price * 100)}})
+        return web.json_response({"data": {"products": [product]}})
+
+    async def _ozon_page(self, request: web.Request) -> web.Response:
+        self.requests["ozon"] += 1
+        await self._delay()
+        match = OZON_SKU_RE.search(request.query.get("url", ""))
+        if not match:
+            return web.Response(status=404)
+        sku = match.group(1)
+        price = self._next_price(sku)
+
+        states = {"webProductHeading-3385933-default-1": {"title": f"Товар Ozon {sku}"}}
+        if price is None:
+            states["webOutOfStock-3385939-default-1"] = {"title": "Этот товар закончился"}
+        else:
+            states["webPrice-3121879-default-1"] = {
+                "isAvailable": True,
+                "cardPrice": f"{int(price * 0.95):,} ₽".replace(",", " "),
+                "price": f"{int(price):,} ₽".replace(",", " "),
+            }
+
+        if int(sku) % 2 == 0:
+            return web.json_response({"widgetStates": {key: json.dumps(value, ensure_ascii=False) for key, value in states.items()}})
+        widgets = "\n".join(
+            f"""<div id="state-{key}" data-state='{html.escape(json.dumps(value, ensure_ascii=False))}'></div>"""
+            for key, value in states.items()
+        )
+        return web.Response(text=f"<html><body><div id=\"layoutPage\">{widgets}</div></body></html>", content_type="text/html")
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> dict[str, str]:
+        """Запускает сервер и возвращает адреса для WB_CARD_API_URL и OZON_API_URL."""
+        app = web.Application()
+        app.router.add_get("/wb/cards/detail", self._wb_card)
+        app.router.add_get("/ozon/api/page/json", self._ozon_page)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return {
+            "WB_CARD_API_URL": f"http://{host}:{port}/wb/cards/detail",
+            "OZON_API_URL": f"http://{host}:{port}/ozon/api/page/json",
+        }
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
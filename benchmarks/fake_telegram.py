@@ -0,0 +1,205 @@
+"""
+Локальный сервер, имитирующий Telegram Bot API, для бенчмарков.
+
+Бот подключается к нему через TELEGRAM_API_URL. Сервер отдает обновления,
+добавленные через push_message/push_callback, и запоминает все отправленные
+ботом сообщения со временем получения.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from aiohttp import web
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Price Checker", "username": "price_checker_bot"}
+# Методы, которые создают или меняют сообщение
+MESSAGE_METHODS = {"sendMessage", "editMessageText", "sendPhoto"}
+
+
+@dataclass
+class SentMessage:
+    method: str
+    chat_id: int
+    text: Optional[str]
+    at: float
+    params: dict = field(default_factory=dict)
+
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.0, global_limit: int = 0, chat_limit: int = 0):
+        # Искусственная задержка ответа на каждый запрос бота (секунды)
+        self.latency = latency
+        # Лимиты сообщений в секунду (0 — без лимита); сверх лимита — ответ 429 с retry_after
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.flood_errors = 0
+        self._recent: deque[float] = deque()
+        self._recent_by_chat: dict[int, deque[float]] = {}
+        self.sent: list[SentMessage] = []
+        self._sent_by_chat: dict[int, list[SentMessage]] = {}
+        self.requests: dict[str, int] = {}
+        self.first_poll_at: Optional[float] = None
+        self._updates: list[dict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._new_update = asyncio.Event()
+        self._new_message = asyncio.Event()
+        self._runner: Optional[web.AppRunner] = None
+
+    # --- Обновления для бота ---
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def _push(self, update: dict) -> int:
+        update_id = next(self._update_ids)
+        update["update_id"] = update_id
+        self._updates.append(update)
+        self._new_update.set()
+        return update_id
+
+    def push_message(self, user_id: int, text: str) -> int:
+        """Добавляет входящее текстовое сообщение от пользователя."""
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return self._push({"message": message})
+
+    def push_callback(self, user_id: int, data: str, message_id: int = 1) -> int:
+        """Добавляет нажатие на inline-кнопку."""
+        return self._push({
+            "callback_query": {
+                "id": str(next(self._message_ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "menu",
+                },
+            }
+        })
+
+    async def wait_for_message(
+        self,
+        chat_id: int,
+        since: float,
+        timeout: float,
+        match: Optional[Callable[[SentMessage], bool]] = None,
+    ) -> Optional[SentMessage]:
+        """Ждет первое сообщение в чат chat_id после момента since (и подходящее под match)."""
+        deadline = time.perf_counter() + timeout
+        while True:
+            for sent in self._sent_by_chat.get(chat_id, ()):
+                if sent.at >= since and (match is None or match(sent)):
+                    return sent
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            self._new_message.clear()
+            try:
+                await asyncio.wait_for(self._new_message.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return None
+
+    # --- HTTP ---
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        if self.first_poll_at is None:
+            self.first_poll_at = time.perf_counter()
+        offset = int(params.get("offset") or 0)
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout=float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:int(params.get("limit") or 100)]
+
+    def _flooded(self, chat_id: int) -> bool:
+        """Учитывает сообщение в скользящем окне 1 с; True — лимит превышен."""
+        now = time.perf_counter()
+        chat_recent = self._recent_by_chat.setdefault(chat_id, deque())
+        for recent in (self._recent, chat_recent):
+            while recent and now - recent[0] > 1:
+                recent.popleft()
+        if (self.global_limit and len(self._recent) >= self.global_limit) or (self.chat_limit and len(chat_recent) >= self.chat_limit):
+            self.flood_errors += 1
+            return True
+        self._recent.append(now)
+        chat_recent.append(now)
+        return False
+
+    def _message_result(self, method: str, params: dict) -> dict:
+        chat_id = int(params["chat_id"])
+        text = params.get("text") or params.get("caption")
+        sent = SentMessage(method, chat_id, text, time.perf_counter(), params)
+        self.sent.append(sent)
+        self._sent_by_chat.setdefault(chat_id, []).append(sent)
+        self._new_message.set()
+        message_id = int(params["message_id"]) if "message_id" in params else next(self._message_ids)
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": text or "",
+        }
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.requests[method] = self.requests.get(method, 0) + 1
+        params = {key: value for key, value in (await request.post()).items() if isinstance(value, str)}
+        if self.latency and method != "getUpdates":
+            await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "getUpdates":
+            result = await self._get_updates(params)
+        elif method == "deleteWebhook":
+            if params.get("drop_pending_updates") == "true":
+                self._updates.clear()
+            result = True
+        elif method in MESSAGE_METHODS:
+            if self._flooded(int(params["chat_id"])):
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                })
+            result = self._message_result(method, params)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result}, dumps=json.dumps)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер и возвращает адрес для TELEGRAM_API_URL."""
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
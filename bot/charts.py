@@ -0,0 +1,84 @@
+import asyncio
+import datetime
+import io
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from config import settings
+
+_pool: Optional[ProcessPoolExecutor] = None
+# (url, время последней точки) -> PNG
+_cache: "OrderedDict[tuple[str, str], bytes]" = OrderedDict()
+
+
+def _render_png(dates: list[datetime.datetime], prices: list[float]) -> bytes:
+    """Строит график в отдельном процессе через объектный API Figure (без глобального состояния pyplot)."""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.plot(dates, prices, marker='o', linestyle='-', color='b')
+    ax.set_title("История изменения цены")
+    ax.set_xlabel("Дата")
+    ax.set_ylabel("Цена (₽)")
+    ax.grid(True)
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+def _parse_checked_at(checked_at) -> datetime.datetime:
+    if not isinstance(checked_at, str):
+        return checked_at
+    # Парсим дату, если она пришла строкой из SQLite
+    try:
+        return datetime.datetime.fromisoformat(checked_at)
+    except ValueError:
+        # Fallback для форматов, если fromisoformat не сработал
+        return datetime.datetime.strptime(checked_at, "%Y-%m-%d %H:%M:%S.%f")
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: дочерний процесс не наследует потоки бота (aiosqlite, Selenium)
+        _pool = ProcessPoolExecutor(max_workers=settings.CHART_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def render_history_chart(url: str, history: list[tuple]) -> bytes:
+    """
+    Возвращает PNG с графиком истории цен. history отсортирован DESC (сначала новые).
+    Картинка кэшируется по (товар, время последней точки), поэтому повторные
+    нажатия на ту же кнопку не перерисовывают график.
+    """
+    key = (url, str(history[0][0]))
+    png = _cache.get(key)
+    if png is not None:
+        _cache.move_to_end(key)
+        return png
+
+    # Для графика нужен хронологический порядок
+    dates = [_parse_checked_at(checked_at) for checked_at, _ in reversed(history)]
+    prices = [price for _, price in reversed(history)]
+
+    loop = asyncio.get_running_loop()
+    png = await loop.run_in_executor(_get_pool(), _render_png, dates, prices)
+
+    _cache[key] = png
+    while len(_cache) > settings.CHART_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return png
+
+
+def shutdown_chart_pool():
+    """Останавливает процессы отрисовки графиков."""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
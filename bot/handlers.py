@@ -3,44 +3,41 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, Buffered
 from aiogram.filters import CommandStart, Command
 from aiogram.filters.callback_data import CallbackData
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from tabulate import tabulate
+from dataclasses import dataclass
+from typing import Optional
 from urllib.parse import urlparse
+import asyncio
 import html
 import re
-import matplotlib
-matplotlib.use('Agg')  # Устанавливаем backend без GUI
-import matplotlib.pyplot as plt
-import io
-import datetime
+import time
 
+from bot.charts import render_history_chart
+from bot.sender import answer, answer_photo, edit_text, get_sender
 from config import settings
-from storage.sqlite_client import add_item_for_user, get_urls_for_user, remove_item_by_rowid, get_users_statistics, set_user_check_interval, get_user_check_interval, get_url_by_rowid, get_price_history
-from parser.price_parser import get_price
+from storage.sqlite_client import add_item_for_user, get_urls_for_user, remove_subscription, get_users_statistics, set_user_check_interval, get_user_check_interval, get_url_by_subscription, get_price_history
+from parser.governor import governor_stats
+from parser.selector_stats import selector_stats
+from parser.url_canon import SUPPORTED_HOSTS, resolve_product_url
+from scheduler.due_queue import user_schedule
+from scheduler.executor import PRIORITY_INTERACTIVE, get_executor
+from scheduler.fetcher import fetch_price
+from storage.notify_state import notify_state
+from storage.price_cache import CachedPrice, price_cache
 
 # Создаем роутер для обработчиков
 router = Router()
 
-SUPPORTED_HOSTS = {
-    "ozon.ru": "ozon_items",
-    "www.ozon.ru": "ozon_items",
-    "m.ozon.ru": "ozon_items",
-    "wildberries.ru": "wb_items",
-    "www.wildberries.ru": "wb_items",
-    "m.wildberries.ru": "wb_items",
-}
-
 class DeleteCallback(CallbackData, prefix="del"):
-    table: str
-    rowid: int
+    subscription_id: int
 
 class HistoryCallback(CallbackData, prefix="hist"):
-    table: str
-    rowid: int
+    subscription_id: int
 
 @router.message(CommandStart())
 async def cmd_start(message: Message):
     """Обработчик команды /start."""
-    await message.answer(
+    await answer(
+        message,
         "👋 Привет! Я бот для отслеживания цен на Ozon и Wildberries.\n\n"
         "Просто отправь мне ссылку на товар, и я буду проверять цену каждые 10 минут.\n"
         "Вы также можете указать желаемую цену, и я уведомлю вас, когда цена станет ниже или равна ей.\n"
@@ -58,9 +55,11 @@ async def cmd_summary(message: Message):
     if message.from_user.id != 1608118454:
         return
 
+    from tabulate import tabulate
+
     stats = await get_users_statistics()
     if not stats:
-        await message.answer("Нет данных для отображения.")
+        await answer(message, "Нет данных для отображения.")
         return
 
     headers = ["ID", "Кол-во", "Дата"]
@@ -69,7 +68,41 @@ async def cmd_summary(message: Message):
         date_str = str(last_added).split('.')[0] if last_added else "-"
         table_data.append([user_id, count, date_str])
 
-    await message.answer(f"<pre>{tabulate(table_data, headers, tablefmt='plain')}</pre>", parse_mode="HTML")
+    stats = get_executor().stats()
+    queued = ", ".join(f"{marketplace}: {count}" for marketplace, count in stats["queued"].items())
+    running = ", ".join(f"{marketplace}: {count}" for marketplace, count in stats["running"].items())
+    queue_info = (
+        f"Очередь: {queued}\n"
+        f"В работе: {running}\n"
+        f"Ожидание: ср. {stats['wait_avg']:.1f} с, макс. {stats['wait_max']:.1f} с"
+    )
+    send_stats = get_sender().stats()
+    queue_info += (
+        f"\nОтправка: в очереди {send_stats['queued']['interactive']} отв. + {send_stats['queued']['bulk']} увед., "
+        f"чатов {send_stats['chats']}, отправлено {send_stats['sent']}, повторов {send_stats['retried']}, ошибок {send_stats['failed']}\n"
+        f"Ожидание отправки: ср. {send_stats['wait_avg']:.1f} с, макс. {send_stats['wait_max']:.1f} с"
+    )
+    governors = governor_stats()
+    if governors:
+        states = {"closed": "работает", "half_open": "пробная проверка", "open": "приостановлен"}
+        queue_info += "\nМаркетплейсы: " + ", ".join(
+            f"{marketplace} — {states[g['state']]}"
+            + (f" еще {g['retry_in']:.0f} с" if g["retry_in"] else "")
+            + (f", неудач подряд {g['failures']}" if g["failures"] else "")
+            for marketplace, g in governors.items()
+        )
+    dead_selectors = selector_stats.dead()
+    if dead_selectors:
+        queue_info += "\nОтключенные селекторы цены:" + "".join(
+            f"\n• {marketplace}: <code>{html.escape(selector)}</code> ({days:.0f} дн.)"
+            for marketplace, selector, days in dead_selectors
+        )
+
+    await answer(
+        message,
+        f"<pre>{tabulate(table_data, headers, tablefmt='plain')}</pre>\n{queue_info}",
+        parse_mode="HTML"
+    )
 
 @router.message(Command("time_check"))
 async def cmd_time_check(message: Message):
@@ -81,82 +114,160 @@ async def cmd_time_check(message: Message):
         interval = await get_user_check_interval(user_id)
         if interval is None:
             default_min = settings.PRICE_CHECK_INTERVAL // 60
-            await message.answer(f"⏱️ Ваш интервал проверки: {default_min} мин (по умолчанию).\nЧтобы изменить, введите: /time_check [минуты]")
+            await answer(message, f"⏱️ Ваш интервал проверки: {default_min} мин (по умолчанию).\nЧтобы изменить, введите: /time_check [минуты]")
         else:
-            await message.answer(f"⏱️ Ваш интервал проверки: {interval} мин.\nЧтобы изменить, введите: /time_check [минуты]")
+            await answer(message, f"⏱️ Ваш интервал проверки: {interval} мин.\nЧтобы изменить, введите: /time_check [минуты]")
         return
 
     try:
         minutes = int(args[1])
         if minutes < 1:
-            await message.answer("⚠️ Интервал должен быть не менее 1 минуты.")
+            await answer(message, "⚠️ Интервал должен быть не менее 1 минуты.")
             return
         
         await set_user_check_interval(user_id, minutes)
-        await message.answer(f"✅ Интервал проверки установлен: {minutes} мин.")
+        user_schedule.set_interval(user_id, minutes)
+        await answer(message, f"✅ Интервал проверки установлен: {minutes} мин.")
     except ValueError:
-        await message.answer("⚠️ Пожалуйста, укажите целое число минут.\nПример: /time_check 30")
+        await answer(message, "⚠️ Пожалуйста, укажите целое число минут.\nПример: /time_check 30")
+
+def _format_age(seconds: float) -> str:
+    """Форматирует возраст цены: 'только что', '5 мин назад', '2 ч назад'."""
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return "только что"
+    if minutes < 60:
+        return f"{minutes} мин назад"
+    hours = minutes // 60
+    if hours < 24:
+        return f"{hours} ч назад"
+    return f"{hours // 24} дн назад"
+
+@dataclass
+class _ListRow:
+    site: str
+    name: str
+    url: str
+    target_price: Optional[float]
+    cached: Optional[CachedPrice]
+    # fresh — цена из кэша актуальна, updating — обновляется, timeout/failed — обновить не удалось
+    state: str
+
+
+def _render_list(rows: list[_ListRow]) -> str:
+    """Формирует список карточек (без тега <pre>, чтобы ссылки работали корректно)."""
+    response_lines = []
+    for row in rows:
+        if row.cached is None:
+            price_info = {
+                "updating": "⏳ Цена обновляется...",
+                "timeout": "⌛ Цена не получена вовремя, повторите /list позже",
+            }.get(row.state, "❌ Не удалось получить цену")
+        else:
+            price_info = "Нет в наличии" if row.cached.price == -1 else f"{int(row.cached.price)} ₽"
+            price_info += f" ({_format_age(row.cached.age)})"
+            if row.state == "updating":
+                price_info += " 🔄"
+            elif row.state == "timeout":
+                price_info += " ⌛"
+            elif row.state == "failed":
+                price_info += " ⚠️"
+
+        # Добавляем информацию о целевой цене
+        if row.target_price is not None:
+            price_info += f" (цель: {int(row.target_price)} ₽)"
+
+        site_icon = "🔵" if row.site == "Ozon" else "🟣"
+        # Формат: Иконка Сайт | Название (ссылка)
+        #         Цена
+        card = f"{site_icon} <b>{row.site}</b> | <a href=\"{row.url}\">{html.escape(row.name)}</a>\n💰 {price_info}"
+
+        response_lines.append(card)
+        response_lines.append("─" * 20)  # Разделитель
+
+    # Убираем последний разделитель
+    if response_lines:
+        response_lines.pop()
+    return "\n".join(response_lines)
+
+
+async def _update_row(row: _ListRow, limit: asyncio.Semaphore):
+    """Получает свежую цену строки списка; запрос продолжается в фоне и после таймаута."""
+    async with limit:
+        try:
+            price, product_name, _ = await asyncio.wait_for(
+                fetch_price(row.url, PRIORITY_INTERACTIVE), timeout=settings.LIST_ITEM_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            row.state = "timeout"
+            return
+        except Exception as e:
+            print(f"Ошибка при обновлении цены для {row.url}: {e}")
+            row.state = "failed"
+            return
+    if price is None:
+        row.state = "failed"
+        return
+    row.cached = price_cache.get(row.url) or row.cached
+    row.name = product_name or row.name
+    row.state = "fresh"
+
 
 @router.message(Command("list"))
 async def cmd_list(message: Message):
-    """Обработчик команды /list."""
+    """
+    Обработчик команды /list: сразу отвечает ценами из кэша, затем параллельно
+    обновляет устаревшие и дописывает их в то же сообщение по мере получения.
+    """
     user_id = message.from_user.id
     tracked_items = await get_urls_for_user(user_id)
     if not tracked_items:
-        await message.answer("У вас нет отслеживаемых товаров.")
+        await answer(message, "У вас нет отслеживаемых товаров.")
         return
 
-    processing_message = await message.answer("🔄 Собираю актуальные цены, это может занять до минуты...")
-
-    items_data = []
-
-    for rowid, url, saved_product_name, target_price, table_name in tracked_items:
-        # Получаем актуальную цену и название
-        current_price, current_product_name, _ = await get_price(url)
+    rows = []
+    for subscription_id, url, saved_product_name, target_price, marketplace in tracked_items:
+        cached = price_cache.get(url)
 
         # Используем сохраненное имя, если актуальное не получено
-        display_name = current_product_name or saved_product_name
+        display_name = (cached.product_name if cached else None) or saved_product_name
         # Если оба отсутствуют, используем укороченный URL
         if not display_name:
             display_name = url.split("?")[0]
             if len(display_name) > 40:
                 display_name = display_name[:37] + "..."
 
-
-        if current_price == -1:
-            price_info = "Нет в наличии"
-        else:
-            price_info = f"{int(current_price)} ₽" if current_price is not None else "Ошибка"
-
-        # Добавляем информацию о целевой цене
-        if target_price is not None:
-            price_info += f" (цель: {int(target_price)} ₽)"
-
-        site_name = "Ozon" if "ozon" in table_name else "WB"
-        items_data.append((site_name, display_name, price_info, url))
-
-    if not items_data:
-        await processing_message.edit_text("Не удалось получить информацию ни по одному товару.")
-        return
-
-    # Формируем список карточек (без тега <pre>, чтобы ссылки работали корректно)
-    response_lines = []
-    for site, name, price, url in items_data:
-        site_icon = "🔵" if site == "Ozon" else "🟣"
-        
-        # Формат: Иконка Сайт | Название (ссылка)
-        #         Цена
-        card = f"{site_icon} <b>{site}</b> | <a href=\"{url}\">{html.escape(name)}</a>\n💰 {price}"
-        
-        response_lines.append(card)
-        response_lines.append("─" * 20)  # Разделитель
-
-    # Убираем последний разделитель
-    if response_lines:
-        response_lines.pop()
-
-    response_text = "\n".join(response_lines)
-    await processing_message.edit_text(response_text, parse_mode="HTML", disable_web_page_preview=True)
+        site_name = "Ozon" if marketplace == "ozon" else "WB"
+        state = "updating" if price_cache.is_stale(cached) else "fresh"
+        rows.append(_ListRow(site_name, display_name, url, target_price, cached, state))
+
+    response_text = _render_list(rows)
+    reply = await answer(message, response_text, parse_mode="HTML", disable_web_page_preview=True)
+
+    # Устаревшие цены запрашиваем параллельно (не больше LIST_FETCH_CONCURRENCY на запрос)
+    limit = asyncio.Semaphore(settings.LIST_FETCH_CONCURRENCY)
+    pending = {asyncio.create_task(_update_row(row, limit)) for row in rows if row.state == "updating"}
+    last_edit = time.monotonic()
+    while pending:
+        _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if pending:
+            # Правим сообщение не чаще LIST_EDIT_INTERVAL, собирая результаты за это время
+            delay = settings.LIST_EDIT_INTERVAL - (time.monotonic() - last_edit)
+            if delay > 0:
+                _, pending = await asyncio.wait(pending, timeout=delay)
+
+        text = _render_list(rows)
+        if text == response_text:
+            continue
+        try:
+            await edit_text(reply, text, parse_mode="HTML", disable_web_page_preview=True)
+        except Exception as e:
+            print(f"[{user_id}] Не удалось обновить список: {e}")
+            for task in pending:
+                task.cancel()
+            return
+        response_text = text
+        last_edit = time.monotonic()
 
 
 @router.message(Command("stop_tracking"))
@@ -166,11 +277,11 @@ async def cmd_stop_tracking(message: Message):
     tracked_items = await get_urls_for_user(user_id)
 
     if not tracked_items:
-        await message.answer("У вас нет отслеживаемых товаров для удаления.")
+        await answer(message, "У вас нет отслеживаемых товаров для удаления.")
         return
 
     builder = InlineKeyboardBuilder()
-    for rowid, url, product_name, target_price, table_name in tracked_items:
+    for subscription_id, url, product_name, target_price, marketplace in tracked_items:
         display_name = product_name
         if not display_name:
             display_name = url.split("?")[0]
@@ -180,11 +291,12 @@ async def cmd_stop_tracking(message: Message):
         builder.row(
             InlineKeyboardButton(
                 text=f"❌ {display_name}",
-                callback_data=DeleteCallback(table=table_name, rowid=rowid).pack()
+                callback_data=DeleteCallback(subscription_id=subscription_id).pack()
             )
         )
     
-    await message.answer(
+    await answer(
+        message,
         "Выберите, какой товар вы хотите удалить из отслеживания:",
         reply_markup=builder.as_markup()
     )
@@ -192,15 +304,15 @@ async def cmd_stop_tracking(message: Message):
 @router.callback_query(DeleteCallback.filter())
 async def handle_delete_callback(query: CallbackQuery, callback_data: DeleteCallback):
     """Обработчик нажатия на кнопку удаления товара."""
-    table = callback_data.table
-    rowid = callback_data.rowid
-
-    await remove_item_by_rowid(rowid, table)
+    await remove_subscription(callback_data.subscription_id)
+    # Товаров не осталось: планировщику незачем будить этого пользователя
+    if not await get_urls_for_user(query.from_user.id):
+        user_schedule.remove(query.from_user.id)
     
     await query.answer("Товар удален!")
     
     # Обновляем сообщение, удаляя клавиатуру
-    await query.message.edit_text("Товар был удален из списка отслеживания.")
+    await edit_text(query.message, "Товар был удален из списка отслеживания.")
 
 @router.message(Command("history"))
 async def cmd_history(message: Message):
@@ -209,11 +321,11 @@ async def cmd_history(message: Message):
     tracked_items = await get_urls_for_user(user_id)
 
     if not tracked_items:
-        await message.answer("У вас нет отслеживаемых товаров для просмотра истории.")
+        await answer(message, "У вас нет отслеживаемых товаров для просмотра истории.")
         return
 
     builder = InlineKeyboardBuilder()
-    for rowid, url, product_name, target_price, table_name in tracked_items:
+    for subscription_id, url, product_name, target_price, marketplace in tracked_items:
         display_name = product_name
         if not display_name:
             display_name = url.split("?")[0]
@@ -223,11 +335,12 @@ async def cmd_history(message: Message):
         builder.row(
             InlineKeyboardButton(
                 text=f"📊 {display_name}",
-                callback_data=HistoryCallback(table=table_name, rowid=rowid).pack()
+                callback_data=HistoryCallback(subscription_id=subscription_id).pack()
             )
         )
     
-    await message.answer(
+    await answer(
+        message,
         "Выберите товар для просмотра истории цен:",
         reply_markup=builder.as_markup()
     )
@@ -235,10 +348,7 @@ async def cmd_history(message: Message):
 @router.callback_query(HistoryCallback.filter())
 async def handle_history_callback(query: CallbackQuery, callback_data: HistoryCallback):
     """Обработчик выбора товара для истории."""
-    table = callback_data.table
-    rowid = callback_data.rowid
-
-    url = await get_url_by_rowid(rowid, table)
+    url = await get_url_by_subscription(callback_data.subscription_id)
     if not url:
         await query.answer("Товар не найден.", show_alert=True)
         return
@@ -248,41 +358,9 @@ async def handle_history_callback(query: CallbackQuery, callback_data: HistoryCa
         await query.answer("История цен пуста.", show_alert=True)
         return
 
-    # --- Построение графика ---
-    dates = []
-    prices = []
-    
-    # history отсортирован DESC (сначала новые), для графика нужно ASC (хронологический порядок)
-    for record in reversed(history):
-        checked_at, price = record
-        if isinstance(checked_at, str):
-            # Парсим дату, если она пришла строкой из SQLite
-            try:
-                dt = datetime.datetime.fromisoformat(checked_at)
-            except ValueError:
-                # Fallback для форматов, если fromisoformat не сработал
-                dt = datetime.datetime.strptime(checked_at, "%Y-%m-%d %H:%M:%S.%f")
-        else:
-            dt = checked_at
-        dates.append(dt)
-        prices.append(price)
-
-    plt.figure(figsize=(10, 6))
-    plt.plot(dates, prices, marker='o', linestyle='-', color='b')
-    plt.title("История изменения цены")
-    plt.xlabel("Дата")
-    plt.ylabel("Цена (₽)")
-    plt.grid(True)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    plt.close()
-    
-    photo_file = BufferedInputFile(buf.read(), filename="history.png")
-    buf.close()
+    # --- Построение графика (в отдельном процессе, с кэшем) ---
+    png = await render_history_chart(url, history)
+    photo_file = BufferedInputFile(png, filename="history.png")
 
     table_data = []
     # Берем последние 20 записей
@@ -291,12 +369,15 @@ async def handle_history_callback(query: CallbackQuery, callback_data: HistoryCa
         time_str = str(checked_at).split('.')[0]
         table_data.append([time_str, f"{int(price)} ₽"])
 
+    from tabulate import tabulate
+
     headers = ["Время", "Цена"]
     text_table = tabulate(table_data, headers, tablefmt="plain")
     
     # Удаляем сообщение с меню и отправляем фото с таблицей в описании
     await query.message.delete()
-    await query.message.answer_photo(
+    await answer_photo(
+        query.message,
         photo=photo_file,
         caption=f"📊 История цен:\n<pre>{text_table}</pre>",
         parse_mode="HTML"
@@ -317,12 +398,10 @@ async def handle_product_url(message: Message):
     url = url_match.group(1).rstrip(".,;!?")
     
     hostname = urlparse(url).hostname
-    if not hostname or hostname not in SUPPORTED_HOSTS:
+    if not hostname or hostname.lower() not in SUPPORTED_HOSTS:
         await handle_other_messages(message)
         return
 
-    table_name = SUPPORTED_HOSTS[hostname]
-    
     target_price = None
     # Проверяем наличие целевой цены после ссылки
     post_url_text = text[url_match.end():].strip()
@@ -333,16 +412,35 @@ async def handle_product_url(message: Message):
         except ValueError:
             pass
 
-    processing_message = await message.answer("🔍 Проверяю ссылку и получаю текущую цену...")
+    processing_message = await answer(message, "🔍 Проверяю ссылку и получаю текущую цену...")
 
-    price, product_name, promo_text = await get_price(url)
+    # Приводим ссылку к каноническому виду: один товар — один ключ
+    product = await resolve_product_url(url)
+    if product is None:
+        await edit_text(
+            processing_message,
+            "❌ Не удалось определить товар по этой ссылке. "
+            "Отправьте ссылку на страницу товара."
+        )
+        return
+    url = product.url
+    marketplace = product.marketplace
+
+    price, product_name, promo_text = await fetch_price(url, PRIORITY_INTERACTIVE)
 
     if price == -1:
-        await processing_message.edit_text("Данного товара нет в наличии.")
+        await edit_text(processing_message, "Данного товара нет в наличии.")
         return
 
     if price is not None and product_name is not None:
-        await add_item_for_user(user_id, url, product_name, table_name, target_price)
+        await add_item_for_user(user_id, url, product_name, marketplace, target_price)
+        user_schedule.ensure_scheduled(user_id)
+        # Пользователь уже видит текущую цену: без целевой цены уведомим только об изменении,
+        # с целевой — когда она будет достигнута
+        if target_price is None:
+            notify_state.record_notified(user_id, url, price)
+        else:
+            notify_state.record_seen(user_id, url, price, target_price)
         response_text = (
             f"✅ Цена успешно получена!\n"
             f"Текущая цена для '{product_name}': {int(price)} ₽\n"
@@ -356,9 +454,10 @@ async def handle_product_url(message: Message):
         else:
             response_text += "Я начну отслеживать цену этого товара."
         
-        await processing_message.edit_text(response_text)
+        await edit_text(processing_message, response_text)
     else:
-        await processing_message.edit_text(
+        await edit_text(
+            processing_message,
             "❌ Не удалось получить цену или название для этой ссылки. "
             "Возможно, страница товара недоступна или имеет нестандартную структуру. "
             "Попробуйте другую ссылку."
@@ -367,4 +466,4 @@ async def handle_product_url(message: Message):
 @router.message()
 async def handle_other_messages(message: Message):
     """Обработчик для всех остальных сообщений."""
-    await message.answer("Пожалуйста, отправьте мне корректную ссылку на товар с сайта Ozon.ru или Wildberries.ru.")
+    await answer(message, "Пожалуйста, отправьте мне корректную ссылку на товар с сайта Ozon.ru или Wildberries.ru.")
@@ -0,0 +1,307 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message
+
+from config import settings
+from monitoring.metrics import TELEGRAM_SEND_ERRORS, TELEGRAM_SEND_SECONDS
+from scheduler.executor import PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+# Сколько корзин для чатов хранить, прежде чем удалять полностью восстановившиеся
+_CHAT_BUCKETS_MAX = 10000
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity в запасе."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        # До этого момента токены не выдаются (пауза после 429)
+        self._not_before = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        # Во время паузы токены не накапливаются
+        elapsed = now - max(self._updated, self._not_before)
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Сколько секунд ждать до появления токена (0 — токен есть)."""
+        self._refill()
+        paused = max(0.0, self._not_before - time.monotonic())
+        return max(paused, 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Не выдает токены seconds секунд; после паузы корзина начинает с нуля, а не с полного запаса."""
+        self._refill()
+        self._not_before = max(self._not_before, time.monotonic() + seconds)
+        self._tokens = min(self._tokens, 0.0)
+
+    def take(self):
+        self._refill()
+        self._tokens -= 1
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self._tokens >= self.capacity
+
+
+@dataclass(order=True)
+class _SendJob:
+    priority: int
+    seq: int
+    chat_id: int = field(compare=False)
+    call: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+
+
+class TelegramSender:
+    """
+    Очередь исходящих запросов к Telegram с ограничением частоты.
+
+    У каждого чата своя очередь с приоритетами и своя корзина токенов;
+    общая корзина бота выдает токены сначала ответам пользователю, затем
+    массовым уведомлениям. Ограничение после 429 (TelegramRetryAfter) действует
+    на весь бот: общая корзина приостанавливается на указанное время для всех
+    чатов, после чего запрос повторяется.
+    """
+
+    def __init__(self, global_rate: float, global_burst: int, chat_rate: float, chat_burst: int, retries: int):
+        self._global = TokenBucket(global_rate, max(1, global_burst))
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._retries = retries
+        self._seq = itertools.count()
+        # Очередь каждого чата — куча _SendJob: первым идет задание с наивысшим приоритетом
+        self._chats: dict[int, list[_SendJob]] = {}
+        self._chat_workers: dict[int, asyncio.Task] = {}
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        # Запросы, ожидающие токен общей корзины: (приоритет, порядок, future)
+        self._global_waiters: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        # Текущее ожидание токена для каждого чата: [приоритет, future]
+        self._chat_waiting: dict[int, list] = {}
+        self._granter: Optional[asyncio.Task] = None
+        self._queued = {PRIORITY_INTERACTIVE: 0, PRIORITY_BULK: 0}
+        self._counters = {"sent": 0, "retried": 0, "failed": 0}
+        self._wait_times: deque[float] = deque(maxlen=1000)
+
+    def start(self):
+        if self._granter is None:
+            self._granter = asyncio.create_task(self._grant())
+
+    async def stop(self):
+        queues = list(self._chats.values())
+        tasks = list(self._chat_workers.values())
+        if self._granter is not None:
+            tasks.append(self._granter)
+            self._granter = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for queue in queues:
+            for job in queue:
+                if not job.future.done():
+                    job.future.cancel()
+        self._chats.clear()
+        self._chat_workers.clear()
+
+    async def submit(self, chat_id: int, call: Callable[[], Awaitable[Any]], priority: int = PRIORITY_BULK) -> Any:
+        """
+        Ставит запрос в очередь чата и возвращает его результат.
+        call создает корутину запроса; при повторе после 429 она создается заново.
+        """
+        future = asyncio.get_running_loop().create_future()
+        job = _SendJob(priority, next(self._seq), chat_id, call, future, time.monotonic())
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = []
+            self._chat_workers[chat_id] = asyncio.create_task(self._chat_worker(chat_id, queue))
+        heapq.heappush(queue, job)
+        self._queued[priority] = self._queued.get(priority, 0) + 1
+
+        # Ответ пользователю не должен ждать, пока уведомление перед ним в этом чате
+        # получит токен с низким приоритетом: поднимаем приоритет текущего ожидания
+        waiting = self._chat_waiting.get(chat_id)
+        if waiting is not None and priority < waiting[0] and not waiting[1].done():
+            waiting[0] = priority
+            self._global_waiters.put_nowait((priority, next(self._seq), waiting[1]))
+        return await future
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= _CHAT_BUCKETS_MAX:
+                # Корзины неактивных чатов уже полные: их можно создать заново
+                for idle_chat in [chat for chat, b in self._chat_buckets.items() if b.full and chat not in self._chats]:
+                    del self._chat_buckets[idle_chat]
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    async def _grant(self):
+        """Выдает токены общей корзины в порядке приоритета."""
+        while True:
+            item = await self._global_waiters.get()
+            delay = self._global.delay()
+            if delay > 0:
+                # Пока ждем токен, может прийти запрос с более высоким приоритетом
+                self._global_waiters.put_nowait(item)
+                await asyncio.sleep(delay)
+                continue
+            future = item[2]
+            if not future.done():
+                self._global.take()
+                future.set_result(None)
+
+    async def _acquire_global(self, chat_id: int, priority: int):
+        future = asyncio.get_running_loop().create_future()
+        self._global_waiters.put_nowait((priority, next(self._seq), future))
+        self._chat_waiting[chat_id] = [priority, future]
+        try:
+            await future
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        finally:
+            self._chat_waiting.pop(chat_id, None)
+
+    def _head_priority(self, chat_id: int) -> int:
+        queue = self._chats.get(chat_id)
+        if not queue:
+            return PRIORITY_BULK
+        return queue[0].priority
+
+    async def _chat_worker(self, chat_id: int, queue: list[_SendJob]):
+        bucket = self._chat_bucket(chat_id)
+        job = None
+        try:
+            while queue:
+                job = heapq.heappop(queue)
+                try:
+                    if not job.future.done():
+                        await self._send(job, bucket)
+                finally:
+                    self._queued[job.priority] -= 1
+        except asyncio.CancelledError:
+            if job is not None and not job.future.done():
+                job.future.cancel()
+            raise
+        finally:
+            # Проверка пустоты и удаление очереди идут без await: новый запрос не потеряется
+            self._chats.pop(chat_id, None)
+            self._chat_workers.pop(chat_id, None)
+
+    async def _send(self, job: _SendJob, bucket: TokenBucket):
+        error: Optional[Exception] = None
+        for attempt in range(self._retries + 1):
+            delay = bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            bucket.take()
+            # Приоритет очереди чата: первым в ней может стоять ответ, пришедший позже
+            await self._acquire_global(job.chat_id, min(job.priority, self._head_priority(job.chat_id)))
+            if attempt == 0:
+                self._wait_times.append(time.monotonic() - job.enqueued_at)
+            if job.future.done():
+                return
+            try:
+                result = await job.call()
+            except TelegramRetryAfter as e:
+                error = e
+                self._counters["retried"] += 1
+                TELEGRAM_SEND_ERRORS.inc(error="retry_after")
+                print(f"[{job.chat_id}] Telegram ограничил частоту, отправка приостановлена на {e.retry_after} с")
+                # Повтор пройдет через общую корзину, то есть после паузы
+                self._global.pause(e.retry_after)
+                continue
+            except Exception as e:
+                self._counters["failed"] += 1
+                TELEGRAM_SEND_ERRORS.inc(error=type(e).__name__)
+                if not job.future.done():
+                    job.future.set_exception(e)
+                return
+            self._counters["sent"] += 1
+            TELEGRAM_SEND_SECONDS.observe(time.monotonic() - job.enqueued_at, priority=PRIORITY_NAMES.get(job.priority, str(job.priority)))
+            if not job.future.done():
+                job.future.set_result(result)
+            return
+
+        self._counters["failed"] += 1
+        TELEGRAM_SEND_ERRORS.inc(error=type(error).__name__)
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def stats(self) -> dict:
+        """Очередь исходящих сообщений: ожидают отправки, активные чаты, счетчики и время ожидания."""
+        waits = list(self._wait_times)
+        return {
+            "queued": {PRIORITY_NAMES[priority]: count for priority, count in self._queued.items()},
+            "chats": len(self._chats),
+            **self._counters,
+            "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+            "wait_max": max(waits) if waits else 0.0,
+        }
+
+
+_sender: Optional[TelegramSender] = None
+
+
+def start_sender() -> TelegramSender:
+    """Создает и запускает глобальную очередь отправки."""
+    global _sender
+    if _sender is None:
+        _sender = TelegramSender(
+            settings.TELEGRAM_GLOBAL_RATE,
+            settings.TELEGRAM_GLOBAL_BURST,
+            settings.TELEGRAM_CHAT_RATE,
+            settings.TELEGRAM_CHAT_BURST,
+            settings.TELEGRAM_SEND_RETRIES,
+        )
+        _sender.start()
+    return _sender
+
+
+def get_sender() -> TelegramSender:
+    """Возвращает глобальную очередь отправки, запуская ее при первом обращении."""
+    return _sender or start_sender()
+
+
+async def stop_sender():
+    """Останавливает очередь отправки и отменяет неотправленные сообщения."""
+    global _sender
+    sender, _sender = _sender, None
+    if sender is not None:
+        await sender.stop()
+
+
+# --- Обертки для обработчиков и планировщика ---
+
+async def send_message(bot: Bot, chat_id: int, text: str, priority: int = PRIORITY_BULK, **kwargs) -> Message:
+    return await get_sender().submit(chat_id, lambda: bot.send_message(chat_id=chat_id, text=text, **kwargs), priority)
+
+
+async def answer(message: Message, text: str, **kwargs) -> Message:
+    """Ответ пользователю в чат сообщения (приоритетно)."""
+    return await get_sender().submit(message.chat.id, lambda: message.answer(text, **kwargs), PRIORITY_INTERACTIVE)
+
+
+async def answer_photo(message: Message, photo, **kwargs) -> Message:
+    return await get_sender().submit(message.chat.id, lambda: message.answer_photo(photo, **kwargs), PRIORITY_INTERACTIVE)
+
+
+async def edit_text(message: Message, text: str, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+    return await get_sender().submit(message.chat.id, lambda: message.edit_text(text, **kwargs), priority)
@@ -3,12 +3,171 @@ import os
 # --- Telegram Bot ---
 # ВАЖНО: Получите токен у @BotFather в Telegram и вставьте его сюда
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "YOUR_TELEGRAM_TOKEN")
+# Адрес собственного сервера Bot API (по умолчанию api.telegram.org)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# --- Очередь отправки в Telegram ---
+# Лимиты Bot API: около 30 сообщений в секунду на бота и около 1 в секунду на чат
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 25))
+# Небольшой запас общей корзины: за любую секунду уходит не больше RATE + BURST сообщений
+TELEGRAM_GLOBAL_BURST = int(os.getenv("TELEGRAM_GLOBAL_BURST", 5))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+# Сколько сообщений подряд можно отправить в чат без ожидания
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", 3))
+# Сколько раз повторять запрос после ответа 429 (retry_after)
+TELEGRAM_SEND_RETRIES = int(os.getenv("TELEGRAM_SEND_RETRIES", 3))
 
 # --- Redis ---
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
+# Где выполняются проверки цен: local — в процессе бота, redis — воркерами (worker.py) через очередь в Redis
+SCRAPE_BACKEND = os.getenv("SCRAPE_BACKEND", "local")
+# Префикс ключей очереди заданий и ответов в Redis
+SCRAPE_QUEUE_PREFIX = os.getenv("SCRAPE_QUEUE_PREFIX", "price_bot")
+# Сколько секунд бот ждет результат от воркеров; задания старше этого воркеры пропускают
+SCRAPE_JOB_TIMEOUT = float(os.getenv("SCRAPE_JOB_TIMEOUT", 120))
+# Порт сервера метрик воркера (0 — не запускать)
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 0))
 
 # --- Scheduler ---
 # Интервал проверки цен в секундах (5 минут = 300 секунд)
 PRICE_CHECK_INTERVAL = 600
+
+# --- Уведомления ---
+# Когда уведомлять о товаре без целевой цены (через запятую):
+# change — любое изменение цены, drop — снижение не меньше NOTIFY_DROP_PERCENT, low — новый минимум
+NOTIFY_RULES = [rule.strip() for rule in os.getenv("NOTIFY_RULES", "change").split(",") if rule.strip()]
+NOTIFY_DROP_PERCENT = float(os.getenv("NOTIFY_DROP_PERCENT", 5))
+
+# --- Selenium ---
+# Общее количество экземпляров Chrome. У каждого маркетплейса свой пул со своей
+# политикой загрузки страниц: DRIVER_POOL_SIZE делится между ними (не меньше одного на пул)
+DRIVER_POOL_SIZE = int(os.getenv("DRIVER_POOL_SIZE", 2))
+DRIVER_POOL_SIZES = {
+    "ozon": int(os.getenv("OZON_DRIVER_POOL_SIZE", max(1, (DRIVER_POOL_SIZE + 1) // 2))),
+    "wb": int(os.getenv("WB_DRIVER_POOL_SIZE", max(1, DRIVER_POOL_SIZE // 2))),
+}
+# После скольких страниц драйвер перезапускается
+DRIVER_MAX_PAGES = int(os.getenv("DRIVER_MAX_PAGES", 50))
+# Ресурсы, которые не нужны для поиска цены: шрифты, видео, счетчики и реклама.
+# Шаблоны для CDP Network.setBlockedURLs, "*" — любая последовательность символов
+PAGE_BLOCKED_URLS = [
+    pattern.strip()
+    for pattern in os.getenv(
+        "PAGE_BLOCKED_URLS",
+        "*.woff,*.woff2,*.ttf,*.otf,*.mp4,*.webm,*.m3u8,"
+        "*mc.yandex.ru*,*an.yandex.ru*,*adfox.ru*,*top-fwz1.mail.ru*,*vk.com/rtrg*,"
+        "*google-analytics.com*,*googletagmanager.com*,*doubleclick.net*",
+    ).split(",")
+    if pattern.strip()
+]
+# Политика загрузки страниц для каждого маркетплейса:
+#   strategy — pageLoadStrategy Chrome: normal (ждать все ресурсы), eager (только DOM), none (не ждать);
+#   block_images — не загружать картинки; block_urls — блокировать PAGE_BLOCKED_URLS;
+#   wait_timeout — сколько секунд ждать цену на странице
+PAGE_LOAD_POLICIES = {
+    marketplace: {
+        "strategy": os.getenv(f"{prefix}_PAGE_LOAD_STRATEGY", "eager"),
+        "block_images": os.getenv(f"{prefix}_BLOCK_IMAGES", "1") == "1",
+        "block_urls": os.getenv(f"{prefix}_BLOCK_URLS", "1") == "1",
+        "wait_timeout": float(os.getenv(f"{prefix}_PAGE_WAIT_TIMEOUT", 15)),
+    }
+    for marketplace, prefix in (("ozon", "OZON"), ("wb", "WB"))
+}
+
+# --- Статистика селекторов цены ---
+# Файл со статистикой срабатываний селекторов по маркетплейсам
+SELECTOR_STATS_FILE = os.getenv("SELECTOR_STATS_FILE", "selector_stats.json")
+# Селекторы, находившие цену за последние SELECTOR_COLD_HOURS часов, проверяются первыми;
+# не срабатывавшие SELECTOR_DEAD_DAYS дней отключаются
+SELECTOR_COLD_HOURS = float(os.getenv("SELECTOR_COLD_HOURS", 6))
+SELECTOR_DEAD_DAYS = float(os.getenv("SELECTOR_DEAD_DAYS", 7))
+# Каждая N-я страница проверяется всеми селекторами, включая отключенные
+SELECTOR_FULL_CHECK_EVERY = int(os.getenv("SELECTOR_FULL_CHECK_EVERY", 20))
+SELECTOR_STATS_SAVE_INTERVAL = float(os.getenv("SELECTOR_STATS_SAVE_INTERVAL", 300))
+
+# --- Ограничение запросов к маркетплейсам ---
+# Не больше *_RATE запросов в секунду к маркетплейсу (0 — без ограничения), до MARKETPLACE_BURST подряд
+MARKETPLACE_RATE = {
+    "ozon": float(os.getenv("OZON_RATE", 5)),
+    "wb": float(os.getenv("WB_RATE", 10)),
+}
+MARKETPLACE_BURST = int(os.getenv("MARKETPLACE_BURST", 5))
+# Пауза после n-й неудачи подряд: BACKOFF_BASE * 2^(n-1) секунд со случайным разбросом, не больше BACKOFF_MAX
+MARKETPLACE_BACKOFF_BASE = float(os.getenv("MARKETPLACE_BACKOFF_BASE", 1))
+MARKETPLACE_BACKOFF_MAX = float(os.getenv("MARKETPLACE_BACKOFF_MAX", 60))
+# После CIRCUIT_FAILURES неудач подряд запросы не выполняются CIRCUIT_OPEN_SECONDS секунд, затем одна
+# пробная проверка; если она неудачна, пауза удваивается (не больше CIRCUIT_OPEN_MAX)
+MARKETPLACE_CIRCUIT_FAILURES = int(os.getenv("MARKETPLACE_CIRCUIT_FAILURES", 5))
+MARKETPLACE_CIRCUIT_OPEN_SECONDS = float(os.getenv("MARKETPLACE_CIRCUIT_OPEN_SECONDS", 60))
+MARKETPLACE_CIRCUIT_OPEN_MAX = float(os.getenv("MARKETPLACE_CIRCUIT_OPEN_MAX", 1800))
+
+# --- HTTP fetch (без браузера) ---
+WB_CARD_API_URL = os.getenv("WB_CARD_API_URL", "https://card.wb.ru/cards/v2/detail")
+# Регион доставки WB, от него зависит цена в карточке
+WB_DEST = os.getenv("WB_DEST", "-1257786")
+OZON_API_URL = os.getenv("OZON_API_URL", "https://www.ozon.ru/api/entrypoint-api.bx/page/json/v2")
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 20))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", 30))
+# Использовать Selenium, если HTTP-запрос не вернул цену
+SELENIUM_FALLBACK = os.getenv("SELENIUM_FALLBACK", "1") == "1"
+
+# --- Scrape executor ---
+# Общее ограничение на количество одновременных проверок цен. Проверки идут через HTTP,
+# поэтому по умолчанию оно равно размеру пула соединений; проверки через Chrome
+# дополнительно ограничены размером пула драйверов маркетплейса (DRIVER_POOL_SIZES)
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", HTTP_POOL_SIZE))
+# Ограничения для каждого маркетплейса
+SCRAPE_MARKETPLACE_LIMITS = {
+    "ozon": int(os.getenv("SCRAPE_OZON_CONCURRENCY", SCRAPE_CONCURRENCY)),
+    "wb": int(os.getenv("SCRAPE_WB_CONCURRENCY", SCRAPE_CONCURRENCY)),
+}
+
+# --- Price cache ---
+# Через сколько секунд цена в кэше считается устаревшей
+PRICE_CACHE_TTL = int(os.getenv("PRICE_CACHE_TTL", PRICE_CHECK_INTERVAL))
+PRICE_CACHE_MAX_ENTRIES = int(os.getenv("PRICE_CACHE_MAX_ENTRIES", 50000))
+
+# --- /list ---
+# Сколько устаревших цен одного списка обновляется одновременно, сколько секунд ждать каждую
+# и как часто (секунды) править сообщение по мере получения цен
+LIST_FETCH_CONCURRENCY = int(os.getenv("LIST_FETCH_CONCURRENCY", 4))
+LIST_ITEM_TIMEOUT = float(os.getenv("LIST_ITEM_TIMEOUT", 30))
+LIST_EDIT_INTERVAL = float(os.getenv("LIST_EDIT_INTERVAL", 1.5))
+
+# --- SQLite ---
+# Размер страничного кэша (КБ), объем отображения файла в память и кэш подготовленных запросов
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", 20000))
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", 256 * 1024 * 1024))
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", 256))
+# Отложенная запись истории цен: размер пачки и максимальная задержка (секунды)
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", 500))
+DB_WRITE_INTERVAL = float(os.getenv("DB_WRITE_INTERVAL", 5))
+# Хранение истории цен: сырые точки (дни), затем часовые корзины (дни), затем дневные бессрочно
+HISTORY_RAW_DAYS = int(os.getenv("HISTORY_RAW_DAYS", 2))
+HISTORY_HOURLY_DAYS = int(os.getenv("HISTORY_HOURLY_DAYS", 30))
+# Как часто сворачивать историю (секунды)
+HISTORY_ROLLUP_INTERVAL = int(os.getenv("HISTORY_ROLLUP_INTERVAL", 3600))
+
+# --- Charts ---
+# Количество процессов для отрисовки графиков и размер кэша готовых картинок
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", 2))
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", 256))
+
+# --- Снимки страниц без цены ---
+# Каталог для сжатых HTML-страниц, на которых не удалось найти цену
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "captures")
+# Ограничения хранилища: при превышении удаляются самые старые снимки
+CAPTURE_MAX_FILES = int(os.getenv("CAPTURE_MAX_FILES", 200))
+CAPTURE_MAX_MB = float(os.getenv("CAPTURE_MAX_MB", 50))
+# Не больше CAPTURE_PER_WINDOW снимков каждого маркетплейса за CAPTURE_WINDOW секунд
+# и не больше одного снимка одного URL за окно: смена верстки не заполнит диск копиями
+CAPTURE_PER_WINDOW = int(os.getenv("CAPTURE_PER_WINDOW", 5))
+CAPTURE_WINDOW = int(os.getenv("CAPTURE_WINDOW", 3600))
+
+# --- Метрики ---
+# Адрес HTTP-сервера с метриками в формате Prometheus (GET /metrics); порт 0 — не запускать
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
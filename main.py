@@ -1,13 +1,24 @@
 import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import BotCommand
 
 from config import settings
+from bot.charts import shutdown_chart_pool
 from bot.handlers import router as main_router
-from scheduler.tasks import start_scheduler
-from storage.sqlite_client import initialize_db
+from bot.sender import start_sender, stop_sender
+from monitoring.server import start_metrics_server, stop_metrics_server
+from parser.http_fetch import close_http_session
+from parser.price_parser import shutdown_browser, warm_up_browser
+from parser.selector_stats import selector_stats
+from scheduler.executor import start_executor, stop_executor
+from scheduler.tasks import start_scheduler, stop_due_checks
+from storage.price_cache import price_cache
+from storage.sqlite_client import close_db, get_last_prices, initialize_db
 
 
 async def set_main_menu(bot: Bot):
@@ -22,33 +33,79 @@ async def set_main_menu(bot: Bot):
     await bot.set_my_commands(main_menu_commands)
 
 
+def create_bot() -> Bot:
+    """Создает бота; при заданном TELEGRAM_API_URL — с собственным сервером Bot API."""
+    session = None
+    if settings.TELEGRAM_API_URL:
+        # Собственный сервер Bot API (или тестовый сервер из benchmarks)
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL))
+    return Bot(token=settings.TELEGRAM_BOT_TOKEN, session=session)
+
+
+def create_dispatcher(ready: asyncio.Event) -> Dispatcher:
+    """Создает диспетчер с обработчиками бота; ready выставляется, когда он готов принимать обновления."""
+    dp = Dispatcher()
+
+    async def on_startup():
+        ready.set()
+
+    dp.startup.register(on_startup)
+
+    # Подключение роутера
+    dp.include_router(main_router)
+    return dp
+
+
 async def main():
     """Основная функция для запуска бота с корректной обработкой завершения."""
 
     # Инициализация базы данных
     await initialize_db()
+    # Последние известные цены: /list после перезапуска не запрашивает их заново
+    price_cache.load(await get_last_prices(settings.PRICE_CACHE_MAX_ENTRIES))
+    # Статистика селекторов цены: порядок проверки и отключенные селекторы
+    selector_stats.load(settings.SELECTOR_STATS_FILE)
+
+    loop = asyncio.get_running_loop()
+    # Потоков хватает на все экземпляры Chrome и служебные задачи (HTTP-проверкам потоки не нужны)
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=sum(settings.DRIVER_POOL_SIZES.values()) + 4))
 
     # Настройка логирования
     logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-    # Инициализация бота и диспетчера
-    bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
-    dp = Dispatcher()
+    # Пул драйверов Chrome нужен только для запасного пути через браузер
+    # и только если проверки выполняются в этом процессе, а не воркерами
+    browser_task = None
+    if settings.SELENIUM_FALLBACK and settings.SCRAPE_BACKEND == "local":
+        browser_task = asyncio.create_task(warm_up_browser())
+
+    # Очередь заданий на проверку цен (общая для планировщика и обработчиков)
+    start_executor()
+    # Очередь исходящих сообщений с лимитами Telegram
+    start_sender()
+
+    # Метрики для Prometheus
+    if settings.METRICS_PORT:
+        try:
+            await start_metrics_server(settings.METRICS_HOST, settings.METRICS_PORT)
+            logging.info(f"Метрики доступны на http://{settings.METRICS_HOST}:{settings.METRICS_PORT}/metrics")
+        except OSError as e:
+            logging.error(f"Не удалось запустить сервер метрик: {e}")
+
+    # Инициализация бота и диспетчера; планировщик стартует, как только диспетчер готов
+    ready = asyncio.Event()
+    bot = create_bot()
+    dp = create_dispatcher(ready)
 
     # Устанавливаем меню
     await set_main_menu(bot)
 
-    # Подключение роутера
-    dp.include_router(main_router)
-
     logging.info("Запуск бота...")
     scheduler_task = None
     try:
         await bot.delete_webhook(drop_pending_updates=True)
-        # Запуск фоновой задачи планировщика после очистки очереди
-        # Добавляем задержку 10 секунд, чтобы избежать мгновенной проверки при рестарте
-        await asyncio.sleep(10)
-        scheduler_task = asyncio.create_task(start_scheduler(bot))
+        # Запуск фоновой задачи планировщика; первая проверка ждет сигнала готовности
+        scheduler_task = asyncio.create_task(start_scheduler(bot, ready))
         await dp.start_polling(bot)
     finally:
         logging.info("Остановка бота...")
@@ -62,7 +119,35 @@ async def main():
                 await scheduler_task
             except asyncio.CancelledError:
                 logging.info("Задача планировщика успешно отменена.")
+
+        # Прерываем начатые циклы проверки, пока очередь отправки и БД еще открыты
+        await stop_due_checks()
             
+        # Останавливаем очередь заданий и очередь отправки
+        await stop_executor()
+        await stop_sender()
+        await stop_metrics_server()
+
+        # Закрываем пул HTTP-соединений к маркетплейсам
+        await close_http_session()
+
+        # Дожидаемся запуска Chrome, чтобы не оставить процессы браузера
+        if browser_task:
+            await browser_task
+
+        # Закрываем все экземпляры Chrome
+        await loop.run_in_executor(None, shutdown_browser)
+        logging.info("Пул драйверов закрыт.")
+
+        # Сохраняем статистику селекторов
+        selector_stats.save()
+
+        # Останавливаем процессы отрисовки графиков
+        shutdown_chart_pool()
+
+        # Закрываем соединение с базой данных
+        await close_db()
+
         # Корректно закрываем сессию бота
         if bot.session:
             await bot.session.close()
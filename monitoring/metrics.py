@@ -0,0 +1,183 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Границы корзин гистограмм (секунды)
+SCRAPE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SEND_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+LAUNCH_BUCKETS = (0.5, 1, 2, 3, 5, 10, 20, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    """Метрика с метками; значения каждой комбинации меток хранятся отдельно."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self._values: dict[tuple[str, ...], object] = {}
+        # Метрики обновляются и из пула потоков (запуск Chrome)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = SCRAPE_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [счетчики по корзинам, сумма]
+                state = self._values[key] = [[0] * len(self.buckets), 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Замеряет время выполнения блока."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Все метрики процесса в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+
+# --- Метрики бота ---
+
+SCRAPE_SECONDS = Histogram(
+    "price_scrape_seconds", "Время получения цены по маркетплейсу и способу загрузки (http, selenium)",
+    ("marketplace", "path"), SCRAPE_BUCKETS,
+)
+SCRAPE_RESULTS = Counter(
+    "price_scrape_total", "Результаты получения цены: ok, sold_out, not_found, blocked, error, rejected (автомат защиты)",
+    ("marketplace", "path", "outcome"),
+)
+SCRAPE_QUEUE_WAIT = Histogram(
+    "scrape_queue_wait_seconds", "Ожидание задания в очереди проверок до начала выполнения",
+    ("marketplace",), SEND_BUCKETS,
+)
+MARKETPLACE_CIRCUIT_STATE = Gauge(
+    "marketplace_circuit_state", "Автомат защиты маркетплейса: 0 — закрыт, 1 — пробная проверка, 2 — открыт", ("marketplace",),
+)
+SCRAPE_QUEUE_DEPTH = Gauge("scrape_queue_depth", "Заданий в очереди проверок", ("marketplace",))
+SCRAPE_RUNNING = Gauge("scrape_running", "Выполняемых проверок", ("marketplace",))
+CHROME_LAUNCH_SECONDS = Histogram("chrome_launch_seconds", "Время запуска экземпляра Chrome", (), LAUNCH_BUCKETS)
+CHROME_LAUNCH_FAILURES = Counter("chrome_launch_failures_total", "Неудачные запуски Chrome")
+SCHEDULER_LAG = Histogram(
+    "scheduler_lag_seconds", "Опоздание проверки пользователя относительно времени по расписанию", (), LAG_BUCKETS,
+)
+SCHEDULER_CYCLE_SECONDS = Histogram(
+    "scheduler_cycle_seconds", "Длительность цикла проверки просроченных пользователей", (), LAUNCH_BUCKETS + (120, 300, 600),
+)
+DB_SECONDS = Histogram("db_operation_seconds", "Время операций с базой данных", ("operation",), DB_BUCKETS)
+TELEGRAM_SEND_SECONDS = Histogram(
+    "telegram_send_seconds", "Время от постановки запроса к Telegram в очередь до ответа", ("priority",), SEND_BUCKETS,
+)
+TELEGRAM_SEND_ERRORS = Counter("telegram_send_errors_total", "Ошибки запросов к Telegram: retry_after и тип исключения", ("error",))
+TELEGRAM_SEND_QUEUE = Gauge("telegram_send_queue", "Запросов к Telegram в очереди отправки", ("priority",))
+
+
+def record_scrape(marketplace: str, path: str, price: Optional[float], started: float):
+    """Учитывает время и результат одной попытки получить цену (started — time.perf_counter())."""
+    SCRAPE_SECONDS.observe(time.perf_counter() - started, marketplace=marketplace, path=path)
+    if price is None:
+        outcome = "not_found"
+    elif price < 0:
+        outcome = "sold_out"
+    else:
+        outcome = "ok"
+    SCRAPE_RESULTS.inc(marketplace=marketplace, path=path, outcome=outcome)
@@ -0,0 +1,50 @@
+import sys
+from typing import Optional
+
+from aiohttp import web
+
+from monitoring.metrics import SCRAPE_QUEUE_DEPTH, SCRAPE_RUNNING, TELEGRAM_SEND_QUEUE, registry
+
+_runner: Optional[web.AppRunner] = None
+
+
+def _update_queue_gauges():
+    """Снимает глубину очередей проверок и отправки в момент запроса метрик."""
+    from scheduler.executor import get_executor
+
+    executor_stats = get_executor().stats()
+    for marketplace, depth in executor_stats["queued"].items():
+        SCRAPE_QUEUE_DEPTH.set(depth, marketplace=marketplace)
+    for marketplace, running in executor_stats["running"].items():
+        SCRAPE_RUNNING.set(running, marketplace=marketplace)
+    # В воркере (worker.py) очереди отправки нет
+    if "bot.sender" in sys.modules:
+        from bot.sender import get_sender
+
+        for priority, depth in get_sender().stats()["queued"].items():
+            TELEGRAM_SEND_QUEUE.set(depth, priority=priority)
+
+
+async def _metrics(request: web.Request) -> web.Response:
+    _update_queue_gauges()
+    return web.Response(body=registry.render().encode("utf-8"), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def start_metrics_server(host: str, port: int):
+    """Запускает HTTP-сервер с метриками в формате Prometheus (GET /metrics)."""
+    global _runner
+    if _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    _runner = runner
+
+
+async def stop_metrics_server():
+    global _runner
+    runner, _runner = _runner, None
+    if runner is not None:
+        await runner.cleanup()
@@ -0,0 +1,226 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from selenium_stealth import stealth
+from webdriver_manager.chrome import ChromeDriverManager
+
+from config import settings
+from monitoring.metrics import CHROME_LAUNCH_FAILURES, CHROME_LAUNCH_SECONDS
+
+
+@dataclass
+class PageLoadPolicy:
+    """Что Chrome загружает на странице товара (см. PAGE_LOAD_POLICIES в настройках)."""
+
+    # pageLoadStrategy: normal, eager или none
+    strategy: str = "normal"
+    block_images: bool = False
+    # Шаблоны URL для CDP Network.setBlockedURLs
+    blocked_urls: list[str] = field(default_factory=list)
+    # Сколько секунд ждать цену на странице
+    wait_timeout: float = 15
+
+    @classmethod
+    def for_marketplace(cls, marketplace: str) -> "PageLoadPolicy":
+        config = settings.PAGE_LOAD_POLICIES[marketplace]
+        return cls(
+            strategy=config["strategy"],
+            block_images=config["block_images"],
+            blocked_urls=list(settings.PAGE_BLOCKED_URLS) if config["block_urls"] else [],
+            wait_timeout=config["wait_timeout"],
+        )
+
+
+class DriverPool:
+    """
+    Пул драйверов Chrome, которые запускаются по мере надобности и переиспользуются.
+
+    Драйвер выдается на одну страницу через `driver()` и возвращается обратно.
+    После `max_pages` страниц или ошибки драйвер закрывается, а вместо него
+    при следующем запросе запускается новый.
+    """
+
+    def __init__(self, size: int, max_pages: int, driver_path: str, policy: Optional[PageLoadPolicy] = None):
+        self._size = size
+        self._max_pages = max_pages
+        self._driver_path = driver_path
+        self.policy = policy or PageLoadPolicy()
+        self._idle: "queue.Queue[webdriver.Chrome]" = queue.Queue()
+        self._pages: dict[int, int] = {}
+        self._broken: set[int] = set()
+        self._created = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _launch(self) -> webdriver.Chrome:
+        """Запускает новый экземпляр Chrome с настройками stealth и политикой загрузки страниц."""
+        options = webdriver.ChromeOptions()
+        options.page_load_strategy = self.policy.strategy
+        options.add_argument("--headless=new")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument(
+            "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+        )
+        options.add_argument("--disable-blink-features=AutomationControlled")
+        options.add_argument("--window-size=1920,1080")
+        options.add_argument("--lang=ru-RU")
+        options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        options.add_experimental_option("useAutomationExtension", False)
+        if self.policy.block_images:
+            options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+        started = time.perf_counter()
+        try:
+            driver = webdriver.Chrome(service=ChromeService(self._driver_path), options=options)
+        except Exception:
+            CHROME_LAUNCH_FAILURES.inc()
+            raise
+        CHROME_LAUNCH_SECONDS.observe(time.perf_counter() - started)
+        if self.policy.blocked_urls:
+            # Блокировка действует для всех страниц этой вкладки, пока включен домен Network
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.policy.blocked_urls})
+        stealth(
+            driver,
+            languages=["ru-RU", "ru"],
+            vendor="Google Inc.",
+            platform="Win32",
+            webgl_vendor="Intel Inc.",
+            renderer="Intel Iris OpenGL Engine",
+            fix_hairline=True,
+        )
+        return driver
+
+    def _quit(self, driver: webdriver.Chrome):
+        with self._lock:
+            self._pages.pop(id(driver), None)
+            self._broken.discard(id(driver))
+            self._created -= 1
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Ошибка при закрытии драйвера: {e}")
+
+    def _acquire(self) -> webdriver.Chrome:
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Пул драйверов закрыт")
+                can_launch = self._created < self._size
+                if can_launch:
+                    self._created += 1
+
+            if can_launch:
+                try:
+                    return self._launch()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+
+            # Пул заполнен: ждем возврата драйвера, периодически перепроверяя,
+            # не освободилось ли место после перезапуска сломанного драйвера
+            try:
+                return self._idle.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    def _release(self, driver: webdriver.Chrome):
+        if self.policy.strategy != "normal" and id(driver) not in self._broken:
+            # Без ожидания полной загрузки страница продолжает грузить ресурсы после разбора,
+            # а при стратегии none следующий driver.get мог бы застать ее DOM: уходим на пустую страницу
+            try:
+                driver.get("about:blank")
+            except Exception:
+                self.mark_broken(driver)
+        with self._lock:
+            pages = self._pages.get(id(driver), 0) + 1
+            self._pages[id(driver)] = pages
+            recycle = self._closed or id(driver) in self._broken or pages >= self._max_pages
+
+        if recycle:
+            self._quit(driver)
+        else:
+            self._idle.put(driver)
+
+    def mark_broken(self, driver: webdriver.Chrome):
+        """Помечает драйвер как сломанный: после возврата он будет закрыт."""
+        with self._lock:
+            self._broken.add(id(driver))
+
+    @contextmanager
+    def driver(self) -> Iterator[webdriver.Chrome]:
+        """Выдает драйвер из пула на время обработки одной страницы."""
+        driver = self._acquire()
+        try:
+            yield driver
+        except Exception:
+            self.mark_broken(driver)
+            raise
+        finally:
+            self._release(driver)
+
+    def shutdown(self):
+        """Закрывает все простаивающие драйверы; занятые закроются при возврате."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(driver)
+
+
+_pools: dict[str, DriverPool] = {}
+_pools_lock = threading.Lock()
+_driver_path: Optional[str] = None
+
+
+def init_driver_pool() -> list[DriverPool]:
+    """
+    Создает пулы драйверов для всех маркетплейсов и определяет путь к chromedriver.
+    Chrome запускается при первой проверке через браузер: это запасной путь,
+    и держать простаивающие экземпляры заранее незачем.
+    Блокирующая функция: из асинхронного кода вызывать через run_in_executor.
+    """
+    return [get_driver_pool(marketplace) for marketplace in settings.PAGE_LOAD_POLICIES]
+
+
+def get_driver_pool(marketplace: str) -> DriverPool:
+    """
+    Возвращает пул маркетплейса: у каждого свои настройки загрузки страниц,
+    поэтому драйверы разных маркетплейсов не смешиваются.
+    Путь к chromedriver определяется один раз.
+    """
+    global _driver_path
+    with _pools_lock:
+        pool = _pools.get(marketplace)
+        if pool is None:
+            if _driver_path is None:
+                _driver_path = ChromeDriverManager().install()
+            policy = PageLoadPolicy.for_marketplace(marketplace)
+            pool = _pools[marketplace] = DriverPool(
+                settings.DRIVER_POOL_SIZES.get(marketplace, 1), settings.DRIVER_MAX_PAGES, _driver_path, policy
+            )
+        return pool
+
+
+def shutdown_driver_pool():
+    """Закрывает пулы драйверов всех маркетплейсов."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
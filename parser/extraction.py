@@ -0,0 +1,119 @@
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from lxml import etree
+from lxml import html as lxml_html
+from lxml.cssselect import CSSSelector
+
+from parser.selector_stats import SelectorStats
+
+
+@dataclass
+class Extraction:
+    """Результат разбора одной страницы: найденный текст по каждому набору селекторов."""
+    name: Optional[str] = None
+    price_text: Optional[str] = None
+    price_selector: Optional[str] = None
+    promo_price_text: Optional[str] = None
+    promo_timer_text: Optional[str] = None
+    sold_out_text: Optional[str] = None
+
+
+def _compile(selector: str) -> etree.XPath:
+    """Компилирует XPath (начинается с '/' или '(') или CSS-селектор в XPath."""
+    if selector.startswith(("/", "(")):
+        return etree.XPath(selector)
+    return CSSSelector(selector, translator="html")
+
+
+def _text(element) -> str:
+    if isinstance(element, str):
+        return " ".join(element.split())
+    return " ".join(element.text_content().split())
+
+
+class Extractor:
+    """
+    Набор заранее скомпилированных селекторов для одного маркетплейса.
+
+    Страница разбирается один раз (lxml), после чего все наборы селекторов
+    вычисляются по готовому дереву без обращений к браузеру.
+    Если передана статистика, селекторы цены проверяются в порядке недавних
+    срабатываний, а давно не срабатывавшие пропускаются (см. SelectorStats).
+    """
+
+    def __init__(
+        self,
+        name: Iterable[str] = (),
+        price: Iterable[str] = (),
+        promo_price: Iterable[str] = (),
+        promo_timer: Iterable[str] = (),
+        sold_out: Iterable[str] = (),
+        price_marker: Optional[str] = None,
+        stats: Optional[SelectorStats] = None,
+        stats_key: Optional[str] = None,
+    ):
+        self.name = [(selector, _compile(selector)) for selector in name]
+        self.price = [(selector, _compile(selector)) for selector in price]
+        self.promo_price = [(selector, _compile(selector)) for selector in promo_price]
+        self.promo_timer = [(selector, _compile(selector)) for selector in promo_timer]
+        self.sold_out = [(selector, _compile(selector)) for selector in sold_out]
+        # Текст, который должен содержать элемент цены (например, '₽')
+        self.price_marker = price_marker
+        self._stats = stats
+        self._stats_key = stats_key
+        self._compiled_price = dict(self.price)
+
+    @staticmethod
+    def _first(tree, compiled, marker: Optional[str] = None) -> tuple[Optional[str], Optional[str]]:
+        """Возвращает (текст, селектор) первого подходящего непустого элемента."""
+        for selector, xpath in compiled:
+            try:
+                elements = xpath(tree)
+            except etree.XPathError:
+                continue
+            for element in elements:
+                text = _text(element)
+                if text and (marker is None or marker in text):
+                    return text, selector
+        return None, None
+
+    def _extract_price(self, tree) -> tuple[Optional[str], Optional[str]]:
+        if self._stats is None:
+            return self._first(tree, self.price, self.price_marker)
+
+        order, dead, full_check = self._stats.plan(self._stats_key, list(self._compiled_price))
+        if full_check:
+            # Каждый селектор отдельно: статистика не зависит от текущего порядка
+            found = {
+                selector: self._first(tree, [(selector, self._compiled_price[selector])], self.price_marker)[0]
+                for selector in order + dead
+            }
+            matched = [selector for selector, text in found.items() if text is not None]
+            # Победитель — по исходному приоритету, а не по текущему порядку проверки
+            price_selector = next((s for s in self._compiled_price if s in matched), None)
+            price_text = found[price_selector] if price_selector else None
+        else:
+            price_text, price_selector = self._first(tree, [(s, self._compiled_price[s]) for s in order], self.price_marker)
+            if price_text is None and dead:
+                # Отключенные селекторы — последняя попытка перед "цена не найдена"
+                price_text, price_selector = self._first(tree, [(s, self._compiled_price[s]) for s in dead], self.price_marker)
+            matched = [price_selector] if price_selector else []
+        self._stats.record(self._stats_key, matched, price_selector)
+        return price_text, price_selector
+
+    def extract(self, page_source: str) -> Extraction:
+        """Разбирает страницу один раз и вычисляет все наборы селекторов."""
+        if not page_source:
+            return Extraction()
+        tree = lxml_html.fromstring(page_source)
+
+        price_text, price_selector = self._extract_price(tree)
+        return Extraction(
+            name=self._first(tree, self.name)[0],
+            price_text=price_text,
+            price_selector=price_selector,
+            promo_price_text=self._first(tree, self.promo_price)[0],
+            promo_timer_text=self._first(tree, self.promo_timer)[0],
+            sold_out_text=self._first(tree, self.sold_out)[0],
+        )
@@ -0,0 +1,205 @@
+import asyncio
+import random
+import re
+import time
+from typing import Optional
+
+from config import settings
+from monitoring.metrics import MARKETPLACE_CIRCUIT_STATE
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Ответы, которыми маркетплейс отказывает в доступе; 404 и т. п. означают, что нет самого товара
+BLOCK_STATUSES = {403, 429}
+# Страница блокировки или капчи вместо страницы товара
+BLOCK_PAGE_RE = re.compile(
+    r"captcha|капч|доступ ограничен|не робот|подозрительн\w* активност|antibot", re.IGNORECASE
+)
+
+
+class MarketplaceBlocked(Exception):
+    """Маркетплейс отказал в доступе: статус блокировки или ошибки сервера, капча."""
+
+
+def check_status(status: int):
+    """Выбрасывает MarketplaceBlocked для статусов блокировки и ошибок сервера."""
+    if status in BLOCK_STATUSES or status >= 500:
+        raise MarketplaceBlocked(f"HTTP {status}")
+
+
+def is_block_page(page_source: str) -> bool:
+    return BLOCK_PAGE_RE.search(page_source) is not None
+
+
+class MarketplaceGovernor:
+    """
+    Ограничение запросов к одному маркетплейсу перед get_price.
+
+    * Частота: не больше rate запросов в секунду, до burst подряд (0 — без ограничения).
+    * Пауза после неудачи: base * 2^(n-1) секунд (не больше max) со случайным разбросом,
+      где n — число неудач подряд.
+    * Автомат защиты: после failure_threshold неудач подряд запросы сразу отклоняются
+      open_seconds секунд, затем выполняется одна пробная проверка. Успех закрывает
+      автомат, неудача открывает его снова на вдвое больший срок (не больше open_max).
+      Проба, отмененная до record (abandon) или не завершившаяся за open_seconds,
+      считается потерянной, и следующий запрос становится новой пробой.
+
+    Неудача — исключение при получении цены, в том числе MarketplaceBlocked (статус
+    блокировки или ошибки сервера, капча). Страница без цены (товар снят с продажи
+    или удален) неудачей не считается: иначе несколько таких ссылок подряд
+    останавливали бы проверки всего маркетплейса.
+    """
+
+    def __init__(
+        self,
+        marketplace: str,
+        rate: float,
+        burst: int,
+        backoff_base: float,
+        backoff_max: float,
+        failure_threshold: int,
+        open_seconds: float,
+        open_max: float,
+    ):
+        self.marketplace = marketplace
+        self._interval = 1 / rate if rate > 0 else 0.0
+        self._tolerance = max(0, burst - 1) * self._interval
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._failure_threshold = failure_threshold
+        self._open_seconds = open_seconds
+        self._open_max = open_max
+        # Теоретическое время следующего запроса (GCRA)
+        self._next_slot = 0.0
+        self._not_before = 0.0
+        self._failures = 0
+        self._state = CLOSED
+        self._open_for = open_seconds
+        self._open_until = 0.0
+        self._probing = False
+        self._probe_owner: Optional[asyncio.Task] = None
+        self._probe_started = 0.0
+        self.rejected = 0
+        MARKETPLACE_CIRCUIT_STATE.set(_STATE_VALUES[CLOSED], marketplace=marketplace)
+
+    def _set_state(self, state: str):
+        self._state = state
+        MARKETPLACE_CIRCUIT_STATE.set(_STATE_VALUES[state], marketplace=self.marketplace)
+
+    def _admit_probe(self, now: float) -> Optional[bool]:
+        """Решение для открытого и полуоткрытого автомата; None — автомат закрыт."""
+        if self._state == OPEN:
+            if now < self._open_until:
+                return False
+            self._set_state(HALF_OPEN)
+            self._probing = False
+        if self._state == HALF_OPEN:
+            if self._probing:
+                if now - self._probe_started <= self._open_seconds:
+                    return False
+                print(f"{self.marketplace}: пробная проверка не завершилась за {self._open_seconds:.0f} с, новая проба")
+            # Пробная проверка идет без очереди
+            self._probing = True
+            self._probe_owner = asyncio.current_task()
+            self._probe_started = now
+            return True
+        return None
+
+    async def acquire(self) -> bool:
+        """Ждет своей очереди; False — маркетплейс недоступен, запрос выполнять не нужно."""
+        now = time.monotonic()
+        admitted = self._admit_probe(now)
+        if admitted is not None:
+            if not admitted:
+                self.rejected += 1
+            return admitted
+
+        # Резервируем слот сразу: одновременные вызовы получают разные слоты
+        slot = max(self._next_slot, now)
+        self._next_slot = slot + self._interval
+        start = max(slot - self._tolerance, self._not_before)
+        if start > now:
+            await asyncio.sleep(start - now)
+            # Пока ждали, автомат мог открыться
+            if self._state == OPEN:
+                self.rejected += 1
+                return False
+        return True
+
+    def record(self, success: bool):
+        """Учитывает результат запроса, разрешенного acquire."""
+        now = time.monotonic()
+        was_probe = self._state == HALF_OPEN and self._probing
+        if was_probe:
+            self._probing = False
+            self._probe_owner = None
+
+        if success:
+            if self._state != CLOSED:
+                print(f"✅ {self.marketplace}: маркетплейс снова отвечает, запросы возобновлены")
+            self._failures = 0
+            self._not_before = 0.0
+            self._open_for = self._open_seconds
+            self._set_state(CLOSED)
+            return
+
+        self._failures += 1
+        backoff = min(self._backoff_max, self._backoff_base * 2 ** (self._failures - 1))
+        # Половина паузы фиксирована, половина случайна: запросы не возобновляются одновременно
+        self._not_before = now + backoff / 2 + random.uniform(0, backoff / 2)
+
+        if was_probe:
+            self._open_for = min(self._open_for * 2, self._open_max)
+            self._open(now)
+        elif self._state == CLOSED and self._failures >= self._failure_threshold:
+            self._open(now)
+
+    def abandon(self):
+        """Запрос, разрешенный acquire, отменен до record: пробу текущей задачи можно повторить."""
+        if self._probing and self._probe_owner is asyncio.current_task():
+            self._probing = False
+            self._probe_owner = None
+
+    def _open(self, now: float):
+        self._open_until = now + self._open_for
+        self._set_state(OPEN)
+        print(
+            f"⛔ {self.marketplace}: {self._failures} неудач подряд, "
+            f"запросы приостановлены на {self._open_for:.0f} с"
+        )
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "state": self._state,
+            "failures": self._failures,
+            "retry_in": max(0.0, self._open_until - now) if self._state == OPEN else 0.0,
+            "rejected": self.rejected,
+        }
+
+
+_governors: dict[str, MarketplaceGovernor] = {}
+
+
+def get_governor(marketplace: str) -> MarketplaceGovernor:
+    """Возвращает ограничитель маркетплейса (один на процесс)."""
+    governor = _governors.get(marketplace)
+    if governor is None:
+        governor = _governors[marketplace] = MarketplaceGovernor(
+            marketplace,
+            settings.MARKETPLACE_RATE.get(marketplace, 0),
+            settings.MARKETPLACE_BURST,
+            settings.MARKETPLACE_BACKOFF_BASE,
+            settings.MARKETPLACE_BACKOFF_MAX,
+            settings.MARKETPLACE_CIRCUIT_FAILURES,
+            settings.MARKETPLACE_CIRCUIT_OPEN_SECONDS,
+            settings.MARKETPLACE_CIRCUIT_OPEN_MAX,
+        )
+    return governor
+
+
+def governor_stats() -> dict[str, dict]:
+    return {marketplace: governor.stats() for marketplace, governor in _governors.items()}
@@ -0,0 +1,159 @@
+import asyncio
+import html
+import json
+import re
+from typing import Any, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+
+from config import settings
+from parser.governor import MarketplaceBlocked, check_status, is_block_page
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept-Language": "ru-RU,ru;q=0.9",
+}
+
+# Состояние виджетов Ozon, встроенное в HTML страницы: <div id="state-webPrice-..." data-state='{...}'>
+OZON_STATE_RE = re.compile(r"""id="state-(web[A-Za-z]+-[^"]*)"[^>]*?data-state='([^']*)'""")
+WB_ARTICLE_RE = re.compile(r"/catalog/(\d+)")
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def _get_session() -> aiohttp.ClientSession:
+    """Возвращает общую HTTP-сессию с пулом keep-alive соединений."""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=settings.HTTP_POOL_SIZE,
+            keepalive_timeout=settings.HTTP_KEEPALIVE,
+            ttl_dns_cache=300,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            headers=HEADERS,
+            timeout=aiohttp.ClientTimeout(total=settings.HTTP_TIMEOUT),
+        )
+    return _session
+
+
+async def close_http_session():
+    """Закрывает общую HTTP-сессию."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def resolve_redirect(url: str) -> Optional[str]:
+    """Возвращает итоговый URL после HTTP-редиректов или None при ошибке."""
+    try:
+        async with _get_session().get(url, allow_redirects=True) as response:
+            return str(response.url)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Не удалось раскрыть ссылку {url}: {e}")
+        return None
+
+
+def _clean_price(price_text: Any) -> Optional[float]:
+    if price_text is None:
+        return None
+    cleaned_price = re.sub(r"[^\d]", "", str(price_text))
+    return float(cleaned_price) if cleaned_price else None
+
+
+async def get_price_http(url: str) -> Optional[Tuple[float, str, Optional[str]]]:
+    """
+    Получает цену без браузера. Возвращает None, если цену получить не удалось
+    и нужно переходить к Selenium. Выбрасывает MarketplaceBlocked, если маркетплейс
+    ответил статусом блокировки или ошибки сервера либо капчей.
+    """
+    hostname = urlparse(url).hostname or ""
+    try:
+        if "ozon.ru" in hostname:
+            return await get_ozon_price_http(url)
+        if "wildberries.ru" in hostname:
+            return await get_wb_price_http(url)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"HTTP-запрос не удался для {url}: {e}")
+    return None
+
+
+async def get_wb_price_http(url: str) -> Optional[Tuple[float, str, Optional[str]]]:
+    """Получает цену Wildberries из JSON карточки товара."""
+    match = WB_ARTICLE_RE.search(urlparse(url).path)
+    if not match:
+        return None
+
+    params = {"appkey": "1", "curr": "rub", "dest": settings.WB_DEST, "nm": match.group(1)}
+    async with _get_session().get(settings.WB_CARD_API_URL, params=params) as response:
+        check_status(response.status)
+        if response.status != 200:
+            return None
+        data = await response.json(content_type=None)
+
+    products = (data.get("data") or {}).get("products") or data.get("products") or []
+    if not products:
+        return None
+    product = products[0]
+    product_name = product.get("name")
+
+    # Цены указаны в копейках для каждого размера
+    prices = [
+        size["price"]["product"] / 100
+        for size in product.get("sizes", [])
+        if (size.get("price") or {}).get("product")
+    ]
+    if not prices:
+        if product.get("totalQuantity") == 0:
+            return -1.0, product_name, None
+        return None
+    return float(min(prices)), product_name, None
+
+
+async def get_ozon_price_http(url: str) -> Optional[Tuple[float, str, Optional[str]]]:
+    """Получает цену Ozon из состояния виджетов страницы (page JSON API)."""
+    parsed = urlparse(url)
+    page_url = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+    async with _get_session().get(settings.OZON_API_URL, params={"url": page_url}) as response:
+        check_status(response.status)
+        if response.status != 200:
+            return None
+        body = await response.text()
+
+    try:
+        widget_states = json.loads(body).get("widgetStates") or {}
+    except json.JSONDecodeError:
+        # Вместо JSON пришла HTML-страница: достаем встроенное состояние виджетов
+        widget_states = {key: html.unescape(value) for key, value in OZON_STATE_RE.findall(body)}
+        if not widget_states and is_block_page(body):
+            raise MarketplaceBlocked("капча")
+
+    return _parse_ozon_widget_states(widget_states)
+
+
+def _parse_ozon_widget_states(widget_states: dict[str, str]) -> Optional[Tuple[float, str, Optional[str]]]:
+    states = {}
+    for key, raw_state in widget_states.items():
+        widget = key.split("-", 1)[0]
+        try:
+            states.setdefault(widget, json.loads(raw_state) if isinstance(raw_state, str) else raw_state)
+        except json.JSONDecodeError:
+            continue
+
+    product_name = (states.get("webProductHeading") or {}).get("title")
+
+    if "webOutOfStock" in states:
+        return -1.0, product_name, None
+
+    price_state = states.get("webPrice") or {}
+    if price_state.get("isAvailable") is False:
+        return -1.0, product_name, None
+
+    # Цена с Ozon картой соответствует основному селектору Selenium-парсера
+    price = _clean_price(price_state.get("cardPrice")) or _clean_price(price_state.get("price"))
+    if price is None:
+        return None
+    return price, product_name, None
@@ -1,16 +1,17 @@
 import asyncio
 import re
+import sys
+import time
 from typing import Optional, Tuple
 from urllib.parse import urlparse
 
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium_stealth import stealth
-from webdriver_manager.chrome import ChromeDriverManager
+from config import settings
+from monitoring.metrics import SCRAPE_RESULTS, record_scrape
+from parser.extraction import Extractor
+from parser.governor import MarketplaceBlocked, is_block_page
+from parser.selector_stats import selector_stats
+from parser.http_fetch import get_price_http
+from storage.failure_capture import failure_captures
 
 # --- Selectors ---
 
@@ -44,23 +45,35 @@ WB_SELECTORS = {
     "sold_out_css": "h2[class*='soldOutProduct']",
 }
 
+# Элемент, после появления которого страницу можно разбирать: (способ поиска Selenium, селектор).
+# Ozon — цена (по символу ₽) или сообщение "товар закончился", WB — название (оно есть всегда)
+PAGE_READY = {
+    "ozon": ("xpath", f"//span[contains(text(), '₽')] | //h2[contains(@class, '{OZON_SELECTORS['sold_out_css'].split('.')[1]}')]"),
+    "wb": ("css selector", WB_SELECTORS["name_css"]),
+}
 
-def _get_selenium_driver():
-    """Настраивает и возвращает экземпляр драйвера Selenium."""
-    options = webdriver.ChromeOptions()
-    options.add_argument("--headless=new")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument(
-        "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    )
-    options.add_argument("--disable-blink-features=AutomationControlled")
-    options.add_argument("--window-size=1920,1080")
-    options.add_argument("--lang=ru-RU")
-    options.add_experimental_option("excludeSwitches", ["enable-automation"])
-    options.add_experimental_option("useAutomationExtension", False)
-    service = ChromeService(ChromeDriverManager().install())
-    return webdriver.Chrome(service=service, options=options)
+# Свободные экземпляры Chrome по маркетплейсам (см. _selenium_slot)
+_selenium_slots: dict[str, asyncio.Semaphore] = {}
+
+# Скомпилированные наборы селекторов: страница разбирается один раз
+OZON_EXTRACTOR = Extractor(
+    name=[OZON_SELECTORS["name_css"]],
+    price=OZON_SELECTORS["price_xpaths"] + OZON_SELECTORS["price_css"],
+    sold_out=[OZON_SELECTORS["sold_out_css"]],
+    price_marker="₽",
+    stats=selector_stats,
+    stats_key="ozon",
+)
+
+WB_EXTRACTOR = Extractor(
+    name=[WB_SELECTORS["name_css"]],
+    price=[WB_SELECTORS["price_css"]],
+    promo_price=[WB_SELECTORS["promo_price_css"]],
+    promo_timer=[WB_SELECTORS["promo_timer_css"]],
+    sold_out=[WB_SELECTORS["sold_out_css"]],
+    stats=selector_stats,
+    stats_key="wb",
+)
 
 
 def _clean_price(price_text: str) -> Optional[float]:
@@ -71,107 +84,190 @@ def _clean_price(price_text: str) -> Optional[float]:
     return float(cleaned_price) if cleaned_price else None
 
 
-def _get_product_name_bs(page_source: str, selector: str) -> Optional[str]:
-    """Извлекает название продукта с помощью BeautifulSoup."""
-    soup = BeautifulSoup(page_source, "html.parser")
-    name_element = soup.select_one(selector)
-    return name_element.text.strip() if name_element else None
+def parse_ozon_page(page_source: str) -> Tuple[Optional[float], Optional[str], Optional[str]]:
+    """
+    Извлекает цену и название из HTML страницы Ozon.
+    Возвращает (цена, название, HTML при неудаче); цена -1 означает "нет в наличии".
+    """
+    extraction = OZON_EXTRACTOR.extract(page_source)
 
+    # Проверяем, нет ли товара в наличии
+    if extraction.sold_out_text and "товар закончился" in extraction.sold_out_text.lower():
+        return -1.0, extraction.name, None
 
-async def get_price(url: str) -> Optional[Tuple[float, str, Optional[str]]]:
+    if extraction.price_text:
+        return _clean_price(extraction.price_text), extraction.name, None
+    return None, extraction.name, page_source
+
+
+def parse_wb_page(page_source: str) -> Tuple[Optional[float], Optional[str], Optional[str], Optional[str]]:
     """
-    Асинхронно получает цену, название товара и информацию об акции, определяя сайт по URL.
+    Извлекает цену, название и информацию об акции из HTML страницы Wildberries.
+    Возвращает (цена, название, текст акции, HTML при неудаче).
     """
+    extraction = WB_EXTRACTOR.extract(page_source)
+
+    # 1. Проверяем акционную цену (ins)
+    if extraction.promo_price_text:
+        promo_text = None
+        # Если есть акционная цена, ищем таймер
+        if extraction.promo_timer_text:
+            promo_text = f"Товар по акции. Срок действия цены ограничен. Осталось {extraction.promo_timer_text}"
+        return _clean_price(extraction.promo_price_text), extraction.name, promo_text, None
+
+    # Проверяем наличие цены
+    if extraction.price_text:
+        return _clean_price(extraction.price_text), extraction.name, None, None
+
+    # Проверяем, нет ли товара в наличии
+    if extraction.sold_out_text:
+        return -1.0, extraction.name, None, None
+
+    return None, extraction.name, None, page_source
+
+
+def get_marketplace(url: str) -> Optional[str]:
+    """Определяет маркетплейс по URL: 'ozon', 'wb' или None."""
     hostname = urlparse(url).hostname
     if not hostname:
+        return None
+    if "ozon.ru" in hostname:
+        return "ozon"
+    if "wildberries.ru" in hostname:
+        return "wb"
+    return None
+
+
+def wait_for_page(driver, marketplace: str, timeout: float):
+    """Ждет, пока на странице появится элемент PAGE_READY маркетплейса."""
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    WebDriverWait(driver, timeout).until(EC.presence_of_element_located(PAGE_READY[marketplace]))
+
+
+def init_browser():
+    """
+    Готовит пулы Chrome (сами экземпляры запускаются при первой проверке через браузер).
+    Selenium и webdriver-manager импортируются только здесь и при первой такой проверке,
+    чтобы не замедлять запуск бота.
+    """
+    from parser.driver_pool import init_driver_pool
+
+    init_driver_pool()
+
+
+async def warm_up_browser():
+    """Готовит пулы Chrome в фоне, не задерживая запуск бота или воркера."""
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, init_browser)
+        print("Пулы драйверов подготовлены.")
+    except Exception as e:
+        # Пулы создадутся заново при первой проверке через браузер
+        print(f"Не удалось подготовить Chrome заранее: {e}")
+
+
+def shutdown_browser():
+    """Закрывает пул Chrome, если браузер запускался."""
+    if "parser.driver_pool" in sys.modules:
+        from parser.driver_pool import shutdown_driver_pool
+
+        shutdown_driver_pool()
+
+
+async def get_price(url: str) -> Optional[Tuple[float, str, Optional[str]]]:
+    """
+    Асинхронно получает цену, название товара и информацию об акции, определяя сайт по URL.
+    Сначала пробует быстрый HTTP-запрос без браузера, затем Selenium.
+    Выбрасывает MarketplaceBlocked, если маркетплейс отказал в доступе и цену
+    не удалось получить и через браузер.
+    """
+    marketplace = get_marketplace(url)
+    if marketplace is None:
+        print(f"Сайт не поддерживается: {urlparse(url).hostname}")
         return None, None, None
 
-    if "ozon.ru" in hostname:
-        return await get_ozon_price(url)
-    elif "wildberries.ru" in hostname:
-        return await get_wb_price(url)
+    started = time.perf_counter()
+    blocked = None
+    try:
+        result = await get_price_http(url)
+    except MarketplaceBlocked as e:
+        SCRAPE_RESULTS.inc(marketplace=marketplace, path="http", outcome="blocked")
+        result, blocked = None, e
     else:
-        print(f"Сайт не поддерживается: {hostname}")
+        record_scrape(marketplace, "http", result[0] if result is not None else None, started)
+    if result is not None:
+        return result
+    if not settings.SELENIUM_FALLBACK:
+        if blocked is not None:
+            raise blocked
         return None, None, None
 
+    async with _selenium_slot(marketplace):
+        started = time.perf_counter()
+        try:
+            if marketplace == "ozon":
+                result = await get_ozon_price(url)
+            else:
+                result = await get_wb_price(url)
+        except MarketplaceBlocked:
+            SCRAPE_RESULTS.inc(marketplace=marketplace, path="selenium", outcome="blocked")
+            raise
+        except Exception:
+            SCRAPE_RESULTS.inc(marketplace=marketplace, path="selenium", outcome="error")
+            raise
+    record_scrape(marketplace, "selenium", result[0], started)
+    if result[0] is None and blocked is not None:
+        raise blocked
+    return result
+
+
+def _selenium_slot(marketplace: str) -> asyncio.Semaphore:
+    """Проверки через Chrome ограничены размером пула драйверов маркетплейса, HTTP-запросы — нет."""
+    slot = _selenium_slots.get(marketplace)
+    if slot is None:
+        slot = _selenium_slots[marketplace] = asyncio.Semaphore(settings.DRIVER_POOL_SIZES.get(marketplace, 1))
+    return slot
+
+
+async def _capture_failure(marketplace: str, title: str, url: str, page_source: str):
+    """Сохраняет снимок страницы без цены; страница капчи дополнительно выбрасывает MarketplaceBlocked."""
+    path = await failure_captures.capture(marketplace, url, page_source)
+    if path:
+        print(f"❌ Цена {title} не найдена. Снимок страницы сохранен в '{path}'.")
+    else:
+        print(f"❌ Цена {title} не найдена: {url} (снимок пропущен)")
+    if is_block_page(page_source):
+        raise MarketplaceBlocked("капча")
+
 
 async def get_ozon_price(url: str) -> Optional[Tuple[float, str, Optional[str]]]:
     """Асинхронно получает цену и название товара со страницы Ozon."""
     loop = asyncio.get_running_loop()
 
     def scrape():
-        price_text = None
-        product_name = None
-        driver = _get_selenium_driver()
-        try:
-            stealth(
-                driver,
-                languages=["ru-RU", "ru"],
-                vendor="Google Inc.",
-                platform="Win32",
-                webgl_vendor="Intel Inc.",
-                renderer="Intel Iris OpenGL Engine",
-                fix_hairline=True,
-            )
-            driver.get(url)
-            wait = WebDriverWait(driver, 15)
-            # Ждем появления цены (по символу ₽) или сообщения "товар закончился"
-            wait.until(
-                EC.presence_of_element_located((By.XPATH, f"//span[contains(text(), '₽')] | //h2[contains(@class, '{OZON_SELECTORS['sold_out_css'].split('.')[1]}')]"))
-            )
-
-            page_source = driver.page_source
-            soup = BeautifulSoup(page_source, "html.parser")
-
-            product_name = _get_product_name_bs(page_source, OZON_SELECTORS["name_css"])
+        from selenium.common.exceptions import TimeoutException
 
-            # Проверяем, нет ли товара в наличии
-            sold_out_element = soup.select_one(OZON_SELECTORS["sold_out_css"])
-            if sold_out_element and "товар закончился" in sold_out_element.text.lower():
-                return -1.0, product_name, None
+        from parser.driver_pool import get_driver_pool
 
-            # Поиск цены по XPath
-            for xpath in OZON_SELECTORS["price_xpaths"]:
-                try:
-                    elements = driver.find_elements(By.XPATH, xpath)
-                    for element in elements:
-                        if element.text and "₽" in element.text:
-                            price_text = element.text
-                            break
-                except Exception:
-                    continue
-                if price_text:
-                    break
-            
-            # Поиск цены по CSS, если XPath не сработал
-            if not price_text:
-                for selector in OZON_SELECTORS["price_css"]:
-                    try:
-                        elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                        for element in elements:
-                            if element.text and "₽" in element.text:
-                                price_text = element.text
-                                break
-                    except Exception:
-                        continue
-                    if price_text:
-                        break
-            
-            if price_text:
-                return _clean_price(price_text), product_name, None
-            else:
-                return None, product_name, driver.page_source
+        pool = get_driver_pool("ozon")
+        with pool.driver() as driver:
+            driver.get(url)
+            # Ждем появления цены (по символу ₽) или сообщения "товар закончился";
+            # если не дождались, разбираем то, что есть: это может быть капча или удаленный товар
+            try:
+                wait_for_page(driver, "ozon", pool.policy.wait_timeout)
+            except TimeoutException:
+                pass
+            page_source = driver.page_source
 
-        finally:
-            driver.quit()
+        return parse_ozon_page(page_source)
 
     price, product_name, page_source_on_failure = await loop.run_in_executor(None, scrape)
     
     if page_source_on_failure:
-        debug_path = "ozon_page_source.html"
-        with open(debug_path, "w", encoding="utf-8") as f:
-            f.write(page_source_on_failure)
-        print(f"❌ Цена Ozon не найдена. HTML сохранен в '{debug_path}'.")
+        await _capture_failure("ozon", "Ozon", url, page_source_on_failure)
 
     return price, product_name, None
 
@@ -181,56 +277,32 @@ async def get_wb_price(url: str) -> Optional[Tuple[float, str, Optional[str]]]:
     loop = asyncio.get_running_loop()
 
     def scrape():
-        driver = _get_selenium_driver()
-        try:
-            stealth(driver, languages=["ru-RU", "ru"], vendor="Google Inc.", platform="Win32")
-            driver.get(url)
-            wait = WebDriverWait(driver, 15)
-            
-            # Ждем появления названия (оно должно быть всегда)
-            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, WB_SELECTORS["name_css"])))
+        from selenium.common.exceptions import TimeoutException, WebDriverException
 
-            page_source = driver.page_source
-            soup = BeautifulSoup(page_source, "html.parser")
-
-            name_element = soup.select_one(WB_SELECTORS["name_css"])
-            product_name = name_element.text.strip() if name_element else None
-
-            # 1. Проверяем акционную цену (ins)
-            promo_price_element = soup.select_one(WB_SELECTORS["promo_price_css"])
-            if promo_price_element:
-                price = _clean_price(promo_price_element.text)
-                promo_text = None
-                # Если есть акционная цена, ищем таймер
-                timer_element = soup.select_one(WB_SELECTORS["promo_timer_css"])
-                if timer_element:
-                    promo_text = f"Товар по акции. Срок действия цены ограничен. Осталось {timer_element.text.strip()}"
-                return price, product_name, promo_text, None
-
-            # Проверяем наличие цены
-            price_element = soup.select_one(WB_SELECTORS["price_css"])
-            if price_element:
-                return _clean_price(price_element.text), product_name, None, None
-
-            # Проверяем, нет ли товара в наличии
-            sold_out_element = soup.select_one(WB_SELECTORS["sold_out_css"])
-            if sold_out_element:
-                return -1.0, product_name, None, None
-
-            return None, product_name, None, driver.page_source
-        
-        except Exception as e:
-            print(f"Ошибка при парсинге WB {url}: {e}")
-            return None, None, None, driver.page_source
-        finally:
-            driver.quit()
+        from parser.driver_pool import get_driver_pool
+
+        pool = get_driver_pool("wb")
+        with pool.driver() as driver:
+            try:
+                driver.get(url)
+                # Ждем появления названия (оно должно быть всегда); если не дождались,
+                # разбираем то, что есть: это может быть капча или удаленный товар
+                try:
+                    wait_for_page(driver, "wb", pool.policy.wait_timeout)
+                except TimeoutException:
+                    pass
+                page_source = driver.page_source
+            except WebDriverException as e:
+                # Драйвер мог упасть: страницу из него не читаем, а сам он будет перезапущен
+                print(f"Ошибка при парсинге WB {url}: {e}")
+                pool.mark_broken(driver)
+                return None, None, None, None
+
+        return parse_wb_page(page_source)
 
     price, product_name, promo_text, page_source_on_failure = await loop.run_in_executor(None, scrape)
 
     if page_source_on_failure:
-        debug_path = "wb_page_source.html"
-        with open(debug_path, "w", encoding="utf-8") as f:
-            f.write(page_source_on_failure)
-        print(f"❌ Цена WB не найдена. HTML сохранен в '{debug_path}'.")
+        await _capture_failure("wb", "WB", url, page_source_on_failure)
 
     return price, product_name, promo_text
\ No newline at end of file
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import time
+from typing import Iterable, Optional
+
+from config import settings
+
+
+class SelectorStats:
+    """
+    Статистика срабатываний селекторов цены по маркетплейсам.
+
+    Порядок селекторов для очередной страницы: сначала те, что находили цену
+    за последние cold_hours ("теплые"), по убыванию недавних побед — счета wins,
+    затухающего вдвое за каждые cold_hours, затем остальные в исходном порядке.
+    Две группы оставлены намеренно: холодный селектор с большим накопленным
+    счетом не должен опережать тот, что находит цену сейчас. Исходный порядок
+    по-прежнему задает приоритет при полной проверке.
+    Селекторы без срабатываний dead_days дней отмечаются как мертвые и не
+    проверяются, пока страница разбирается другими. Каждая full_check_every-я
+    страница проверяется всеми селекторами по отдельности, чтобы статистика
+    не зависела от порядка и вернувшиеся селекторы снова стали теплыми.
+
+    Статистика хранится в JSON-файле (load/save) и сохраняется не чаще
+    save_interval секунд. Разбор страниц идет в пуле потоков, поэтому методы
+    защищены блокировкой.
+    """
+
+    def __init__(self, cold_hours: float, dead_days: float, full_check_every: int, save_interval: float):
+        self._cold_after = cold_hours * 3600
+        self._half_life = max(cold_hours * 3600, 1.0)
+        self._dead_after = dead_days * 86400
+        self._dead_days = dead_days
+        self._full_check_every = max(1, full_check_every)
+        self._save_interval = save_interval
+        # marketplace -> selector -> {"hits", "wins", "score", "scored_at", "last_hit", "first_seen"}
+        self._entries: dict[str, dict[str, dict]] = {}
+        self._pages: dict[str, int] = {}
+        self._flagged: set[tuple[str, str]] = set()
+        self._path: Optional[str] = None
+        self._saved_at = 0.0
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def load(self, path: str):
+        """Загружает статистику из файла и включает ее сохранение в этот файл."""
+        with self._lock:
+            self._path = path
+            if not os.path.exists(path):
+                return
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Не удалось загрузить статистику селекторов из {path}: {e}")
+                return
+            now = time.time()
+            self._flagged = {
+                (marketplace, selector)
+                for marketplace, entries in self._entries.items()
+                for selector, entry in entries.items()
+                if self._is_dead(entry, now)
+            }
+
+    def save(self):
+        """Записывает статистику в файл, если она менялась."""
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        if self._path is None or not self._dirty:
+            return
+        tmp_path = f"{self._path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            print(f"Не удалось сохранить статистику селекторов: {e}")
+            return
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _entry(self, marketplace: str, selector: str, now: float) -> dict:
+        entries = self._entries.setdefault(marketplace, {})
+        entry = entries.get(selector)
+        if entry is None:
+            entry = entries[selector] = {"hits": 0, "wins": 0, "last_hit": None, "first_seen": now}
+            self._dirty = True
+        return entry
+
+    def _idle(self, entry: dict, now: float) -> float:
+        return now - (entry["last_hit"] or entry["first_seen"])
+
+    def _is_dead(self, entry: dict, now: float) -> bool:
+        return self._idle(entry, now) > self._dead_after
+
+    def _score(self, entry: dict, now: float) -> float:
+        # Записи старого формата без "score" начинают с накопленных wins
+        score = entry.get("score", entry["wins"])
+        scored_at = entry.get("scored_at") or entry["last_hit"] or entry["first_seen"]
+        return score * 0.5 ** (max(now - scored_at, 0.0) / self._half_life)
+
+    def plan(self, marketplace: str, selectors: list[str]) -> tuple[list[str], list[str], bool]:
+        """
+        Возвращает (порядок проверки, мертвые селекторы, проверить ли все по отдельности)
+        для очередной страницы маркетплейса.
+        """
+        now = time.time()
+        with self._lock:
+            page = self._pages[marketplace] = self._pages.get(marketplace, 0) + 1
+            warm, cold, dead = [], [], []
+            for selector in selectors:
+                entry = self._entry(marketplace, selector, now)
+                idle = self._idle(entry, now)
+                if idle > self._dead_after:
+                    dead.append(selector)
+                    if (marketplace, selector) not in self._flagged:
+                        self._flagged.add((marketplace, selector))
+                        print(f"⚠️ Селектор цены {marketplace} не срабатывал {self._dead_days:g} дн. и отключен: {selector}")
+                elif idle > self._cold_after:
+                    cold.append(selector)
+                else:
+                    warm.append((-self._score(entry, now), selector))
+        # sort стабилен по ключу, при равном счете сохраняется исходный порядок
+        warm.sort(key=lambda item: item[0])
+        return [selector for _, selector in warm] + cold, dead, page % self._full_check_every == 0
+
+    def record(self, marketplace: str, matched: Iterable[str], winner: Optional[str]):
+        """Учитывает селекторы, нашедшие цену на странице, и тот, чей результат использован."""
+        now = time.time()
+        with self._lock:
+            for selector in matched:
+                entry = self._entry(marketplace, selector, now)
+                entry["hits"] += 1
+                entry["last_hit"] = now
+                if (marketplace, selector) in self._flagged:
+                    self._flagged.discard((marketplace, selector))
+                    print(f"Селектор цены {marketplace} снова находит цену: {selector}")
+            if winner is not None:
+                entry = self._entry(marketplace, winner, now)
+                entry["score"] = self._score(entry, now) + 1
+                entry["scored_at"] = now
+                entry["wins"] += 1
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= self._save_interval:
+                self._save_locked()
+
+    def dead(self) -> list[tuple[str, str, float]]:
+        """Мертвые селекторы: (маркетплейс, селектор, дней без срабатываний)."""
+        now = time.time()
+        with self._lock:
+            return [
+                (marketplace, selector, self._idle(entry, now) / 86400)
+                for marketplace, entries in self._entries.items()
+                for selector, entry in entries.items()
+                if self._is_dead(entry, now)
+            ]
+
+
+selector_stats = SelectorStats(
+    settings.SELECTOR_COLD_HOURS,
+    settings.SELECTOR_DEAD_DAYS,
+    settings.SELECTOR_FULL_CHECK_EVERY,
+    settings.SELECTOR_STATS_SAVE_INTERVAL,
+)
@@ -0,0 +1,84 @@
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlparse
+
+from parser.http_fetch import resolve_redirect
+
+SUPPORTED_HOSTS = {
+    "ozon.ru": "ozon",
+    "www.ozon.ru": "ozon",
+    "m.ozon.ru": "ozon",
+    "wildberries.ru": "wb",
+    "www.wildberries.ru": "wb",
+    "m.wildberries.ru": "wb",
+}
+
+# /product/nazvanie-tovara-123456789/ или /product/123456789/
+OZON_PRODUCT_RE = re.compile(r"^/product/(?:[^/]*-)?(\d+)/?")
+# Короткие ссылки из приложения: /t/AbC123
+OZON_SHORT_LINK_RE = re.compile(r"^/t/[^/]+/?$")
+WB_CATALOG_RE = re.compile(r"^/catalog/(\d+)(?:/|$)")
+
+CANONICAL_URLS = {
+    "ozon": "https://www.ozon.ru/product/{sku}/",
+    "wb": "https://www.wildberries.ru/catalog/{sku}/detail.aspx",
+}
+
+_SHORT_LINK_CACHE_SIZE = 10000
+# Короткая ссылка -> итоговый URL после редиректов
+_short_links: "OrderedDict[str, str]" = OrderedDict()
+
+
+@dataclass(frozen=True)
+class ProductKey:
+    marketplace: str
+    sku: str
+    url: str
+
+
+def canonicalize_url(url: str) -> Optional[ProductKey]:
+    """
+    Приводит ссылку на товар к каноническому виду без сетевых запросов:
+    убирает параметры отслеживания и варианты хоста (m., www.).
+    Возвращает None, если артикул не удалось определить (например, короткая ссылка).
+    """
+    parsed = urlparse(url)
+    marketplace = SUPPORTED_HOSTS.get((parsed.hostname or "").lower())
+    if marketplace is None:
+        return None
+
+    pattern = OZON_PRODUCT_RE if marketplace == "ozon" else WB_CATALOG_RE
+    match = pattern.match(parsed.path)
+    if not match:
+        return None
+    sku = match.group(1)
+    return ProductKey(marketplace, sku, CANONICAL_URLS[marketplace].format(sku=sku))
+
+
+def is_short_link(url: str) -> bool:
+    parsed = urlparse(url)
+    return SUPPORTED_HOSTS.get((parsed.hostname or "").lower()) == "ozon" and bool(OZON_SHORT_LINK_RE.match(parsed.path))
+
+
+async def resolve_product_url(url: str) -> Optional[ProductKey]:
+    """
+    Приводит ссылку к каноническому виду; короткие ссылки раскрываются
+    один раз через HTTP-редирект, результат кэшируется.
+    """
+    key = canonicalize_url(url)
+    if key is not None or not is_short_link(url):
+        return key
+
+    resolved = _short_links.get(url)
+    if resolved is None:
+        resolved = await resolve_redirect(url)
+        if resolved is None:
+            return None
+        _short_links[url] = resolved
+        while len(_short_links) > _SHORT_LINK_CACHE_SIZE:
+            _short_links.popitem(last=False)
+    else:
+        _short_links.move_to_end(url)
+    return canonicalize_url(resolved)
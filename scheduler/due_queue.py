@@ -0,0 +1,110 @@
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+from typing import Optional
+
+from config import settings
+from monitoring.metrics import SCHEDULER_LAG
+
+
+class UserSchedule:
+    """
+    Время следующей проверки для каждого пользователя в виде min-кучи.
+
+    Планировщик спит до ближайшего времени, а обработчики бота обновляют
+    расписание точечно (новый товар, новый интервал) и будят его.
+    Устаревшие записи кучи не удаляются сразу, а пропускаются при извлечении.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[datetime, int]] = []
+        self._due: dict[int, datetime] = {}
+        self._intervals: dict[int, int] = {}
+        self._last_checks: dict[int, datetime] = {}
+        self._changed = asyncio.Event()
+
+    def _interval(self, user_id: int) -> timedelta:
+        minutes = self._intervals.get(user_id) or settings.PRICE_CHECK_INTERVAL // 60
+        return timedelta(minutes=minutes)
+
+    def _push(self, user_id: int, due_at: datetime):
+        self._due[user_id] = due_at
+        heapq.heappush(self._heap, (due_at, user_id))
+        self._changed.set()
+
+    def load(self, user_ids: set[int], all_settings: dict):
+        """Заполняет расписание при запуске по сохраненным интервалам и времени проверки."""
+        now = datetime.now()
+        for user_id in user_ids:
+            user_data = all_settings.get(user_id, {})
+            if user_data.get("check_interval"):
+                self._intervals[user_id] = user_data["check_interval"]
+            last_check = user_data.get("last_check")
+            if isinstance(last_check, str):
+                try:
+                    last_check = datetime.fromisoformat(last_check)
+                except ValueError as e:
+                    print(f"Ошибка даты для {user_id}: {e}")
+                    last_check = None
+            if last_check is None:
+                self._push(user_id, now)
+            else:
+                self._last_checks[user_id] = last_check
+                self._push(user_id, last_check + self._interval(user_id))
+
+    def ensure_scheduled(self, user_id: int):
+        """Добавляет пользователя в расписание, если его там еще нет (например, первый товар)."""
+        if user_id not in self._due:
+            last_check = self._last_checks.get(user_id, datetime.now())
+            self._push(user_id, last_check + self._interval(user_id))
+
+    def set_interval(self, user_id: int, minutes: int):
+        """Меняет интервал и пересчитывает время следующей проверки."""
+        self._intervals[user_id] = minutes
+        if user_id in self._due:
+            last_check = self._last_checks.get(user_id, datetime.now())
+            self._push(user_id, last_check + self._interval(user_id))
+
+    def mark_checked(self, user_id: int, checked_at: datetime):
+        """Записывает время проверки и планирует следующую."""
+        self._last_checks[user_id] = checked_at
+        self._push(user_id, checked_at + self._interval(user_id))
+
+    def remove(self, user_id: int):
+        """Убирает пользователя из расписания (например, у него не осталось товаров)."""
+        self._due.pop(user_id, None)
+
+    def _drop_stale(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_due(self) -> Optional[datetime]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> list[int]:
+        """Извлекает всех пользователей, у которых подошло время проверки."""
+        due_users = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due_users
+            due_at, user_id = heapq.heappop(self._heap)
+            del self._due[user_id]
+            SCHEDULER_LAG.observe((now - due_at).total_seconds())
+            due_users.append(user_id)
+
+    async def wait(self, timeout: Optional[float] = None):
+        """Ждет ближайшей проверки, изменения расписания или истечения timeout."""
+        next_due = self.next_due()
+        if next_due is not None:
+            until_due = max((next_due - datetime.now()).total_seconds(), 0)
+            timeout = until_due if timeout is None else min(timeout, until_due)
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+user_schedule = UserSchedule()
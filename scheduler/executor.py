@@ -0,0 +1,164 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+from config import settings
+from monitoring.metrics import SCRAPE_QUEUE_WAIT, SCRAPE_RESULTS
+from parser.governor import MarketplaceBlocked, get_governor
+from parser.price_parser import get_marketplace, get_price
+
+# Приоритеты заданий: ответы пользователю обрабатываются раньше фоновых проверок
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    url: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+
+
+class ScrapeExecutor:
+    """
+    Очередь заданий на получение цен с общим ограничением параллельности
+    и отдельными ограничениями для каждого маркетплейса.
+
+    Перед тем как занять общий слот, задание проходит ограничитель своего
+    маркетплейса (частота, пауза после неудач, автомат защиты): пауза одного
+    маркетплейса не задерживает проверки другого. При открытом автомате
+    или отказе маркетплейса в доступе (MarketplaceBlocked) результат пустой.
+    """
+
+    def __init__(self, concurrency: int, marketplace_limits: dict[str, int]):
+        self._global = asyncio.Semaphore(concurrency)
+        self._limits = marketplace_limits
+        self._queues: dict[str, asyncio.PriorityQueue] = {
+            marketplace: asyncio.PriorityQueue() for marketplace in marketplace_limits
+        }
+        self._seq = itertools.count()
+        self._workers: list[asyncio.Task] = []
+        self._running = {marketplace: 0 for marketplace in marketplace_limits}
+        # Время ожидания в очереди для последних заданий (секунды)
+        self._wait_times: deque[float] = deque(maxlen=1000)
+
+    def start(self):
+        for marketplace, limit in self._limits.items():
+            for _ in range(limit):
+                self._workers.append(asyncio.create_task(self._worker(marketplace)))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        for queue in self._queues.values():
+            while not queue.empty():
+                job = queue.get_nowait()
+                if not job.future.done():
+                    job.future.cancel()
+
+    async def submit(self, url: str, priority: int = PRIORITY_BULK) -> Optional[Tuple[float, str, Optional[str]]]:
+        """Ставит URL в очередь и дожидается результата get_price."""
+        marketplace = get_marketplace(url)
+        if marketplace not in self._queues:
+            # Неподдерживаемый сайт: get_price сразу вернет пустой результат
+            return await get_price(url)
+
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(priority, next(self._seq), url, future, time.monotonic())
+        await self._queues[marketplace].put(job)
+        return await future
+
+    async def _worker(self, marketplace: str):
+        queue = self._queues[marketplace]
+        governor = get_governor(marketplace)
+        while True:
+            job = await queue.get()
+            try:
+                if job.future.done():
+                    continue
+                if not await governor.acquire():
+                    SCRAPE_RESULTS.inc(marketplace=marketplace, path="governor", outcome="rejected")
+                    if not job.future.done():
+                        job.future.set_result((None, None, None))
+                    continue
+                async with self._global:
+                    wait_time = time.monotonic() - job.enqueued_at
+                    self._wait_times.append(wait_time)
+                    SCRAPE_QUEUE_WAIT.observe(wait_time, marketplace=marketplace)
+                    self._running[marketplace] += 1
+                    try:
+                        result = await get_price(job.url)
+                    except MarketplaceBlocked as e:
+                        # Для вызывающего это просто отсутствие цены
+                        print(f"{marketplace}: доступ ограничен ({e}) для {job.url}")
+                        governor.record(False)
+                        if not job.future.done():
+                            job.future.set_result((None, None, None))
+                    except Exception as e:
+                        governor.record(False)
+                        if not job.future.done():
+                            job.future.set_exception(e)
+                    else:
+                        governor.record(True)
+                        if not job.future.done():
+                            job.future.set_result(result)
+                    finally:
+                        self._running[marketplace] -= 1
+            except asyncio.CancelledError:
+                # Исполнитель остановлен посреди задания (в том числе во время паузы ограничителя);
+                # прерванная пробная проверка не должна оставить автомат полуоткрытым навсегда
+                governor.abandon()
+                job.future.cancel()
+                raise
+            finally:
+                queue.task_done()
+
+    def stats(self) -> dict:
+        """Глубина очередей, число выполняемых заданий и время ожидания."""
+        waits = list(self._wait_times)
+        return {
+            "queued": {marketplace: queue.qsize() for marketplace, queue in self._queues.items()},
+            "running": dict(self._running),
+            "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+            "wait_max": max(waits) if waits else 0.0,
+        }
+
+
+_executor: Optional[ScrapeExecutor] = None
+
+
+def start_executor(backend: Optional[str] = None) -> ScrapeExecutor:
+    """
+    Создает и запускает глобальный исполнитель заданий: локальный или очередь
+    в Redis (SCRAPE_BACKEND) с тем же интерфейсом.
+    """
+    global _executor
+    if _executor is None:
+        if (backend or settings.SCRAPE_BACKEND) == "redis":
+            from scheduler.redis_queue import RedisScrapeQueue, create_redis
+
+            _executor = RedisScrapeQueue(create_redis(), settings.SCRAPE_JOB_TIMEOUT)
+        else:
+            _executor = ScrapeExecutor(settings.SCRAPE_CONCURRENCY, settings.SCRAPE_MARKETPLACE_LIMITS)
+        _executor.start()
+    return _executor
+
+
+def get_executor() -> ScrapeExecutor:
+    """Возвращает глобальный исполнитель, запуская его при первом обращении."""
+    return _executor or start_executor()
+
+
+async def stop_executor():
+    """Останавливает глобальный исполнитель и отменяет ожидающие задания."""
+    global _executor
+    executor, _executor = _executor, None
+    if executor is not None:
+        await executor.stop()
@@ -0,0 +1,48 @@
+import asyncio
+from typing import Optional, Tuple
+
+from parser.url_canon import canonicalize_url
+from scheduler.executor import PRIORITY_BULK, get_executor
+from storage.price_cache import price_cache
+
+# URL -> задача, которая сейчас получает цену для этого URL
+_in_flight: dict[str, asyncio.Future] = {}
+
+
+async def fetch_price(url: str, priority: int = PRIORITY_BULK) -> Optional[Tuple[float, str, Optional[str]]]:
+    """
+    Получает цену товара, объединяя одновременные запросы одного и того же URL.
+
+    Если для URL уже выполняется запрос, новый вызывающий дожидается его результата
+    вместо запуска еще одного браузера. Отмена одного ожидающего не отменяет запрос
+    для остальных. Сам запрос выполняется через общую очередь исполнителя,
+    а успешный результат сохраняется в общий кэш цен.
+    Ключом служит канонический URL товара.
+    """
+    url = _canonical(url)
+    future = _in_flight.get(url)
+    if future is None:
+        future = asyncio.ensure_future(_fetch_and_cache(url, priority))
+        _in_flight[url] = future
+        future.add_done_callback(lambda f: _forget(url, f))
+    return await asyncio.shield(future)
+
+
+def _canonical(url: str) -> str:
+    key = canonicalize_url(url)
+    return key.url if key else url
+
+
+async def _fetch_and_cache(url: str, priority: int) -> Optional[Tuple[float, str, Optional[str]]]:
+    result = await get_executor().submit(url, priority)
+    price, product_name, promo_text = result
+    if price is not None:
+        price_cache.put(url, price, product_name, promo_text)
+    return result
+
+
+def _forget(url: str, future: asyncio.Future):
+    _in_flight.pop(url, None)
+    # Забираем исключение, чтобы asyncio не ругался, если все ожидающие отменены
+    if not future.cancelled():
+        future.exception()
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import deque
+from typing import Optional, Tuple
+
+import redis.asyncio as redis
+
+from config import settings
+from monitoring.metrics import SCRAPE_QUEUE_WAIT
+from parser.price_parser import get_marketplace
+from scheduler.executor import PRIORITY_BULK, PRIORITY_INTERACTIVE, ScrapeExecutor
+
+# Очереди заданий по приоритетам: воркер забирает задания из первой непустой
+JOB_QUEUES = {
+    PRIORITY_INTERACTIVE: f"{settings.SCRAPE_QUEUE_PREFIX}:jobs:interactive",
+    PRIORITY_BULK: f"{settings.SCRAPE_QUEUE_PREFIX}:jobs:bulk",
+}
+# Сколько секунд блокироваться в BRPOP, прежде чем проверить остановку
+_POLL_TIMEOUT = 1
+
+
+def create_redis() -> redis.Redis:
+    return redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+
+
+class RedisScrapeQueue:
+    """
+    Очередь заданий на получение цен через Redis (SCRAPE_BACKEND=redis).
+
+    Заменяет ScrapeExecutor в процессе бота с тем же интерфейсом: submit кладет
+    задание в список Redis по приоритету (LPUSH), воркеры (worker.py) забирают
+    их (BRPOP), выполняют get_price и кладут результат в список ответов этого
+    процесса бота. Фоновая задача читает ответы и завершает ожидающие future.
+    Если ответ не пришел за SCRAPE_JOB_TIMEOUT секунд, результат пустой,
+    а воркеры пропускают задания с истекшим сроком.
+    """
+
+    def __init__(self, client: redis.Redis, job_timeout: float):
+        self._redis = client
+        self._job_timeout = job_timeout
+        self._reply_to = f"{settings.SCRAPE_QUEUE_PREFIX}:results:{uuid.uuid4().hex}"
+        self._pending: dict[str, tuple[asyncio.Future, str, float]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._wait_times: deque[float] = deque(maxlen=1000)
+
+    def start(self):
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        for future, _, _ in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+        await self._redis.delete(self._reply_to)
+        await self._redis.aclose()
+
+    async def submit(self, url: str, priority: int = PRIORITY_BULK) -> Optional[Tuple[float, str, Optional[str]]]:
+        """Отправляет URL воркерам и дожидается результата get_price."""
+        job_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending[job_id] = (future, get_marketplace(url) or "other", time.monotonic())
+        job = {
+            "id": job_id,
+            "url": url,
+            "priority": priority,
+            "reply_to": self._reply_to,
+            # Абсолютное время: воркеры на других машинах сравнивают его со своими часами
+            "deadline": time.time() + self._job_timeout,
+        }
+        try:
+            await self._redis.lpush(JOB_QUEUES.get(priority, JOB_QUEUES[PRIORITY_BULK]), json.dumps(job))
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self._job_timeout)
+        except asyncio.TimeoutError:
+            print(f"Воркеры не вернули цену для {url} за {self._job_timeout:.0f} с")
+            return None, None, None
+        finally:
+            self._pending.pop(job_id, None)
+
+    async def _listen(self):
+        while True:
+            try:
+                item = await self._redis.brpop([self._reply_to], timeout=_POLL_TIMEOUT)
+            except redis.RedisError as e:
+                print(f"Ошибка чтения результатов из Redis: {e}")
+                await asyncio.sleep(_POLL_TIMEOUT)
+                continue
+            if item is None:
+                continue
+            try:
+                self._resolve(json.loads(item[1]))
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                # Чужая или поврежденная запись не должна останавливать чтение ответов
+                print(f"Пропущен некорректный ответ воркера: {e!r}")
+
+    def _resolve(self, reply: dict):
+        pending = self._pending.get(reply["id"])
+        if pending is None:
+            # Ответ пришел после таймаута
+            return
+        future, marketplace, submitted_at = pending
+        # Ожидание в очереди: время ответа без времени выполнения на воркере
+        wait_time = max(0.0, time.monotonic() - submitted_at - float(reply.get("took", 0.0)))
+        self._wait_times.append(wait_time)
+        SCRAPE_QUEUE_WAIT.observe(wait_time, marketplace=marketplace)
+        if future.done():
+            return
+        if reply.get("error"):
+            future.set_exception(RuntimeError(reply["error"]))
+        else:
+            price, product_name, promo_text = reply["result"]
+            future.set_result((price, product_name, promo_text))
+
+    def stats(self) -> dict:
+        """Задания, ожидающие ответа воркеров, и время ожидания в очереди Redis."""
+        waits = list(self._wait_times)
+        pending: dict[str, int] = {}
+        for _, marketplace, _ in self._pending.values():
+            pending[marketplace] = pending.get(marketplace, 0) + 1
+        return {
+            "queued": pending,
+            "running": {},
+            "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+            "wait_max": max(waits) if waits else 0.0,
+        }
+
+
+class ScrapeWorker:
+    """
+    Воркер (worker.py): забирает задания из Redis и выполняет их через локальный
+    ScrapeExecutor, поэтому ограничения SCRAPE_CONCURRENCY и SCRAPE_*_CONCURRENCY
+    действуют на каждой машине. Новое задание берется, только когда есть свободный
+    слот: задания распределяются между воркерами по мере освобождения.
+    """
+
+    def __init__(self, client: redis.Redis, executor: ScrapeExecutor, concurrency: int):
+        self._redis = client
+        self._executor = executor
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self.processed = 0
+
+    async def run(self):
+        queues = [JOB_QUEUES[priority] for priority in sorted(JOB_QUEUES)]
+        while True:
+            await self._slots.acquire()
+            try:
+                item = await self._redis.brpop(queues, timeout=_POLL_TIMEOUT)
+            except redis.RedisError as e:
+                self._slots.release()
+                print(f"Ошибка чтения заданий из Redis: {e}")
+                await asyncio.sleep(_POLL_TIMEOUT)
+                continue
+            except BaseException:
+                self._slots.release()
+                raise
+            if item is None:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._handle(item[0], item[1]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, queue: bytes, raw: bytes):
+        try:
+            try:
+                job = json.loads(raw)
+                job_id, url, priority, reply_to = job["id"], job["url"], int(job["priority"]), job["reply_to"]
+                expired = time.time() > float(job["deadline"])
+            except (ValueError, TypeError, KeyError) as e:
+                print(f"Пропущено некорректное задание: {e!r}")
+                return
+            if expired:
+                # Бот уже не ждет ответа
+                return
+            started = time.monotonic()
+            reply = {"id": job_id}
+            try:
+                reply["result"] = list(await self._executor.submit(url, priority))
+            except asyncio.CancelledError:
+                # Воркер останавливается: возвращаем задание в начало очереди для других воркеров
+                await asyncio.shield(self._redis.rpush(queue, raw))
+                raise
+            except Exception as e:
+                reply["error"] = f"{type(e).__name__}: {e}"
+            reply["took"] = time.monotonic() - started
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.lpush(reply_to, json.dumps(reply))
+                # Ответы остановленного бота не копятся бесконечно
+                pipe.expire(reply_to, int(settings.SCRAPE_JOB_TIMEOUT * 2))
+                await pipe.execute()
+            self.processed += 1
+        except redis.RedisError as e:
+            print(f"Не удалось отправить результат в Redis: {e}")
+        finally:
+            self._slots.release()
+
+    async def stop(self):
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
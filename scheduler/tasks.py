@@ -1,86 +1,159 @@
 import asyncio
+import time
 from aiogram import Bot
-from collections import defaultdict
 from datetime import datetime, timedelta
 import html
 from typing import Optional
 from urllib.parse import urlparse
 
+from bot.sender import send_message
 from config import settings
-from storage.sqlite_client import get_all_tracked_urls, get_all_user_settings, update_user_last_check, add_price_history, cleanup_old_price_history
-from parser.price_parser import get_price
+from monitoring.metrics import SCHEDULER_CYCLE_SECONDS
+from storage.notify_state import SubscriptionPrices, notify_state
+from storage.sqlite_client import rekey_short_links, get_all_tracked_urls, get_all_user_settings, get_notify_state, get_urls_for_user, update_user_last_check, add_price_history, rollup_price_history
+from scheduler.due_queue import user_schedule
+from scheduler.fetcher import fetch_price
 
-async def start_scheduler(bot: Bot):
+# Выполняющиеся циклы проверки (храним ссылки, чтобы задачи не были собраны сборщиком мусора)
+_cycles: set[asyncio.Task] = set()
+
+async def start_scheduler(bot: Bot, ready: Optional[asyncio.Event] = None):
     """
-    Основной цикл планировщика, который запускает проверки цен.
+    Основной цикл планировщика: спит до ближайшей проверки по расписанию
+    пользователей и запускает проверки цен.
+    Если передан ready, проверки начинаются только после сигнала готовности бота.
     """
+    if ready is not None:
+        await ready.wait()
     print("Планировщик запущен...")
+
+    # Короткие ссылки из старых версий бота: переводим на канонический URL до загрузки состояния
+    try:
+        rekeyed = await rekey_short_links()
+        if rekeyed:
+            print(f"Короткие ссылки раскрыты: {rekeyed} товаров переведены на канонический URL")
+    except Exception as e:
+        print(f"Не удалось раскрыть короткие ссылки: {e}")
+
+    # Загружаем расписание один раз; дальше оно обновляется точечно
+    tracked_items = await get_all_tracked_urls()
+    user_schedule.load({row[0] for row in tracked_items}, await get_all_user_settings())
+    notify_state.load(await get_notify_state())
+
+    last_rollup = None
     while True:
         try:
-            # Очистка старой истории цен (старше 7 дней)
-            await cleanup_old_price_history()
-
-            tracked_items = await get_all_tracked_urls()
-            # print(f"Найдено {len(tracked_items)} URL для проверки.")
-
-            if not tracked_items:
-                # Если нет URL, просто ждем минуту
-                pass
-
-            # 1. Группируем задачи по user_id
-            user_tasks = defaultdict(list)
-            for user_id, url, product_name, target_price in tracked_items:
-                user_tasks[user_id].append({
-                    "url": url,
-                    "product_name": product_name,
-                    "target_price": target_price
-                })
-            
-            # Получаем настройки всех пользователей
-            all_settings = await get_all_user_settings()
-            default_interval = settings.PRICE_CHECK_INTERVAL // 60
-            now = datetime.now()
+            # Сворачиваем старую историю цен в часовые и дневные корзины
+            if last_rollup is None or datetime.now() - last_rollup >= timedelta(seconds=settings.HISTORY_ROLLUP_INTERVAL):
+                await rollup_price_history()
+                last_rollup = datetime.now()
 
-            # 2. Обрабатываем задачи для каждого пользователя
-            for user_id, items in user_tasks.items():
-                user_data = all_settings.get(user_id, {})
-                interval = user_data.get("check_interval") or default_interval
-                last_check_raw = user_data.get("last_check")
-                
-                should_run = False
-                if not last_check_raw:
-                    should_run = True
-                else:
-                    try:
-                        # Парсим дату из строки (формат SQLite)
-                        if isinstance(last_check_raw, str):
-                            last_check = datetime.fromisoformat(last_check_raw)
-                        else:
-                            last_check = last_check_raw
-                        
-                        if now >= last_check + timedelta(minutes=interval):
-                            should_run = True
-                    except Exception as e:
-                        print(f"Ошибка даты для {user_id}: {e}")
-                        should_run = True
-
-                if should_run:
-                    asyncio.create_task(process_user_items(bot, user_id, items))
-                    await update_user_last_check(user_id)
-
-            # Проверка каждую минуту
-            await asyncio.sleep(60)
+            # 1. Извлекаем пользователей, у которых подошло время проверки
+            now = datetime.now()
+            due_users = {}
+            for user_id in user_schedule.pop_due(now):
+                try:
+                    items = [
+                        {"url": url, "product_name": product_name, "target_price": target_price}
+                        for _, url, product_name, target_price, _ in await get_urls_for_user(user_id)
+                    ]
+                except Exception as e:
+                    # Не теряем пользователя из расписания, попробуем в следующий раз
+                    print(f"[{user_id}] Не удалось загрузить товары: {e}")
+                    user_schedule.mark_checked(user_id, now)
+                    continue
+                if not items:
+                    # Товаров не осталось: пользователь выпадает из расписания
+                    continue
+                due_users[user_id] = items
+                user_schedule.mark_checked(user_id, now)
+                await update_user_last_check(user_id)
+
+            # 2. Проверяем всех отобранных пользователей одним циклом
+            if due_users:
+                task = asyncio.create_task(process_due_users(bot, due_users))
+                _cycles.add(task)
+                task.add_done_callback(_cycles.discard)
+
+            # Спим до ближайшей проверки, изменения расписания или следующего сворачивания истории
+            until_rollup = settings.HISTORY_ROLLUP_INTERVAL - (datetime.now() - last_rollup).total_seconds()
+            await user_schedule.wait(timeout=max(until_rollup, 0))
 
         except Exception as e:
             print(f"Произошла ошибка в планировщике: {e}")
             await asyncio.sleep(60)
 
 
-async def process_user_items(bot: Bot, user_id: int, items: list):
+async def stop_due_checks():
+    """Отменяет выполняющиеся циклы проверки и дожидается их завершения (до закрытия БД и очереди отправки)."""
+    tasks = list(_cycles)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def process_due_users(bot: Bot, due_users: dict[int, list]):
+    """
+    Проверяет товары всех пользователей цикла: каждый уникальный URL запрашивается
+    один раз, а результат раздается всем пользователям, которые его отслеживают.
+    """
+    started = time.perf_counter()
+    urls = list({item['url'] for items in due_users.values() for item in items})
+    print(f"Начинаю проверку {len(urls)} уникальных товаров для {len(due_users)} пользователей...")
+
+    results = await asyncio.gather(*(fetch_price(url) for url in urls), return_exceptions=True)
+
+    prices = {}
+    for url, result in zip(urls, results):
+        if isinstance(result, asyncio.CancelledError):
+            # Очередь проверок остановлена (завершение работы)
+            continue
+        if isinstance(result, BaseException):
+            print(f"Ошибка при получении цены для {url}: {result}")
+            continue
+        price, _, _ = result
+        if price is None:
+            print(f"Не удалось получить цену для {url}")
+            continue
+        prices[url] = price
+        # Сохраняем историю цен один раз на URL, если товар в наличии
+        if price != -1:
+            await add_price_history(url, price)
+
+    await asyncio.gather(
+        *(process_user_items(bot, user_id, items, prices) for user_id, items in due_users.items())
+    )
+    SCHEDULER_CYCLE_SECONDS.observe(time.perf_counter() - started)
+
+
+def notify_reason(price: float, target_price: Optional[float], state: SubscriptionPrices) -> Optional[str]:
+    """
+    Решает, нужно ли уведомление о новой цене; возвращает причину или None.
+    state — цена последнего уведомления и минимум до этой проверки.
     """
-    Проверяет все товары для одного пользователя и отправляет единое уведомление.
+    notified_price = state.notified_price
+    if target_price is not None:
+        # Цель достигнута впервые или цена опустилась еще ниже
+        if price <= target_price and (notified_price is None or notified_price > target_price or price < notified_price):
+            return "target"
+        return None
+
+    if notified_price is None:
+        return "first"
+    if "change" in settings.NOTIFY_RULES and price != notified_price:
+        return "change"
+    if "drop" in settings.NOTIFY_RULES and price <= notified_price * (1 - settings.NOTIFY_DROP_PERCENT / 100):
+        return "drop"
+    if "low" in settings.NOTIFY_RULES and state.lowest_price is not None and price < state.lowest_price:
+        return "low"
+    return None
+
+
+async def process_user_items(bot: Bot, user_id: int, items: list, prices: dict[str, float]):
+    """
+    Формирует по уже полученным ценам и отправляет единое уведомление для одного пользователя.
+    Товары, цена которых не изменилась с последнего уведомления, пропускаются.
     """
-    print(f"[{user_id}] Начинаю проверку {len(items)} товаров...")
     notifications = []
 
     for item in items:
@@ -88,20 +161,21 @@ async def process_user_items(bot: Bot, user_id: int, items: list):
         product_name = item['product_name']
         target_price = item['target_price']
 
-        price, _, _ = await get_price(url)
+        price = prices.get(url)
 
         if price is None:
-            print(f"[{user_id}] Не удалось получить цену для {url}")
             continue
 
-        # Сохраняем историю цен, если товар в наличии
-        if price != -1:
-            await add_price_history(url, price)
-        
         if price == -1:
             # Товар закончился, пропускаем уведомление
             continue
-        
+
+        state = notify_state.get(user_id, url)
+        reason = notify_reason(price, target_price, state)
+        notify_state.record_seen(user_id, url, price, target_price)
+        if reason is None:
+            continue
+
         hostname = urlparse(url).hostname
         site_name = "Unknown"
         if hostname and 'ozon.ru' in hostname:
@@ -110,18 +184,20 @@ async def process_user_items(bot: Bot, user_id: int, items: list):
             site_name = "Wildberries"
 
 
-        # Условие для уведомления: цена ниже целевой или целевая цена не задана
-        if target_price is None or price <= target_price:
-            notification_item = {
-                "product_name": product_name or url,
-                "price": int(price),
-                "site": site_name,
-                "url": url,
-            }
-            if target_price is not None:
-                notification_item["target_price"] = int(target_price)
-            notifications.append(notification_item)
-    
+        notification_item = {
+            "product_name": product_name or url,
+            "price": price,
+            "site": site_name,
+            "url": url,
+        }
+        if target_price is not None:
+            notification_item["target_price"] = int(target_price)
+        if state.notified_price is not None and state.notified_price != price:
+            notification_item["previous_price"] = int(state.notified_price)
+        if reason == "low":
+            notification_item["new_low"] = True
+        notifications.append(notification_item)
+
     if not notifications:
         print(f"[{user_id}] Нет товаров, по которым нужно уведомление.")
         return
@@ -135,9 +211,13 @@ async def process_user_items(bot: Bot, user_id: int, items: list):
             site = notif['site']
             site_icon = "🔵" if site == "Ozon" else "🟣"
             
-            price_str = f"{notif['price']} ₽"
+            price_str = f"{int(notif['price'])} ₽"
+            if 'previous_price' in notif:
+                price_str += f" (было {notif['previous_price']} ₽)"
             if 'target_price' in notif:
                 price_str += f" (цель: {notif['target_price']} ₽)"
+            if notif.get('new_low'):
+                price_str += " 📉 новый минимум"
 
             card = f"{site_icon} <b>{site}</b> | <a href=\"{notif['url']}\">{html.escape(notif['product_name'])}</a>\n💰 {price_str}"
             response_lines.append(card)
@@ -148,12 +228,17 @@ async def process_user_items(bot: Bot, user_id: int, items: list):
 
         message_text = "\n".join(response_lines)
 
-        await bot.send_message(
-            chat_id=user_id,
-            text=message_text,
+        # Через общую очередь отправки: лимиты Telegram и повтор после 429
+        await send_message(
+            bot,
+            user_id,
+            message_text,
             parse_mode="HTML",
             disable_web_page_preview=True
         )
+        # Запоминаем отправленные цены только после успешной отправки
+        for notif in notifications:
+            notify_state.record_notified(user_id, notif['url'], notif['price'])
         print(f"[{user_id}] Отправлено сводное уведомление по {len(notifications)} товарам.")
     except Exception as e:
         print(f"[{user_id}] Не удалось отправить сводное сообщение: {e}")
@@ -0,0 +1,108 @@
+import asyncio
+import gzip
+import hashlib
+import html
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from config import settings
+
+
+class FailureCaptureStore:
+    """
+    Сжатые снимки страниц, на которых не нашлась цена.
+
+    Файл: <каталог>/<маркетплейс>/<время>-<хэш URL>.html.gz, в начале страницы —
+    комментарий с URL и временем снимка. Запись и сжатие выполняются в пуле потоков,
+    чтобы не блокировать цикл событий. Снимки ограничены по количеству и объему
+    (самые старые удаляются) и прореживаются: у каждого маркетплейса не больше
+    per_window снимков за окно, один URL — не чаще раза за окно.
+    """
+
+    def __init__(self, directory: str, max_files: int, max_bytes: int, per_window: int, window: float):
+        self._directory = directory
+        self._max_files = max_files
+        self._max_bytes = max_bytes
+        self._per_window = per_window
+        self._window = window
+        # Окно прореживания каждого маркетплейса: начало, число снимков, URL в окне
+        self._windows: dict[str, tuple[float, int, set[str]]] = {}
+        self.skipped = 0
+        # Снимки на диске: путь -> размер, в порядке создания (загружается при первой записи)
+        self._files: Optional[dict[str, int]] = None
+        self._lock = threading.Lock()
+
+    def _sample(self, marketplace: str, url: str) -> bool:
+        """Решает, сохранять ли снимок. Вызывается из цикла событий."""
+        now = time.monotonic()
+        started, count, urls = self._windows.get(marketplace, (now, 0, set()))
+        if now - started >= self._window:
+            started, count, urls = now, 0, set()
+        if count >= self._per_window or url in urls:
+            self._windows[marketplace] = (started, count, urls)
+            return False
+        urls.add(url)
+        self._windows[marketplace] = (started, count + 1, urls)
+        return True
+
+    def _load_index(self) -> dict[str, int]:
+        files = []
+        for root, _, names in os.walk(self._directory):
+            for name in names:
+                if name.endswith(".html.gz"):
+                    stat = os.stat(os.path.join(root, name))
+                    files.append((stat.st_mtime, os.path.join(root, name), stat.st_size))
+        return {path: size for _, path, size in sorted(files)}
+
+    def _evict(self):
+        total = sum(self._files.values())
+        while self._files and (len(self._files) > self._max_files or total > self._max_bytes):
+            path = next(iter(self._files))
+            total -= self._files.pop(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _write(self, marketplace: str, url: str, page_source: str) -> str:
+        captured_at = datetime.now()
+        url_hash = hashlib.sha1(url.encode()).hexdigest()[:12]
+        directory = os.path.join(self._directory, marketplace)
+        path = os.path.join(directory, f"{captured_at:%Y%m%d-%H%M%S}-{url_hash}.html.gz")
+        header = f"<!-- url: {html.escape(url)} | captured: {captured_at.isoformat(timespec='seconds')} -->\n"
+        data = gzip.compress((header + page_source).encode("utf-8"), compresslevel=6)
+
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            if self._files is None:
+                self._files = self._load_index()
+            with open(path, "wb") as f:
+                f.write(data)
+            self._files.pop(path, None)
+            self._files[path] = len(data)
+            self._evict()
+        return path
+
+    async def capture(self, marketplace: str, url: str, page_source: str) -> Optional[str]:
+        """Сохраняет снимок страницы; возвращает путь к файлу или None, если снимок пропущен."""
+        if not self._sample(marketplace, url):
+            self.skipped += 1
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, self._write, marketplace, url, page_source)
+        except OSError as e:
+            print(f"Не удалось сохранить снимок страницы {url}: {e}")
+            return None
+
+
+failure_captures = FailureCaptureStore(
+    settings.CAPTURE_DIR,
+    settings.CAPTURE_MAX_FILES,
+    int(settings.CAPTURE_MAX_MB * 1024 * 1024),
+    settings.CAPTURE_PER_WINDOW,
+    settings.CAPTURE_WINDOW,
+)
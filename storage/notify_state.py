@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from storage.sqlite_client import save_notify_state
+
+
+@dataclass
+class SubscriptionPrices:
+    # Цена из последнего отправленного уведомления
+    notified_price: Optional[float] = None
+    # Минимальная цена, замеченная за время подписки
+    lowest_price: Optional[float] = None
+
+
+class NotifyState:
+    """
+    Последняя отправленная цена и минимальная цена по каждой подписке (пользователь, URL).
+
+    Планировщик сравнивает с ними новую цену и не отправляет уведомление,
+    если ничего не изменилось. Состояние загружается из SQLite при запуске,
+    а изменения записываются фоновым писателем.
+    """
+
+    def __init__(self):
+        self._entries: dict[tuple[int, str], SubscriptionPrices] = {}
+
+    def load(self, rows: Iterable[tuple[int, str, Optional[float], Optional[float]]]):
+        for user_id, url, notified_price, lowest_price in rows:
+            self._entries[(user_id, url)] = SubscriptionPrices(notified_price, lowest_price)
+
+    def get(self, user_id: int, url: str) -> SubscriptionPrices:
+        return self._entries.get((user_id, url)) or SubscriptionPrices()
+
+    def _update(self, user_id: int, url: str, notified_price: Optional[float], lowest_price: Optional[float]):
+        entry = SubscriptionPrices(notified_price, lowest_price)
+        if self._entries.get((user_id, url)) != entry:
+            self._entries[(user_id, url)] = entry
+            save_notify_state(user_id, url, notified_price, lowest_price)
+
+    def record_seen(self, user_id: int, url: str, price: float, target_price: Optional[float] = None):
+        """
+        Учитывает полученную цену в минимуме за время подписки.
+        Если цена поднялась выше целевой, последнее уведомление забывается:
+        следующее достижение цели снова будет отправлено.
+        """
+        entry = self.get(user_id, url)
+        notified_price = entry.notified_price
+        if target_price is not None and price > target_price:
+            notified_price = None
+        lowest_price = price if entry.lowest_price is None else min(entry.lowest_price, price)
+        self._update(user_id, url, notified_price, lowest_price)
+
+    def record_notified(self, user_id: int, url: str, price: float):
+        """Запоминает цену, о которой пользователь узнал (уведомление или ответ на ссылку)."""
+        entry = self.get(user_id, url)
+        lowest_price = price if entry.lowest_price is None else min(entry.lowest_price, price)
+        self._update(user_id, url, price, lowest_price)
+
+
+notify_state = NotifyState()
@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional
+
+from config import settings
+
+
+@dataclass
+class CachedPrice:
+    price: float
+    product_name: Optional[str]
+    promo_text: Optional[str]
+    fetched_at: float
+
+    @property
+    def age(self) -> float:
+        """Возраст цены в секундах."""
+        return time.time() - self.fetched_at
+
+
+class PriceCache:
+    """
+    Общий кэш последних полученных цен по URL.
+
+    Заполняется при каждой успешной проверке (планировщиком и обработчиками),
+    чтобы /list мог показывать цены без запуска браузера. При запуске кэш
+    заполняется последними ценами из БД с временем их получения, поэтому
+    после перезапуска устаревшими считаются только действительно старые цены.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedPrice]" = OrderedDict()
+
+    def get(self, url: str) -> Optional[CachedPrice]:
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def load(self, rows: Iterable[tuple[str, float, Optional[str], object]]):
+        """
+        Заполняет кэш строками (url, цена, название, время проверки) от новых к старым,
+        как их возвращает get_last_prices. Уже полученные цены не перезаписываются.
+        """
+        for url, price, product_name, checked_at in rows:
+            if isinstance(checked_at, str):
+                try:
+                    checked_at = datetime.fromisoformat(checked_at)
+                except ValueError:
+                    continue
+            if url not in self._entries:
+                self._entries[url] = CachedPrice(price, product_name, None, checked_at.timestamp())
+                self._entries.move_to_end(url, last=False)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, url: str, price: float, product_name: Optional[str], promo_text: Optional[str]):
+        self._entries[url] = CachedPrice(price, product_name, promo_text, time.time())
+        self._entries.move_to_end(url)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def is_stale(self, entry: Optional[CachedPrice]) -> bool:
+        return entry is None or entry.age >= self.ttl
+
+
+price_cache = PriceCache(settings.PRICE_CACHE_TTL, settings.PRICE_CACHE_MAX_ENTRIES)
@@ -1,38 +1,290 @@
+import asyncio
+import functools
 import aiosqlite
-from typing import Optional, Literal
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Literal
 import datetime
 
+from config import settings
+from monitoring.metrics import DB_SECONDS
+from parser.url_canon import ProductKey, canonicalize_url, is_short_link, resolve_product_url
+
 DB_FILE = "ozon.db"
-TABLES = ["ozon_items", "wb_items"]
+MARKETPLACES = ["ozon", "wb"]
+# Старые таблицы подписок по маркетплейсам (переносятся в products + subscriptions)
+LEGACY_ITEM_TABLES = {"user_urls": "ozon", "ozon_items": "ozon", "wb_items": "wb"}
+HISTORY_ROLLUP_TABLES = ["price_history_hourly", "price_history_daily"]
+# Объединение новой корзины истории с уже существующей
+_BUCKET_MERGE = """
+    ON CONFLICT (product_id, bucket) DO UPDATE SET
+        min_price = MIN(min_price, excluded.min_price),
+        max_price = MAX(max_price, excluded.max_price),
+        last_price = CASE WHEN excluded.last_at >= last_at THEN excluded.last_price ELSE last_price END,
+        last_at = MAX(last_at, excluded.last_at)
+"""
 
-async def initialize_db():
-    async with aiosqlite.connect(DB_FILE) as db:
-        # Migration from old table name
-        cursor = await db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_urls'")
-        if await cursor.fetchone():
-            await db.execute("ALTER TABLE user_urls RENAME TO ozon_items")
+# Настройки соединения: WAL позволяет читать во время записи,
+# synchronous=NORMAL в режиме WAL не теряет целостность и не делает fsync на каждый commit
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA cache_size=-{settings.SQLITE_CACHE_KB}",
+    f"PRAGMA mmap_size={settings.SQLITE_MMAP_BYTES}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+]
 
-        for table in TABLES:
-            await db.execute(f"""
-                CREATE TABLE IF NOT EXISTS {table} (
-                    user_id INTEGER,
-                    url TEXT,
-                    target_price REAL,
-                    product_name TEXT,
-                    added_at TIMESTAMP,
-                    PRIMARY KEY (user_id, url)
-                )
-            """)
-            # For backward compatibility, check and add columns if they don't exist
-            cursor = await db.execute(f"PRAGMA table_info({table})")
-            columns = [row[1] for row in await cursor.fetchall()]
-            if 'target_price' not in columns:
-                await db.execute(f"ALTER TABLE {table} ADD COLUMN target_price REAL")
-            if 'product_name' not in columns:
-                await db.execute(f"ALTER TABLE {table} ADD COLUMN product_name TEXT")
-            if 'added_at' not in columns:
-                await db.execute(f"ALTER TABLE {table} ADD COLUMN added_at TIMESTAMP")
+_db: Optional[aiosqlite.Connection] = None
+_db_lock = asyncio.Lock()
+# Транзакции на общем соединении выполняются по очереди
+_write_lock = asyncio.Lock()
+
+async def _get_db() -> aiosqlite.Connection:
+    """Возвращает общее соединение с БД, открывая его при первом обращении."""
+    global _db
+    if _db is None:
+        async with _db_lock:
+            if _db is None:
+                db = await aiosqlite.connect(DB_FILE, cached_statements=settings.SQLITE_STATEMENT_CACHE)
+                for pragma in PRAGMAS:
+                    await db.execute(pragma)
+                _db = db
+    return _db
+
+def _timed(func):
+    """Замеряет время операции с БД (метрика db_operation_seconds с именем функции)."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with DB_SECONDS.time(operation=func.__name__):
+            return await func(*args, **kwargs)
+    return wrapper
+
+@asynccontextmanager
+async def _transaction() -> AsyncIterator[aiosqlite.Connection]:
+    """Выполняет запись в одной транзакции на общем соединении."""
+    db = await _get_db()
+    async with _write_lock:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+        await db.commit()
+
+class _WriteBehind:
+    """
+    Буфер отложенной записи для истории цен, времени последней проверки
+    и состояния уведомлений по подпискам.
+
+    Вызывающие не ждут диска: строки накапливаются в памяти и записываются
+    одной транзакцией, когда буфер достигает `batch_size` или прошло `interval` секунд.
+    """
+
+    def __init__(self, batch_size: int, interval: float):
+        self._batch_size = batch_size
+        self._interval = interval
+        self._history: list[tuple[str, float, datetime.datetime]] = []
+        self._last_checks: dict[int, datetime.datetime] = {}
+        # (user_id, url) -> (цена последнего уведомления, минимальная цена)
+        self._notify_state: dict[tuple[int, str], tuple[Optional[float], Optional[float]]] = {}
+        # Время проверок, которые записываются прямо сейчас
+        self._flushing_last_checks: dict[int, datetime.datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def add_history(self, url: str, price: float, checked_at: datetime.datetime):
+        self._history.append((url, price, checked_at))
+        self._maybe_wakeup()
+
+    def set_last_check(self, user_id: int, checked_at: datetime.datetime):
+        self._last_checks[user_id] = checked_at
+        self._maybe_wakeup()
+
+    def set_notify_state(self, user_id: int, url: str, notified_price: Optional[float], lowest_price: Optional[float]):
+        self._notify_state[(user_id, url)] = (notified_price, lowest_price)
+        self._maybe_wakeup()
+
+    def pending_last_checks(self) -> dict[int, datetime.datetime]:
+        return {**self._flushing_last_checks, **self._last_checks}
+
+    def _maybe_wakeup(self):
+        if len(self._history) + len(self._last_checks) + len(self._notify_state) >= self._batch_size:
+            self._wakeup.set()
 
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Ошибка отложенной записи в БД: {e}")
+
+    @_timed
+    async def flush(self):
+        """Записывает все накопленные строки одной транзакцией."""
+        async with self._flush_lock:
+            history, self._history = self._history, []
+            last_checks, self._last_checks = self._last_checks, {}
+            notify_state, self._notify_state = self._notify_state, {}
+            if not history and not last_checks and not notify_state:
+                return
+            self._flushing_last_checks = last_checks
+            try:
+                async with _transaction() as db:
+                    if history:
+                        await db.executemany(
+                            "INSERT OR IGNORE INTO products (url) VALUES (?)",
+                            [(url,) for url in {row[0] for row in history}]
+                        )
+                        await db.executemany(
+                            "INSERT INTO price_history (product_id, price, checked_at) "
+                            "SELECT id, ?, ? FROM products WHERE url = ?",
+                            [(price, checked_at, url) for url, price, checked_at in history]
+                        )
+                        # Последняя известная цена товара и время ее получения (строки идут по времени)
+                        last_prices = {url: (price, checked_at) for url, price, checked_at in history}
+                        await db.executemany(
+                            "UPDATE products SET last_price = ?, last_checked = ? WHERE url = ?",
+                            [(price, checked_at, url) for url, (price, checked_at) in last_prices.items()]
+                        )
+                    if last_checks:
+                        await db.executemany(
+                            "INSERT INTO user_settings (user_id, last_check) VALUES (?, ?) "
+                            "ON CONFLICT(user_id) DO UPDATE SET last_check = excluded.last_check",
+                            list(last_checks.items())
+                        )
+                    if notify_state:
+                        await db.executemany(
+                            "UPDATE subscriptions SET notified_price = ?, lowest_price = ? "
+                            "WHERE user_id = ? AND product_id = (SELECT id FROM products WHERE url = ?)",
+                            [(notified, lowest, user_id, url) for (user_id, url), (notified, lowest) in notify_state.items()]
+                        )
+            except Exception:
+                # Возвращаем строки в буфер, чтобы записать их при следующей попытке
+                self._history[:0] = history
+                for user_id, checked_at in last_checks.items():
+                    self._last_checks.setdefault(user_id, checked_at)
+                for key, prices in notify_state.items():
+                    self._notify_state.setdefault(key, prices)
+                raise
+            finally:
+                self._flushing_last_checks = {}
+
+    async def stop(self):
+        """Останавливает фоновую задачу и записывает остаток буфера."""
+        if self._task is not None:
+            # Дожидаемся текущей записи, чтобы не прервать транзакцию на середине
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+_writer = _WriteBehind(settings.DB_WRITE_BATCH_SIZE, settings.DB_WRITE_INTERVAL)
+
+async def close_db():
+    """Записывает отложенные данные и закрывает общее соединение с БД."""
+    global _db
+    await _writer.stop()
+    db, _db = _db, None
+    if db is not None:
+        await db.close()
+
+async def _merge_product(db: aiosqlite.Connection, source_id: int, target_id: int):
+    """Переносит подписки и историю товара source_id в target_id и удаляет source_id."""
+    # Если пользователь подписан на оба варианта, остается подписка на target
+    await db.execute("""
+        INSERT OR IGNORE INTO subscriptions (user_id, product_id, target_price, added_at, notified_price, lowest_price)
+        SELECT user_id, ?, target_price, added_at, notified_price, lowest_price FROM subscriptions WHERE product_id = ?
+    """, (target_id, source_id))
+    await db.execute("""
+        UPDATE subscriptions SET target_price = (
+            SELECT source.target_price FROM subscriptions AS source
+            WHERE source.product_id = :source AND source.user_id = subscriptions.user_id
+        )
+        WHERE product_id = :target AND target_price IS NULL
+    """, {"source": source_id, "target": target_id})
+    await db.execute("DELETE FROM subscriptions WHERE product_id = ?", (source_id,))
+    await db.execute("UPDATE price_history SET product_id = ? WHERE product_id = ?", (target_id, source_id))
+    for table in HISTORY_ROLLUP_TABLES:
+        await db.execute(f"""
+            INSERT INTO {table} (product_id, bucket, min_price, max_price, last_price, last_at)
+            SELECT ?, bucket, min_price, max_price, last_price, last_at FROM {table} WHERE product_id = ?
+            {_BUCKET_MERGE}
+        """, (target_id, source_id))
+        await db.execute(f"DELETE FROM {table} WHERE product_id = ?", (source_id,))
+    await db.execute("""
+        UPDATE products SET name = COALESCE(name, (SELECT name FROM products WHERE id = :source))
+        WHERE id = :target
+    """, {"source": source_id, "target": target_id})
+    await db.execute("DELETE FROM products WHERE id = ?", (source_id,))
+
+async def _rekey_product(db: aiosqlite.Connection, product_id: int, key: ProductKey):
+    """Переводит товар на канонический URL; если такой товар уже есть, объединяет их."""
+    cursor = await db.execute("SELECT id FROM products WHERE url = ? AND id != ?", (key.url, product_id))
+    existing = await cursor.fetchone()
+    if existing:
+        await _merge_product(db, product_id, existing[0])
+        await db.execute(
+            "UPDATE products SET marketplace = ?, sku = ? WHERE id = ?",
+            (key.marketplace, key.sku, existing[0])
+        )
+    else:
+        await db.execute(
+            "UPDATE products SET url = ?, marketplace = ?, sku = ? WHERE id = ?",
+            (key.url, key.marketplace, key.sku, product_id)
+        )
+
+async def _rekey_products(db: aiosqlite.Connection):
+    """
+    Приводит URL товаров к каноническому виду (артикул без параметров и вариантов хоста).
+    Товары, ставшие одинаковыми, объединяются. Для коротких ссылок нужен сетевой
+    запрос, поэтому их раскрывает rekey_short_links после запуска.
+    """
+    cursor = await db.execute("SELECT id, url FROM products WHERE sku IS NULL")
+    for product_id, url in await cursor.fetchall():
+        key = canonicalize_url(url)
+        if key is not None:
+            await _rekey_product(db, product_id, key)
+
+@_timed
+async def rekey_short_links() -> int:
+    """
+    Раскрывает сохраненные короткие ссылки Ozon (ozon.ru/t/...) и переводит их товары
+    на канонический URL, объединяя с уже отслеживаемыми. Ссылки, которые не удалось
+    раскрыть, остаются как есть до следующего запуска. Возвращает число переведенных товаров.
+    """
+    # Отложенная история пишется по URL: сначала записываем ее под старым URL
+    await _writer.flush()
+    db = await _get_db()
+    cursor = await db.execute("SELECT id, url FROM products WHERE sku IS NULL")
+    short_links = [(product_id, url) for product_id, url in await cursor.fetchall() if is_short_link(url)]
+    if not short_links:
+        return 0
+    keys = await asyncio.gather(*(resolve_product_url(url) for _, url in short_links))
+    rekeyed = 0
+    async with _transaction() as db:
+        for (product_id, url), key in zip(short_links, keys):
+            if key is not None:
+                await _rekey_product(db, product_id, key)
+                rekeyed += 1
+    return rekeyed
+
+async def initialize_db():
+    async with _transaction() as db:
         # Table for user settings
         await db.execute("""
             CREATE TABLE IF NOT EXISTS user_settings (
@@ -42,122 +294,327 @@ async def initialize_db():
             )
         """)
 
-        # Table for price history
+        # Products: history is keyed by an integer id instead of the URL text
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY,
+                marketplace TEXT,
+                sku TEXT,
+                url TEXT NOT NULL UNIQUE,
+                name TEXT,
+                last_price REAL,
+                last_checked TIMESTAMP
+            )
+        """)
+        cursor = await db.execute("PRAGMA table_info(products)")
+        product_columns = [row[1] for row in await cursor.fetchall()]
+        for column, column_type in (
+            ("marketplace", "TEXT"), ("sku", "TEXT"), ("name", "TEXT"), ("last_price", "REAL"), ("last_checked", "TIMESTAMP"),
+        ):
+            if column not in product_columns:
+                await db.execute(f"ALTER TABLE products ADD COLUMN {column} {column_type}")
+
+        # Subscriptions: one row per (user, product)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL REFERENCES products (id),
+                target_price REAL,
+                added_at TIMESTAMP,
+                notified_price REAL,
+                lowest_price REAL,
+                UNIQUE (user_id, product_id)
+            )
+        """)
+        cursor = await db.execute("PRAGMA table_info(subscriptions)")
+        subscription_columns = [row[1] for row in await cursor.fetchall()]
+        for column in ("notified_price", "lowest_price"):
+            if column not in subscription_columns:
+                await db.execute(f"ALTER TABLE subscriptions ADD COLUMN {column} REAL")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_product ON subscriptions (product_id)")
+
+        # Migration: per-marketplace item tables -> products + subscriptions
+        for table, marketplace in LEGACY_ITEM_TABLES.items():
+            cursor = await db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+            if not await cursor.fetchone():
+                continue
+            cursor = await db.execute(f"PRAGMA table_info({table})")
+            columns = [row[1] for row in await cursor.fetchall()]
+            # Very old tables may lack some columns
+            product_name = "legacy.product_name" if "product_name" in columns else "NULL"
+            target_price = "legacy.target_price" if "target_price" in columns else "NULL"
+            added_at = "legacy.added_at" if "added_at" in columns else "NULL"
+
+            await db.execute(f"""
+                INSERT INTO products (url, marketplace, name)
+                SELECT legacy.url, ?, MAX({product_name}) FROM {table} AS legacy WHERE true GROUP BY legacy.url
+                ON CONFLICT (url) DO UPDATE SET
+                    marketplace = excluded.marketplace,
+                    name = COALESCE(products.name, excluded.name)
+            """, (marketplace,))
+            await db.execute(f"""
+                INSERT OR IGNORE INTO subscriptions (user_id, product_id, target_price, added_at)
+                SELECT legacy.user_id, products.id, {target_price}, {added_at}
+                FROM {table} AS legacy JOIN products ON products.url = legacy.url
+            """)
+            await db.execute(f"DROP TABLE {table}")
+
+        # Migration: price_history keyed by url -> keyed by product_id
+        cursor = await db.execute("PRAGMA table_info(price_history)")
+        history_columns = [row[1] for row in await cursor.fetchall()]
+        if 'url' in history_columns:
+            await db.execute("ALTER TABLE price_history RENAME TO price_history_legacy")
+            await db.execute("DROP INDEX IF EXISTS idx_price_history_url_date")
+
+        # Table for raw price points (kept for HISTORY_RAW_DAYS)
         await db.execute("""
             CREATE TABLE IF NOT EXISTS price_history (
-                url TEXT,
+                product_id INTEGER NOT NULL,
                 price REAL,
                 checked_at TIMESTAMP
             )
         """)
-        await db.execute("CREATE INDEX IF NOT EXISTS idx_price_history_url_date ON price_history (url, checked_at)")
-        await db.commit()
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_price_history_product_date ON price_history (product_id, checked_at)")
+
+        # Hourly and daily rollups: min/max/last price per time bucket
+        for table in HISTORY_ROLLUP_TABLES:
+            await db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    product_id INTEGER NOT NULL,
+                    bucket TIMESTAMP NOT NULL,
+                    min_price REAL,
+                    max_price REAL,
+                    last_price REAL,
+                    last_at TIMESTAMP,
+                    PRIMARY KEY (product_id, bucket)
+                ) WITHOUT ROWID
+            """)
 
-async def add_item_for_user(user_id: int, url: str, product_name: str, table: str, target_price: Optional[float] = None):
-    if table not in TABLES:
-        raise ValueError(f"Invalid table name: {table}")
-    async with aiosqlite.connect(DB_FILE) as db:
+        if 'url' in history_columns:
+            await db.execute("INSERT OR IGNORE INTO products (url) SELECT DISTINCT url FROM price_history_legacy")
+            await db.execute("""
+                INSERT INTO price_history (product_id, price, checked_at)
+                SELECT products.id, legacy.price, legacy.checked_at
+                FROM price_history_legacy AS legacy JOIN products ON products.url = legacy.url
+            """)
+            await db.execute("DROP TABLE price_history_legacy")
+
+        # Migration: re-key products by canonical URL and merge duplicates
+        await _rekey_products(db)
+
+    # Запускаем фоновую запись истории цен и времени проверок
+    _writer.start()
+
+@_timed
+async def add_item_for_user(user_id: int, url: str, product_name: str, marketplace: str, target_price: Optional[float] = None):
+    if marketplace not in MARKETPLACES:
+        raise ValueError(f"Invalid marketplace: {marketplace}")
+    key = canonicalize_url(url)
+    if key is not None:
+        url = key.url
+    async with _transaction() as db:
         await db.execute(
-            f"INSERT OR REPLACE INTO {table} (user_id, url, product_name, target_price, added_at) VALUES (?, ?, ?, ?, ?)",
-            (user_id, url, product_name, target_price, datetime.datetime.now())
+            """
+            INSERT INTO products (url, marketplace, sku, name) VALUES (?, ?, ?, ?)
+            ON CONFLICT (url) DO UPDATE SET
+                marketplace = excluded.marketplace,
+                sku = excluded.sku,
+                name = COALESCE(excluded.name, products.name)
+            """,
+            (url, marketplace, key.sku if key else None, product_name)
+        )
+        await db.execute(
+            """
+            INSERT INTO subscriptions (user_id, product_id, target_price, added_at)
+            SELECT ?, id, ?, ? FROM products WHERE url = ?
+            ON CONFLICT (user_id, product_id) DO UPDATE SET
+                target_price = excluded.target_price,
+                added_at = excluded.added_at
+            """,
+            (user_id, target_price, datetime.datetime.now(), url)
         )
-        await db.commit()
 
+@_timed
 async def get_urls_for_user(user_id: int) -> list[tuple[int, str, str, Optional[float], str]]:
-    all_rows = []
-    async with aiosqlite.connect(DB_FILE) as db:
-        for table in TABLES:
-            cursor = await db.execute(f"SELECT rowid, url, product_name, target_price FROM {table} WHERE user_id = ?", (user_id,))
-            rows = await cursor.fetchall()
-            # Add table name to each row
-            all_rows.extend([row + (table,) for row in rows])
-    return all_rows
+    """Возвращает подписки пользователя: (id подписки, url, название, целевая цена, маркетплейс)."""
+    db = await _get_db()
+    cursor = await db.execute(
+        """
+        SELECT subscriptions.id, products.url, products.name, subscriptions.target_price, products.marketplace
+        FROM subscriptions JOIN products ON products.id = subscriptions.product_id
+        WHERE subscriptions.user_id = ?
+        ORDER BY subscriptions.id
+        """,
+        (user_id,)
+    )
+    return await cursor.fetchall()
 
+@_timed
 async def get_all_tracked_urls() -> list[tuple[int, str, str, Optional[float]]]:
-    all_rows = []
-    async with aiosqlite.connect(DB_FILE) as db:
-        for table in TABLES:
-            cursor = await db.execute(f"SELECT user_id, url, product_name, target_price FROM {table}")
-            rows = await cursor.fetchall()
-            all_rows.extend(rows)
-    return all_rows
-
-async def remove_item_by_rowid(rowid: int, table_name: str):
-    if table_name not in TABLES:
-        raise ValueError(f"Invalid table name: {table_name}")
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute(f"DELETE FROM {table_name} WHERE rowid = ?", (rowid,))
-        await db.commit()
+    db = await _get_db()
+    cursor = await db.execute(
+        """
+        SELECT subscriptions.user_id, products.url, products.name, subscriptions.target_price
+        FROM subscriptions JOIN products ON products.id = subscriptions.product_id
+        """
+    )
+    return await cursor.fetchall()
+
+@_timed
+async def get_last_prices(limit: int) -> list[tuple[str, float, Optional[str], str]]:
+    """Возвращает (url, последняя цена, название, время проверки) для недавно проверенных товаров."""
+    await _writer.flush()
+    db = await _get_db()
+    cursor = await db.execute(
+        """
+        SELECT url, last_price, name, last_checked FROM products
+        WHERE last_price IS NOT NULL AND last_checked IS NOT NULL
+        ORDER BY last_checked DESC LIMIT ?
+        """,
+        (limit,)
+    )
+    return await cursor.fetchall()
+
+@_timed
+async def get_notify_state() -> list[tuple[int, str, Optional[float], Optional[float]]]:
+    """Возвращает (user_id, url, цена последнего уведомления, минимальная цена) по подпискам."""
+    await _writer.flush()
+    db = await _get_db()
+    cursor = await db.execute(
+        """
+        SELECT subscriptions.user_id, products.url, subscriptions.notified_price, subscriptions.lowest_price
+        FROM subscriptions JOIN products ON products.id = subscriptions.product_id
+        WHERE subscriptions.notified_price IS NOT NULL OR subscriptions.lowest_price IS NOT NULL
+        """
+    )
+    return await cursor.fetchall()
+
+def save_notify_state(user_id: int, url: str, notified_price: Optional[float], lowest_price: Optional[float]):
+    """Сохраняет состояние уведомлений подписки; запись в БД выполняется фоновым писателем."""
+    _writer.set_notify_state(user_id, url, notified_price, lowest_price)
 
+@_timed
+async def remove_subscription(subscription_id: int):
+    async with _transaction() as db:
+        await db.execute("DELETE FROM subscriptions WHERE id = ?", (subscription_id,))
+
+@_timed
 async def get_users_statistics() -> list[tuple[int, int, Optional[str]]]:
-    async with aiosqlite.connect(DB_FILE) as db:
-        subqueries = []
-        for table in TABLES:
-            subqueries.append(f"SELECT user_id, COUNT(*) as cnt, MAX(added_at) as last_added FROM {table} GROUP BY user_id")
-        
-        union_query = " UNION ALL ".join(subqueries)
-        final_query = f"SELECT user_id, SUM(cnt), MAX(last_added) FROM ({union_query}) GROUP BY user_id"
-        
-        cursor = await db.execute(final_query)
-        return await cursor.fetchall()
+    db = await _get_db()
+    cursor = await db.execute(
+        "SELECT user_id, COUNT(*), MAX(added_at) FROM subscriptions GROUP BY user_id"
+    )
+    return await cursor.fetchall()
 
+@_timed
 async def set_user_check_interval(user_id: int, interval_minutes: int):
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with _transaction() as db:
         cursor = await db.execute("SELECT 1 FROM user_settings WHERE user_id = ?", (user_id,))
         if await cursor.fetchone():
             await db.execute("UPDATE user_settings SET check_interval = ? WHERE user_id = ?", (interval_minutes, user_id))
         else:
             await db.execute("INSERT INTO user_settings (user_id, check_interval) VALUES (?, ?)", (user_id, interval_minutes))
-        await db.commit()
 
+@_timed
 async def get_user_check_interval(user_id: int) -> Optional[int]:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("SELECT check_interval FROM user_settings WHERE user_id = ?", (user_id,))
-        row = await cursor.fetchone()
-        return row[0] if row else None
+    db = await _get_db()
+    cursor = await db.execute("SELECT check_interval FROM user_settings WHERE user_id = ?", (user_id,))
+    row = await cursor.fetchone()
+    return row[0] if row else None
 
+@_timed
 async def get_all_user_settings() -> dict:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("SELECT user_id, check_interval, last_check FROM user_settings")
-        rows = await cursor.fetchall()
-        return {row[0]: {"check_interval": row[1], "last_check": row[2]} for row in rows}
+    db = await _get_db()
+    cursor = await db.execute("SELECT user_id, check_interval, last_check FROM user_settings")
+    rows = await cursor.fetchall()
+    all_settings = {row[0]: {"check_interval": row[1], "last_check": row[2]} for row in rows}
+    # Учитываем время проверок, которые еще не записаны в БД
+    for user_id, last_check in _writer.pending_last_checks().items():
+        all_settings.setdefault(user_id, {"check_interval": None})["last_check"] = last_check
+    return all_settings
 
 async def update_user_last_check(user_id: int):
-    now = datetime.datetime.now()
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("SELECT 1 FROM user_settings WHERE user_id = ?", (user_id,))
-        if await cursor.fetchone():
-            await db.execute("UPDATE user_settings SET last_check = ? WHERE user_id = ?", (now, user_id))
-        else:
-            await db.execute("INSERT INTO user_settings (user_id, last_check) VALUES (?, ?)", (user_id, now))
-        await db.commit()
+    """Запоминает время проверки; запись в БД выполняется фоновым писателем."""
+    _writer.set_last_check(user_id, datetime.datetime.now())
 
 async def add_price_history(url: str, price: float):
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute(
-            "INSERT INTO price_history (url, price, checked_at) VALUES (?, ?, ?)",
-            (url, price, datetime.datetime.now())
+    """Добавляет цену в историю; запись в БД выполняется фоновым писателем."""
+    _writer.add_history(url, price, datetime.datetime.now())
+
+async def _rollup(db: aiosqlite.Connection, source_select: str, target: str, cutoff: datetime.datetime, bucket_format: str):
+    """
+    Сворачивает строки источника старше cutoff в корзины target (min/max/last)
+    и объединяет их с уже существующими корзинами.
+    """
+    await db.execute(f"""
+        WITH source AS ({source_select}),
+        agg AS (
+            SELECT product_id, strftime('{bucket_format}', at) AS bucket,
+                   MIN(low) AS min_price, MAX(high) AS max_price, MAX(at) AS last_at
+            FROM source WHERE at < :cutoff
+            GROUP BY product_id, bucket
         )
-        await db.commit()
+        INSERT INTO {target} (product_id, bucket, min_price, max_price, last_price, last_at)
+        SELECT agg.product_id, agg.bucket, agg.min_price, agg.max_price,
+               (SELECT last FROM source
+                WHERE source.product_id = agg.product_id AND source.at = agg.last_at LIMIT 1),
+               agg.last_at
+        FROM agg WHERE true
+        {_BUCKET_MERGE}
+    """, {"cutoff": cutoff})
 
-async def cleanup_old_price_history(days: int = 7):
-    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute("DELETE FROM price_history WHERE checked_at < ?", (cutoff,))
-        await db.commit()
+@_timed
+async def rollup_price_history(raw_days: int = settings.HISTORY_RAW_DAYS, hourly_days: int = settings.HISTORY_HOURLY_DAYS):
+    """
+    Сворачивает историю цен: точки старше raw_days — в часовые корзины,
+    часовые корзины старше hourly_days — в дневные. Дневные хранятся бессрочно.
+    """
+    # Сначала записываем накопленные точки, чтобы они попали в корзины
+    await _writer.flush()
+    now = datetime.datetime.now()
+    raw_cutoff = now - datetime.timedelta(days=raw_days)
+    hourly_cutoff = now - datetime.timedelta(days=hourly_days)
+    async with _transaction() as db:
+        await _rollup(
+            db,
+            "SELECT product_id, checked_at AS at, price AS low, price AS high, price AS last FROM price_history",
+            "price_history_hourly", raw_cutoff, "%Y-%m-%d %H:00:00",
+        )
+        await db.execute("DELETE FROM price_history WHERE checked_at < ?", (raw_cutoff,))
+        await _rollup(
+            db,
+            "SELECT product_id, last_at AS at, min_price AS low, max_price AS high, last_price AS last FROM price_history_hourly",
+            "price_history_daily", hourly_cutoff, "%Y-%m-%d 00:00:00",
+        )
+        await db.execute("DELETE FROM price_history_hourly WHERE last_at < ?", (hourly_cutoff,))
 
-async def get_url_by_rowid(rowid: int, table: str) -> Optional[str]:
-    if table not in TABLES:
-        return None
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute(f"SELECT url FROM {table} WHERE rowid = ?", (rowid,))
-        row = await cursor.fetchone()
-        return row[0] if row else None
+@_timed
+async def get_url_by_subscription(subscription_id: int) -> Optional[str]:
+    db = await _get_db()
+    cursor = await db.execute(
+        "SELECT products.url FROM subscriptions JOIN products ON products.id = subscriptions.product_id WHERE subscriptions.id = ?",
+        (subscription_id,)
+    )
+    row = await cursor.fetchone()
+    return row[0] if row else None
 
+@_timed
 async def get_price_history(url: str) -> list[tuple[datetime.datetime, float]]:
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute(
-            "SELECT checked_at, price FROM price_history WHERE url = ? ORDER BY checked_at DESC",
-            (url,)
-        )
-        return await cursor.fetchall()
+    # Сначала записываем накопленные точки, чтобы график был актуальным
+    await _writer.flush()
+    db = await _get_db()
+    # Свежие точки и последние цены из часовых и дневных корзин
+    cursor = await db.execute(
+        """
+        WITH product AS (SELECT id FROM products WHERE url = :url)
+        SELECT checked_at, price FROM price_history WHERE product_id = (SELECT id FROM product)
+        UNION ALL
+        SELECT last_at, last_price FROM price_history_hourly WHERE product_id = (SELECT id FROM product)
+        UNION ALL
+        SELECT last_at, last_price FROM price_history_daily WHERE product_id = (SELECT id FROM product)
+        ORDER BY 1 DESC
+        """,
+        {"url": url}
+    )
+    return await cursor.fetchall()
@@ -0,0 +1,57 @@
+import asyncio
+
+from parser import governor as governor_module
+from parser.governor import HALF_OPEN, MarketplaceGovernor
+
+
+def _open_governor(open_seconds: float = 60) -> MarketplaceGovernor:
+    governor = MarketplaceGovernor("wb", 0, 1, 0, 0, 1, open_seconds, open_seconds)
+    governor.record(False)
+    # Срок открытого состояния истек: следующий acquire станет пробой
+    governor._open_until = 0.0
+    return governor
+
+
+def test_cancelled_probe_is_abandoned():
+    async def scenario():
+        governor = _open_governor()
+        probe_started = asyncio.Event()
+
+        async def probe():
+            assert await governor.acquire()
+            probe_started.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                governor.abandon()
+                raise
+
+        task = asyncio.create_task(probe())
+        await probe_started.wait()
+        # Другая задача не снимает чужую пробу
+        governor.abandon()
+        rejected_while_probing = await governor.acquire()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return governor, rejected_while_probing, await governor.acquire()
+
+    governor, rejected_while_probing, admitted_after_cancel = asyncio.run(scenario())
+    assert governor._state == HALF_OPEN
+    assert not rejected_while_probing
+    assert admitted_after_cancel
+
+
+def test_stale_probe_times_out(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(governor_module.time, "monotonic", lambda: now[0])
+
+    async def scenario():
+        governor = _open_governor(open_seconds=60)
+        results = [await governor.acquire()]
+        now[0] += 30
+        results.append(await governor.acquire())
+        now[0] += 31
+        results.append(await governor.acquire())
+        return results
+
+    assert asyncio.run(scenario()) == [True, False, True]
@@ -0,0 +1,23 @@
+from scheduler.tasks import notify_reason
+from storage.notify_state import NotifyState
+
+
+def _notified(prices: list[float], target_price: float) -> list[float]:
+    """Повторяет шаги process_user_items для одной подписки; возвращает цены с уведомлением."""
+    state = NotifyState()
+    notified = []
+    for price in prices:
+        reason = notify_reason(price, target_price, state.get(1, "url"))
+        state.record_seen(1, "url", price, target_price)
+        if reason is not None:
+            state.record_notified(1, "url", price)
+            notified.append(price)
+    return notified
+
+
+def test_target_crossed_again_notifies():
+    assert _notified([1200, 900, 1200, 900], 1000) == [900, 900]
+
+
+def test_target_not_repeated_while_below():
+    assert _notified([900, 900, 950, 800], 1000) == [900, 800]
@@ -0,0 +1,121 @@
+import asyncio
+import json
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from scheduler import executor as executor_module
+from scheduler import redis_queue
+from scheduler.executor import PRIORITY_BULK, ScrapeExecutor
+
+URL = "https://www.wildberries.ru/catalog/123/detail.aspx"
+
+
+async def _fake_get_price(url: str):
+    await asyncio.sleep(0.01)
+    return 100.0, f"Товар {url}", None
+
+
+def _clients(count: int) -> list[FakeRedis]:
+    # Общий сервер: бот и воркер видят одни и те же списки
+    server = FakeServer()
+    return [FakeRedis(server=server) for _ in range(count)]
+
+
+async def _run_worker(client: FakeRedis, executor: ScrapeExecutor, concurrency: int = 2):
+    worker = redis_queue.ScrapeWorker(client, executor, concurrency)
+    return worker, asyncio.create_task(worker.run())
+
+
+async def _stop_worker(worker, task, executor: ScrapeExecutor):
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await worker.stop()
+    await executor.stop()
+
+
+def test_job_round_trip(monkeypatch):
+    monkeypatch.setattr(executor_module, "get_price", _fake_get_price)
+
+    async def scenario():
+        bot_client, worker_client = _clients(2)
+        queue = redis_queue.RedisScrapeQueue(bot_client, job_timeout=5)
+        queue.start()
+        executor = ScrapeExecutor(2, {"wb": 2})
+        executor.start()
+        worker, task = await _run_worker(worker_client, executor)
+        try:
+            return await queue.submit(URL), worker.processed
+        finally:
+            await _stop_worker(worker, task, executor)
+            await queue.stop()
+
+    result, processed = asyncio.run(scenario())
+    assert result == (100.0, f"Товар {URL}", None)
+    assert processed == 1
+
+
+def test_reply_timeout_returns_empty_result():
+    async def scenario():
+        (client,) = _clients(1)
+        queue = redis_queue.RedisScrapeQueue(client, job_timeout=0.2)
+        queue.start()
+        try:
+            # Воркеров нет: задание остается в очереди без ответа
+            result = await queue.submit(URL)
+            return result, dict(queue._pending), await client.llen(redis_queue.JOB_QUEUES[PRIORITY_BULK])
+        finally:
+            await queue.stop()
+
+    result, pending, queued = asyncio.run(scenario())
+    assert result == (None, None, None)
+    assert pending == {}
+    assert queued == 1
+
+
+def test_malformed_reply_is_skipped(monkeypatch):
+    monkeypatch.setattr(executor_module, "get_price", _fake_get_price)
+
+    async def scenario():
+        bot_client, worker_client = _clients(2)
+        queue = redis_queue.RedisScrapeQueue(bot_client, job_timeout=5)
+        await bot_client.lpush(queue._reply_to, b"not json", b'{"no_id": 1}', b"[1, 2]", b'{"id": "unknown"}')
+        queue.start()
+        executor = ScrapeExecutor(2, {"wb": 2})
+        executor.start()
+        worker, task = await _run_worker(worker_client, executor)
+        try:
+            return await queue.submit(URL)
+        finally:
+            await _stop_worker(worker, task, executor)
+            await queue.stop()
+
+    assert asyncio.run(scenario()) == (100.0, f"Товар {URL}", None)
+
+
+def test_job_requeued_when_worker_cancelled(monkeypatch):
+    started = asyncio.Event()
+
+    async def hanging_get_price(url: str):
+        started.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(executor_module, "get_price", hanging_get_price)
+
+    async def scenario():
+        (client,) = _clients(1)
+        job = json.dumps({"id": "job-1", "url": URL, "priority": PRIORITY_BULK, "reply_to": "replies", "deadline": 1e12})
+        job_queue = redis_queue.JOB_QUEUES[PRIORITY_BULK]
+        await client.lpush(job_queue, job)
+        executor = ScrapeExecutor(2, {"wb": 2})
+        executor.start()
+        # Один слот: при остановке run ждет слот, а не висит в BRPOP — отмененный
+        # BRPOP в fakeredis, в отличие от Redis, забирает следующий элемент списка
+        worker, task = await _run_worker(client, executor, concurrency=1)
+        await asyncio.wait_for(started.wait(), timeout=5)
+        await _stop_worker(worker, task, executor)
+        return await client.lrange(job_queue, 0, -1), worker.processed
+
+    queued, processed = asyncio.run(scenario())
+    assert [json.loads(item)["id"] for item in queued] == ["job-1"]
+    assert processed == 0
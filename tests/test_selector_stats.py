@@ -0,0 +1,39 @@
+import time
+
+from parser.selector_stats import SelectorStats
+
+
+def _stats() -> SelectorStats:
+    return SelectorStats(cold_hours=1, dead_days=7, full_check_every=1000, save_interval=3600)
+
+
+def test_warm_selectors_follow_recent_wins():
+    stats = _stats()
+    selectors = ["a", "b", "c"]
+    assert stats.plan("ozon", selectors)[0] == ["a", "b", "c"]
+    for _ in range(3):
+        stats.record("ozon", ["c"], "c")
+    stats.record("ozon", ["b"], "b")
+    assert stats.plan("ozon", selectors)[0] == ["c", "b", "a"]
+
+
+def test_old_wins_decay_below_recent_ones():
+    stats = _stats()
+    now = time.time()
+    stats._entries["wb"] = {
+        # Много побед, но давно: за 50 минут счет затух примерно до 28
+        "a": {"hits": 50, "wins": 50, "last_hit": now - 3000, "first_seen": now - 86400},
+        "b": {"hits": 30, "wins": 30, "score": 30, "scored_at": now, "last_hit": now, "first_seen": now - 86400},
+    }
+    assert stats.plan("wb", ["a", "b"])[0] == ["b", "a"]
+
+
+def test_cold_selectors_keep_source_order_after_warm():
+    stats = _stats()
+    now = time.time()
+    stats._entries["ozon"] = {
+        "a": {"hits": 90, "wins": 90, "last_hit": now - 7200, "first_seen": now - 86400},
+        "b": {"hits": 1, "wins": 0, "last_hit": now - 7200, "first_seen": now - 86400},
+        "c": {"hits": 1, "wins": 1, "last_hit": now, "first_seen": now - 86400},
+    }
+    assert stats.plan("ozon", ["a", "b", "c"])[0] == ["c", "a", "b"]
@@ -0,0 +1,107 @@
+import asyncio
+import sqlite3
+
+from parser import url_canon
+from storage import sqlite_client
+
+OZON = "https://www.ozon.ru/product/123456789/"
+WB = "https://www.wildberries.ru/catalog/98765/detail.aspx"
+SHORT_LINK = "https://ozon.ru/t/AbC123"
+
+
+def _create_legacy_db(path: str):
+    """База первой версии бота: таблицы товаров по маркетплейсам и история цен по URL."""
+    db = sqlite3.connect(path)
+    for table in ("ozon_items", "wb_items"):
+        db.execute(f"""
+            CREATE TABLE {table} (
+                user_id INTEGER, url TEXT, target_price REAL, product_name TEXT, added_at TIMESTAMP,
+                PRIMARY KEY (user_id, url)
+            )
+        """)
+    db.execute("CREATE TABLE user_settings (user_id INTEGER PRIMARY KEY, check_interval INTEGER, last_check TIMESTAMP)")
+    db.execute("CREATE TABLE price_history (url TEXT, price REAL, checked_at TIMESTAMP)")
+    db.executemany("INSERT INTO ozon_items VALUES (?, ?, ?, ?, ?)", [
+        (1, "https://www.ozon.ru/product/kofe-v-zernah-123456789/?sh=abc", 900, "Кофе", "2024-01-01 10:00:00"),
+        (2, "https://m.ozon.ru/product/123456789/", None, None, "2024-01-02 10:00:00"),
+        (3, SHORT_LINK, 800, None, "2024-01-03 10:00:00"),
+    ])
+    db.execute("INSERT INTO wb_items VALUES (1, ?, NULL, 'Чай', '2024-01-01 10:00:00')", (WB + "?size=1",))
+    db.executemany("INSERT INTO price_history VALUES (?, ?, ?)", [
+        ("https://www.ozon.ru/product/kofe-v-zernah-123456789/?sh=abc", 1000, "2024-01-01 10:00:00"),
+        ("https://m.ozon.ru/product/123456789/", 950, "2024-01-02 10:00:00"),
+        (SHORT_LINK, 940, "2024-01-03 10:00:00"),
+        (WB + "?size=1", 300, "2024-01-01 10:00:00"),
+    ])
+    db.commit()
+    db.close()
+
+
+def _products(path: str) -> dict[str, tuple]:
+    db = sqlite3.connect(path)
+    rows = db.execute("SELECT url, id, marketplace, sku, name FROM products").fetchall()
+    db.close()
+    return {url: tuple(rest) for url, *rest in rows}
+
+
+def _subscriptions(path: str, url: str) -> dict[int, float]:
+    db = sqlite3.connect(path)
+    rows = db.execute(
+        "SELECT user_id, target_price FROM subscriptions JOIN products ON products.id = product_id WHERE url = ?", (url,)
+    ).fetchall()
+    db.close()
+    return dict(rows)
+
+
+def _history_count(path: str, url: str) -> int:
+    db = sqlite3.connect(path)
+    count = db.execute(
+        "SELECT COUNT(*) FROM price_history JOIN products ON products.id = product_id WHERE url = ?", (url,)
+    ).fetchone()[0]
+    db.close()
+    return count
+
+
+def test_legacy_db_migration(tmp_path, monkeypatch):
+    path = str(tmp_path / "legacy.db")
+    _create_legacy_db(path)
+    monkeypatch.setattr(sqlite_client, "DB_FILE", path)
+
+    async def resolve_redirect(url):
+        assert url == SHORT_LINK
+        return "https://www.ozon.ru/product/kofe-v-zernah-123456789/?from=share"
+
+    monkeypatch.setattr(url_canon, "resolve_redirect", resolve_redirect)
+
+    async def migrate():
+        try:
+            await sqlite_client.initialize_db()
+            # Второй запуск ничего не меняет
+            await sqlite_client.initialize_db()
+            before = _products(path)
+            rekeyed = await sqlite_client.rekey_short_links()
+            return before, rekeyed
+        finally:
+            await sqlite_client.close_db()
+
+    before, rekeyed = asyncio.run(migrate())
+
+    # Варианты одной ссылки Ozon объединены, короткая ссылка ждет раскрытия
+    assert set(before) == {OZON, WB, SHORT_LINK}
+    assert before[OZON][1:] == ("ozon", "123456789", "Кофе")
+    assert before[WB][1:] == ("wb", "98765", "Чай")
+    assert before[SHORT_LINK][2] is None
+
+    # После раскрытия короткой ссылки остаются только канонические URL
+    assert rekeyed == 1
+    products = _products(path)
+    assert set(products) == {OZON, WB}
+    assert _subscriptions(path, OZON) == {1: 900, 2: None, 3: 800}
+    assert _subscriptions(path, WB) == {1: None}
+    assert _history_count(path, OZON) == 3
+    assert _history_count(path, WB) == 1
+
+    db = sqlite3.connect(path)
+    tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    db.close()
+    assert not tables & {"ozon_items", "wb_items", "price_history_legacy"}
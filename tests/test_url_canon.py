@@ -0,0 +1,51 @@
+import pytest
+
+from parser.url_canon import canonicalize_url, is_short_link
+
+OZON = "https://www.ozon.ru/product/123456789/"
+WB = "https://www.wildberries.ru/catalog/98765/detail.aspx"
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://www.ozon.ru/product/kofe-v-zernah-1-kg-123456789/", OZON),
+        ("https://www.ozon.ru/product/123456789", OZON),
+        ("https://ozon.ru/product/kofe-123456789/?sh=abc&from=share", OZON),
+        ("https://m.ozon.ru/product/kofe-123456789/reviews/", OZON),
+        ("https://WWW.OZON.RU/product/123456789/?utm_source=tg", OZON),
+        ("https://www.wildberries.ru/catalog/98765/detail.aspx?targetUrl=GP&size=1", WB),
+        ("https://wildberries.ru/catalog/98765/detail.aspx", WB),
+        ("https://m.wildberries.ru/catalog/98765/", WB),
+    ],
+)
+def test_canonical_url(url, expected):
+    key = canonicalize_url(url)
+    assert key is not None and key.url == expected
+    assert key.sku in expected
+
+
+def test_marketplace():
+    assert canonicalize_url(OZON).marketplace == "ozon"
+    assert canonicalize_url(WB).marketplace == "wb"
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://ozon.ru/t/AbC123",
+        "https://www.ozon.ru/category/kofe-123/",
+        "https://www.wildberries.ru/brands/some-brand",
+        "https://example.com/product/123456789/",
+        "not a url",
+    ],
+)
+def test_not_canonical(url):
+    assert canonicalize_url(url) is None
+
+
+def test_short_link():
+    assert is_short_link("https://ozon.ru/t/AbC123")
+    assert is_short_link("https://www.ozon.ru/t/AbC123/")
+    assert not is_short_link(OZON)
+    assert not is_short_link("https://www.wildberries.ru/t/AbC123")
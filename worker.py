@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from config import settings
+from monitoring.server import start_metrics_server, stop_metrics_server
+from parser.http_fetch import close_http_session
+from parser.price_parser import shutdown_browser, warm_up_browser
+from parser.selector_stats import selector_stats
+from scheduler.executor import start_executor, stop_executor
+from scheduler.redis_queue import ScrapeWorker, create_redis
+
+
+async def main():
+    """
+    Воркер проверки цен: забирает задания из очереди в Redis и возвращает результаты боту
+    (SCRAPE_BACKEND=redis). Воркеров можно запускать сколько угодно на разных машинах.
+    """
+    loop = asyncio.get_running_loop()
+    # Потоков хватает на все экземпляры Chrome и служебные задачи (HTTP-проверкам потоки не нужны)
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=sum(settings.DRIVER_POOL_SIZES.values()) + 4))
+
+    # Настройка логирования
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    selector_stats.load(settings.SELECTOR_STATS_FILE)
+
+    browser_task = None
+    if settings.SELENIUM_FALLBACK:
+        browser_task = asyncio.create_task(warm_up_browser())
+
+    # Проверки выполняются локально с теми же ограничениями, что и в боте
+    executor = start_executor("local")
+    client = create_redis()
+    worker = ScrapeWorker(client, executor, settings.SCRAPE_CONCURRENCY)
+
+    if settings.WORKER_METRICS_PORT:
+        try:
+            await start_metrics_server(settings.METRICS_HOST, settings.WORKER_METRICS_PORT)
+        except OSError as e:
+            logging.error(f"Не удалось запустить сервер метрик: {e}")
+
+    # Останавливаемся по SIGTERM/SIGINT, возвращая невыполненные задания в очередь
+    worker_task = asyncio.create_task(worker.run())
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker_task.cancel)
+
+    logging.info(f"Воркер запущен: Redis {settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.REDIS_DB}")
+    try:
+        await worker_task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        logging.info(f"Остановка воркера, выполнено заданий: {worker.processed}")
+        await worker.stop()
+        await stop_executor()
+        await close_http_session()
+        await stop_metrics_server()
+        await client.aclose()
+
+        if browser_task:
+            await browser_task
+        await loop.run_in_executor(None, shutdown_browser)
+
+        selector_stats.save()
+        logging.info("Воркер остановлен.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())